@@ -0,0 +1,190 @@
+"""
+Template Attachment Payloads
+Fake-attachment templates send the same files to every recipient. Each
+TemplateAttachment is read and base64-encoded once, kept in a bounded
+process-wide LRU keyed by (sha256, size), and the same encoded object is
+attached to every message of a run: the SMTP skeleton splices its
+pre-encoded MIME part, Django mail attaches its MIMEBase, and SendGrid
+messages share one Attachment helper.
+"""
+import base64
+import hashlib
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+from email.mime.base import MIMEBase
+from django.conf import settings
+from sendgrid.helpers.mail import Attachment, Disposition, FileContent, FileName, FileType
+from .mime_skeleton import HEADER_POLICY
+
+logger = logging.getLogger(__name__)
+
+
+def get_attachment_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+def guess_content_type(filename, file_type=''):
+    content_type = mimetypes.guess_type(filename)[0]
+    if content_type:
+        return content_type
+    return file_type if '/' in (file_type or '') else 'application/octet-stream'
+
+
+class AttachmentPayload:
+    """
+    One attachment, base64-encoded once
+
+    The provider-specific forms are derived from the same encoded string on
+    first use and then shared; instances are read-only once built, so send
+    engine threads can use one concurrently.
+    """
+
+    def __init__(self, digest, filename, content_type, data=None, size=None, encoded=None):
+        self.digest = digest
+        self.size = len(data) if data is not None else size
+        self.filename = filename
+        self.content_type = content_type
+        self.encoded = encoded if encoded is not None else base64.b64encode(data).decode('ascii')
+        self._mime_part = None
+        self._wire_part = None
+        self._sendgrid_attachment = None
+
+    @property
+    def key(self):
+        return (self.digest, self.size)
+
+    def renamed(self, filename, content_type):
+        """Same encoded content (not copied) under another file name"""
+        if (filename, content_type) == (self.filename, self.content_type):
+            return self
+        return AttachmentPayload(self.digest, filename, content_type, size=self.size, encoded=self.encoded)
+
+    @property
+    def mime_part(self):
+        """MIMEBase with the encoded payload, for Django's EmailMessage.attach()"""
+        if self._mime_part is None:
+            maintype, _, subtype = self.content_type.partition('/')
+            part = MIMEBase(maintype, subtype or 'octet-stream', name=self.filename)
+            part['Content-Transfer-Encoding'] = 'base64'
+            part.add_header('Content-Disposition', 'attachment', filename=self.filename)
+            part.set_payload('\n'.join(self.encoded[i:i + 76] for i in range(0, len(self.encoded), 76)) + '\n')
+            self._mime_part = part
+        return self._mime_part
+
+    @property
+    def wire_part(self):
+        """The MIME part as SMTP wire bytes (headers, blank line, body), for MessageSkeleton"""
+        if self._wire_part is None:
+            self._wire_part = self.mime_part.as_bytes(policy=HEADER_POLICY)
+        return self._wire_part
+
+    @property
+    def sendgrid_attachment(self):
+        if self._sendgrid_attachment is None:
+            self._sendgrid_attachment = Attachment(
+                FileContent(self.encoded), FileName(self.filename),
+                FileType(self.content_type), Disposition('attachment')
+            )
+        return self._sendgrid_attachment
+
+
+class AttachmentCache:
+    """
+    Bounded LRU of encoded payloads keyed by (sha256, size)
+
+    Limited both by entry count and by total encoded bytes; a payload larger
+    than the whole budget is used for its run but not kept.
+    """
+
+    def __init__(self, max_bytes=None, max_entries=None):
+        self._max_bytes = max_bytes
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes or get_attachment_setting('ATTACHMENT_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+    @property
+    def max_entries(self):
+        return self._max_entries or get_attachment_setting('ATTACHMENT_CACHE_MAX_ENTRIES', 64)
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+            return payload
+
+    def put(self, payload):
+        cost = len(payload.encoded)
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(payload.key, None)
+            if previous is not None:
+                self._bytes -= len(previous.encoded)
+            self._entries[payload.key] = payload
+            self._bytes += cost
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.encoded)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Process-wide cache shared by every send run
+attachment_cache = AttachmentCache()
+
+
+def read_attachment(attachment):
+    attachment.file.open('rb')
+    try:
+        return attachment.file.read()
+    finally:
+        attachment.file.close()
+
+
+def load_template_attachments(template_id):
+    """
+    Encoded payloads for a template's attachments, in upload order
+    Empty unless the template has has_attachments set. Files are only read
+    on a cache miss; the first read also records the file's sha256.
+    """
+    from templates.models import TemplateAttachment
+
+    if not template_id:
+        return []
+
+    payloads = []
+    rows = TemplateAttachment.objects.filter(template_id=template_id, template__has_attachments=True).order_by('id')
+    for attachment in rows:
+        content_type = guess_content_type(attachment.filename, attachment.file_type)
+        payload = attachment_cache.get((attachment.sha256, attachment.file_size)) if attachment.sha256 else None
+        if payload is None:
+            try:
+                data = read_attachment(attachment)
+            except (OSError, ValueError) as e:
+                logger.error(f"Attachment {attachment.filename} of template #{template_id} unreadable: {e}")
+                continue
+
+            digest = hashlib.sha256(data).hexdigest()
+            if (attachment.sha256, attachment.file_size) != (digest, len(data)):
+                TemplateAttachment.objects.filter(id=attachment.id).update(sha256=digest, file_size=len(data))
+
+            payload = attachment_cache.get((digest, len(data)))
+            if payload is None:
+                payload = AttachmentPayload(digest, attachment.filename, content_type, data)
+                attachment_cache.put(payload)
+        payloads.append(payload.renamed(attachment.filename, content_type))
+    return payloads
@@ -3,33 +3,280 @@ Campaign Launch Service
 Handles complete campaign execution with custom domains
 """
 import json
-from django.http import JsonResponse
+import logging
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from .domain_models import EmailDomain
 from .custom_domain_email_service import CustomDomainEmailService
+from .send_queue import (
+    JobProgress, build_launch_summary, enqueue_launch, finish_job, start_inline_launch
+)
+from .rate_limiter import rate_limiter
+from .sendgrid_client import get_sendgrid_client
+from .send_engine import AsyncSendEngine, SendTask
+from .send_context import SendContext
+from .attachments import load_template_attachments
+from .suppression import split_suppressed
+
+logger = logging.getLogger(__name__)
+
+
+def build_launch_content(payload):
+    """
+    Resolve subject and HTML body for a launch, falling back to the default simulation notice
+    The template's usage count is bumped when the launch's SendContext is flushed
+    """
+    campaign_name = payload.get('name')
+    sender_email = payload.get('sender_email')
+    template_id = payload.get('template_id')
+    
+    email_subject = f"Security Awareness Test - {campaign_name}"
+    email_html = f"""
+        <html>
+        <body>
+            <h2>Security Awareness Test</h2>
+            <p>This is a simulated phishing email for security awareness training.</p>
+            <p><strong>Campaign:</strong> {campaign_name}</p>
+            <p><strong>From:</strong> {sender_email}</p>
+            <br>
+            <div style="background: #f0f0f0; padding: 15px; border-radius: 5px;">
+                <p><strong>⚠️ This is a simulation!</strong></p>
+                <p>If this were a real phishing attack, you would have been compromised.</p>
+                <p>Learn more about cybersecurity awareness.</p>
+            </div>
+        </body>
+        </html>
+        """
+    
+    # If template_id is provided, use template content
+    if template_id:
+        try:
+            from templates.models import Template
+            template = Template.objects.get(id=template_id)
+            email_subject = template.email_subject or email_subject
+            
+            # Use template's HTML content if available
+            if template.html_content:
+                email_html = template.html_content
+                
+                # Add CSS styles if available
+                if template.css_styles:
+                    email_html = f"""
+                        <html>
+                        <head>
+                            <style>
+                                {template.css_styles}
+                            </style>
+                        </head>
+                        <body>
+                            {template.html_content}
+                        </body>
+                        </html>
+                        """
+            
+        except Template.DoesNotExist:
+            # If template not found, use default content but don't fail
+            pass
+        except Exception as e:
+            # Log error but continue with default template
+            logger.error(f"Error loading template {template_id}: {e}")
+    
+    return email_subject, email_html
+
+
+def iter_launch_results(payload):
+    """
+    Send a launch to every target, yielding one result dict per recipient in completion order
+    Suppressed addresses are skipped without a result
+    """
+    target_emails, _ = split_suppressed(payload.get('target_emails', []))
+    sender_email = payload.get('sender_email')
+    domain_id = payload.get('domain_id')
+    use_custom_domain = payload.get('use_custom_domain', False)
+    
+    email_subject, email_html = build_launch_content(payload)
+    
+    # Use verified sender email from hopesecure.tech domain
+    verified_sender_email = "hope@hopesecure.tech"  # This is verified in SendGrid
+    
+    # Domain, tracking flags and sender are resolved once; both paths share the process-wide SendGrid client
+    if use_custom_domain:
+        email_service = CustomDomainEmailService()
+        send_context = SendContext.resolve(
+            sender_email, email_subject, email_html, domain_id=domain_id, template_id=payload.get('template_id')
+        )
+    else:
+        sg = get_sendgrid_client()
+        send_context = SendContext(
+            verified_sender_email, email_subject, email_html, template_id=payload.get('template_id'),
+            attachments=load_template_attachments(payload.get('template_id'))
+        )
+    
+    def send_one(target_email):
+        if use_custom_domain:
+            # Use custom domain email service
+            return email_service.send_phishing_email(
+                sender_email=sender_email,
+                recipient_email=target_email,
+                subject=email_subject,
+                html_content=email_html,
+                send_context=send_context,
+                raise_errors=True
+            )
+        
+        # Use SendGrid directly for regular campaigns
+        message = send_context.build_message(target_email)
+        
+        # Errors propagate so the engine can retry throttled / transient failures
+        rate_limiter.require(send_context.sender_domain)
+        response = sg.send(message)
+        send_context.record_sent()
+        return {
+            'success': True,
+            'status_code': response.status_code,
+            'message': 'Email sent successfully via SendGrid',
+            'sender_email': verified_sender_email,  # Update to show actual sender
+            'recipient': target_email
+        }
+    
+    tasks = (
+        SendTask(
+            target_email, partial(send_one, target_email), domain=send_context.sender_domain, provider='sendgrid', tokens=1
+        )
+        for target_email in target_emails
+    )
+    
+    # Sends run concurrently; results are yielded as each one completes
+    # 'error' (the final exception, if any) is for dead-lettering, not for the response
+    try:
+        for task, result, error in AsyncSendEngine().iter_results(tasks):
+            if error:
+                yield {
+                    'recipient': task.key,
+                    'success': False,
+                    'message': f'SendGrid error: {str(error)}',
+                    'attempts': task.attempts,
+                    'error': error
+                }
+                continue
+            
+            yield {
+                'recipient': task.key,
+                'success': result['success'],
+                'message': result.get('message', 'Unknown status'),
+                'details': result.get('status_code', 'N/A'),
+                'attempts': task.attempts
+            }
+    finally:
+        # Domain and template statistics are written once per launch
+        send_context.flush()
+
+
+def wants_stream(request):
+    """Streaming launch requested via ?stream=ndjson or an application/x-ndjson Accept header"""
+    return (
+        request.GET.get('stream') == 'ndjson'
+        or 'application/x-ndjson' in request.headers.get('Accept', '')
+    )
+
+
+def iter_launch_events(job):
+    """
+    Send an inline launch job, yielding a start event, one result event per
+    recipient (with running counters) and a final summary.
+    Only the counters are kept in memory.
+    """
+    progress = JobProgress(job)
+    total = job.total_count
+    yield {'event': 'start', 'job_id': job.id, 'total_targets': total}
+    
+    try:
+        for result in iter_launch_results(job.payload):
+            error = result.pop('error', None)
+            progress.record(result['recipient'], result['success'], error, result.get('attempts', 1))
+            yield dict(
+                result,
+                event='result',
+                sent=progress.sent,
+                failed=progress.failed,
+                processed=progress.sent + progress.failed,
+                total=total
+            )
+    except GeneratorExit:
+        # Client went away: in-flight sends finish, nothing new is started
+        finish_job(job, progress, result=build_launch_summary(job, progress), error='Client disconnected before the launch finished')
+        raise
+    except Exception as e:
+        finish_job(job, progress, result=build_launch_summary(job, progress), error=str(e))
+        yield {'event': 'error', 'error': f'Campaign launch failed: {str(e)}'}
+        return
+    
+    summary = build_launch_summary(job, progress)
+    finish_job(job, progress, result=summary)
+    yield dict(summary, event='summary', success=True)
+
+
+async def aiter_events(events):
+    """
+    Async view of a sync event generator for ASGI servers, which would
+    otherwise read a sync stream to the end before sending any of it.
+    Each step runs on the request's sync thread, and the generator is closed
+    there when the client goes away, so its GeneratorExit cleanup still runs.
+    """
+    next_event = sync_to_async(next)
+    try:
+        while True:
+            event = await next_event(events, None)
+            if event is None:
+                return
+            yield event
+    finally:
+        await sync_to_async(events.close)()
+
+
+async def aiter_lines(events):
+    async for event in aiter_events(events):
+        yield json.dumps(event) + '\n'
+
+
+def stream_launch(job, asynchronous=False):
+    """NDJSON response streaming iter_launch_events; asynchronous for requests served over ASGI"""
+    events = iter_launch_events(job)
+    response = StreamingHttpResponse(
+        aiter_lines(events) if asynchronous else (json.dumps(event) + '\n' for event in events),
+        content_type='application/x-ndjson'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx hold lines back
+    return response
+
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def launch_campaign(request):
     """
     Launch a complete phishing campaign with custom domain
+    Emails are sent by the background send worker; responds 202 with the queued job id.
+    With ?stream=ndjson the emails are sent during the request instead and
+    progress is streamed back one JSON line per recipient.
     """
     try:
         data = json.loads(request.body)
         
-        # Debug logging
-        print(f"🔍 Campaign Launch Debug:")
-        print(f"   Received data: {data}")
-        print(f"   Sender email: {data.get('sender_email')}")
-        print(f"   Target emails: {data.get('target_emails')}")
+        logger.debug(
+            f"Campaign launch requested: sender {data.get('sender_email')}, "
+            f"{len(data.get('target_emails') or [])} targets"
+        )
         
         # Extract campaign data
         campaign_name = data.get('name')
         target_emails = data.get('target_emails', [])
         sender_email = data.get('sender_email')
         domain_id = data.get('domain_id')
-        template_id = data.get('template_id')
         use_custom_domain = data.get('use_custom_domain', False)
         
         # Validation
@@ -39,22 +286,20 @@ def launch_campaign(request):
                 'error': 'Missing required fields: name, target_emails, sender_email'
             }, status=400)
         
-        # Initialize results
-        campaign_results = {
-            'campaign_name': campaign_name,
-            'sender_email': sender_email,
-            'total_targets': len(target_emails),
-            'successful_sends': 0,
-            'failed_sends': 0,
-            'email_results': [],
-            'domain_info': None
-        }
+        # Suppressed addresses never get a job entry
+        target_emails, suppressed = split_suppressed(target_emails)
+        if not target_emails:
+            return JsonResponse({
+                'success': False,
+                'error': 'Every target email is on the suppression list'
+            }, status=400)
         
         # Get domain info if using custom domain
+        domain_info = None
         if use_custom_domain and domain_id:
             try:
                 domain = EmailDomain.objects.get(id=domain_id)
-                campaign_results['domain_info'] = {
+                domain_info = {
                     'name': domain.name,
                     'type': domain.domain_type,
                     'status': domain.status
@@ -65,151 +310,34 @@ def launch_campaign(request):
                     'error': f'Domain with ID {domain_id} not found'
                 }, status=404)
         
-        # Get template content if template_id is provided
-        template_id = data.get('template_id')
-        email_subject = f"Security Awareness Test - {campaign_name}"
-        email_html = f"""
-        <html>
-        <body>
-            <h2>Security Awareness Test</h2>
-            <p>This is a simulated phishing email for security awareness training.</p>
-            <p><strong>Campaign:</strong> {campaign_name}</p>
-            <p><strong>From:</strong> {sender_email}</p>
-            <br>
-            <div style="background: #f0f0f0; padding: 15px; border-radius: 5px;">
-                <p><strong>⚠️ This is a simulation!</strong></p>
-                <p>If this were a real phishing attack, you would have been compromised.</p>
-                <p>Learn more about cybersecurity awareness.</p>
-            </div>
-        </body>
-        </html>
-        """
-        
-        # If template_id is provided, use template content
-        if template_id:
-            try:
-                from templates.models import Template
-                template = Template.objects.get(id=template_id)
-                email_subject = template.email_subject or email_subject
-                
-                # Use template's HTML content if available
-                if template.html_content:
-                    email_html = template.html_content
-                    
-                    # Add CSS styles if available
-                    if template.css_styles:
-                        email_html = f"""
-                        <html>
-                        <head>
-                            <style>
-                                {template.css_styles}
-                            </style>
-                        </head>
-                        <body>
-                            {template.html_content}
-                        </body>
-                        </html>
-                        """
-                
-                # Update template usage count
-                template.usage_count += 1
-                template.save()
-                
-            except Template.DoesNotExist:
-                # If template not found, use default content but don't fail
-                pass
-            except Exception as e:
-                # Log error but continue with default template
-                print(f"Error loading template {template_id}: {e}")
-        
-        
-        # Initialize email service
-        if use_custom_domain:
-            email_service = CustomDomainEmailService()
-        
-        # Send emails to each target
-        for target_email in target_emails:
-            try:
-                if use_custom_domain:
-                    # Use custom domain email service
-                    email_service = CustomDomainEmailService()
-                    result = email_service.send_phishing_email(
-                        sender_email=sender_email,
-                        recipient_email=target_email,
-                        subject=email_subject,
-                        html_content=email_html,
-                        domain_id=domain_id
-                    )
-                else:
-                    # Use SendGrid directly for regular campaigns
-                    import os
-                    from sendgrid import SendGridAPIClient
-                    from sendgrid.helpers.mail import Mail
-                    from django.conf import settings
-                    
-                    # Get API key from Django settings instead of environment
-                    api_key = settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY')
-                    sg = SendGridAPIClient(api_key=api_key)
-                    
-                    # Use verified sender email from hopesecure.tech domain
-                    verified_sender_email = "hope@hopesecure.tech"  # This is verified in SendGrid
-                    
-                    message = Mail(
-                        from_email=verified_sender_email,  # Use verified email
-                        to_emails=target_email,
-                        subject=email_subject,
-                        html_content=email_html
-                    )
-                    
-                    try:
-                        response = sg.send(message)
-                        result = {
-                            'success': True,
-                            'status_code': response.status_code,
-                            'message': 'Email sent successfully via SendGrid',
-                            'sender_email': verified_sender_email,  # Update to show actual sender
-                            'recipient': target_email
-                        }
-                    except Exception as sg_error:
-                        result = {
-                            'success': False,
-                            'message': f'SendGrid error: {str(sg_error)}',
-                            'sender_email': verified_sender_email,  # Update to show actual sender
-                            'recipient': target_email
-                        }
-                
-                if result['success']:
-                    campaign_results['successful_sends'] += 1
-                else:
-                    campaign_results['failed_sends'] += 1
-                
-                campaign_results['email_results'].append({
-                    'recipient': target_email,
-                    'success': result['success'],
-                    'message': result.get('message', 'Unknown status'),
-                    'details': result.get('status_code', 'N/A')
-                })
-                
-            except Exception as e:
-                campaign_results['failed_sends'] += 1
-                campaign_results['email_results'].append({
-                    'recipient': target_email,
-                    'success': False,
-                    'message': f'Exception: {str(e)}'
-                })
+        payload = {
+            'name': campaign_name,
+            'target_emails': target_emails,
+            'sender_email': sender_email,
+            'domain_id': domain_id,
+            'template_id': data.get('template_id'),
+            'use_custom_domain': use_custom_domain,
+        }
+        user = request.user if request.user.is_authenticated else None
         
-        # Calculate success rate
-        success_rate = 0
-        if campaign_results['total_targets'] > 0:
-            success_rate = (campaign_results['successful_sends'] / campaign_results['total_targets']) * 100
+        if wants_stream(request):
+            return stream_launch(start_inline_launch(payload, user=user), asynchronous=isinstance(request, ASGIRequest))
         
-        campaign_results['success_rate'] = round(success_rate, 2)
+        job = enqueue_launch(payload, user=user)
         
         return JsonResponse({
             'success': True,
-            'message': 'Campaign launched successfully',
-            'results': campaign_results
-        })
+            'message': 'Campaign queued for sending',
+            'job_id': job.id,
+            'status_url': f'/api/campaigns/send-jobs/{job.id}/',
+            'results': {
+                'campaign_name': campaign_name,
+                'sender_email': sender_email,
+                'total_targets': len(target_emails),
+                'suppressed_targets': len(suppressed),
+                'domain_info': domain_info
+            }
+        }, status=202)
         
     except json.JSONDecodeError:
         return JsonResponse({
@@ -2,11 +2,13 @@
 Custom Domain Email Service
 Handles email sending with custom domains using SendGrid
 """
-import os
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-from django.conf import settings
+from functools import partial
 from .domain_models import EmailDomain
+from .sendgrid_client import get_sendgrid_client
+from .rate_limiter import rate_limiter, sender_domain
+from .send_engine import AsyncSendEngine, SendTask
+from .suppression import split_suppressed
+from .send_context import SendContext
 
 class CustomDomainEmailService:
     """
@@ -14,41 +16,32 @@ class CustomDomainEmailService:
     """
     
     def __init__(self):
-        api_key = settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY')
-        self.sg = SendGridAPIClient(api_key=api_key)
+        self.sg = get_sendgrid_client()
     
-    def send_phishing_email(self, sender_email, recipient_email, subject, html_content, domain_id=None):
+    def send_phishing_email(self, sender_email, recipient_email, subject, html_content, domain_id=None, send_context=None,
+                            raise_errors=False):
         """
         Send phishing email using custom domain
+        Campaign runs pass a SendContext so the domain is resolved once and
+        its statistics are written when the run is flushed
+        With raise_errors, failures are raised (so they can be retried) instead of returning a failure dict
         """
+        owns_context = send_context is None
         try:
-            # Get domain info if provided
-            domain_info = None
-            if domain_id:
-                domain_info = EmailDomain.objects.get(id=domain_id)
+            if owns_context:
+                send_context = SendContext.resolve(sender_email, subject, html_content, domain_id=domain_id)
             
             # Create email message
-            message = Mail(
-                from_email=sender_email,
-                to_emails=recipient_email,
-                subject=subject,
-                html_content=html_content
-            )
+            message = send_context.build_message(recipient_email, html_content=html_content)
             
-            # Add tracking if domain supports it
-            if domain_info and domain_info.click_tracking_enabled:
-                message.tracking_settings = {
-                    "click_tracking": {"enable": True},
-                    "open_tracking": {"enable": domain_info.open_tracking_enabled}
-                }
+            # Wait for the sending domain's rate budget
+            rate_limiter.require(send_context.sender_domain)
             
             # Send email
             response = self.sg.send(message)
-            
-            # Update domain statistics
-            if domain_info:
-                domain_info.emails_sent += 1
-                domain_info.save()
+            send_context.record_sent()
+            if owns_context:
+                send_context.flush()
             
             return {
                 'success': True,
@@ -59,6 +52,8 @@ class CustomDomainEmailService:
             }
             
         except Exception as e:
+            if raise_errors:
+                raise
             return {
                 'success': False,
                 'error': str(e),
@@ -102,25 +97,49 @@ class CustomDomainEmailService:
         """
         Create and send campaign emails to multiple recipients
         """
-        results = []
         sender_email = campaign_data.get('sender_email')
         subject = campaign_data.get('subject', 'Important Security Notice')
         html_content = campaign_data.get('html_content', '<p>Security awareness test email</p>')
         domain_id = campaign_data.get('domain_id')
+        target_emails, suppressed = split_suppressed(target_emails)
+        send_context = SendContext.resolve(sender_email, subject, html_content, domain_id=domain_id)
         
-        for recipient in target_emails:
-            result = self.send_phishing_email(
-                sender_email=sender_email,
-                recipient_email=recipient,
-                subject=subject,
-                html_content=html_content,
-                domain_id=domain_id
+        tasks = (
+            SendTask(
+                index,
+                partial(
+                    self.send_phishing_email,
+                    sender_email=sender_email,
+                    recipient_email=recipient,
+                    subject=subject,
+                    html_content=html_content,
+                    send_context=send_context,
+                    raise_errors=True
+                ),
+                domain=sender_domain(sender_email),
+                provider='sendgrid',
+                tokens=1
             )
-            results.append(result)
+            for index, recipient in enumerate(target_emails)
+        )
+        
+        # Keep several SendGrid requests in flight; results are stored in recipient order
+        results = [None] * len(target_emails)
+        for task, result, error in AsyncSendEngine().iter_results(tasks):
+            if error:
+                result = {
+                    'success': False,
+                    'error': str(error),
+                    'sender_email': sender_email,
+                    'recipient': target_emails[task.key]
+                }
+            results[task.key] = result
+        send_context.flush()
         
         return {
             'total_emails': len(target_emails),
             'successful_sends': len([r for r in results if r['success']]),
             'failed_sends': len([r for r in results if not r['success']]),
+            'suppressed': len(suppressed),
             'results': results
         }
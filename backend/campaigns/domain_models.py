@@ -168,3 +168,24 @@ class DomainVerificationToken(models.Model):
     
     class Meta:
         db_table = 'domain_verification_tokens'
+
+
+class DomainSendBudget(models.Model):
+    """Shared token bucket state for a sending domain, used by every send worker"""
+    
+    domain_name = models.CharField(max_length=255, unique=True, help_text="Sending domain (part after @ in the From address)")
+    tokens = models.FloatField(default=0)
+    last_refill = models.DateTimeField()
+    
+    # Daily cap tracking
+    day = models.DateField()
+    day_count = models.IntegerField(default=0)
+    
+    # Optimistic concurrency: every update must match the version it read
+    version = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'domain_send_budgets'
+        
+    def __str__(self):
+        return f"{self.domain_name} ({self.tokens:.1f} tokens, {self.day_count} today)"
@@ -6,12 +6,15 @@ Email domain mimicking এবং spoofing এর জন্য service
 from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
 from django.template.loader import render_to_string
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.header import Header
-import smtplib
-import ssl
 from .email_config import EMAIL_CONFIGURATIONS, DOMAIN_SPOOFING_METHODS
+from .rate_limiter import rate_limiter, sender_domain
+from .smtp_pool import smtp_pool
+from .send_engine import AsyncSendEngine, SendTask
+from .personalization import MergeFieldLoader, compile_template, default_context
+from .mime_skeleton import MessageSkeleton
+from .sendgrid_events import new_message_id, smtpapi_header
+from .tracking import recipient_tracking_context
+from functools import partial
 import logging
 
 logger = logging.getLogger(__name__)
@@ -93,6 +96,29 @@ class PhishingEmailService:
         
         return headers, spoofed_email
     
+    def build_message_skeleton(self,
+                               subject,
+                               html_content,
+                               sender_name="IT Security Team",
+                               sender_email="security@company.com",
+                               target_domain="company.com",
+                               use_spoofing=True,
+                               attachments=None):
+        """
+        Campaign এর সব email এর জন্য একবার MessageSkeleton তৈরি করা
+        Headers আর template একবারই encode/compile হয়; প্রতি send এ শুধু To আর body বসে
+        Attachments আগে থেকেই encoded (attachments.AttachmentPayload), skeleton এ একবার জোড়া হয়
+        """
+        if use_spoofing:
+            # Create spoofed headers
+            headers, _ = self.create_spoofed_email_headers(sender_name, sender_email, target_domain)
+            from_email = headers['From']
+        else:
+            from_email = f"{sender_name} <{sender_email}>"
+            headers = {}
+        
+        return MessageSkeleton(subject, from_email, html_content, extra_headers=headers, attachments=attachments)
+    
     def send_phishing_email(self, 
                           recipient_email, 
                           subject, 
@@ -100,88 +126,113 @@ class PhishingEmailService:
                           sender_name="IT Security Team",
                           sender_email="security@company.com",
                           target_domain="company.com",
-                          use_spoofing=True):
+                          use_spoofing=True,
+                          raise_errors=False):
         """
         Phishing email পাঠানো
+        raise_errors হলে failure False না দিয়ে raise হয় (retry classification এর জন্য)
+        """
+        try:
+            skeleton = self.build_message_skeleton(
+                subject, html_content, sender_name, sender_email, target_domain, use_spoofing
+            )
+        except Exception as e:
+            logger.error(f"Failed to build phishing email: {str(e)}")
+            if raise_errors:
+                raise
+            return False
+        
+        return self.send_from_skeleton(skeleton, recipient_email, raise_errors=raise_errors)
+    
+    def send_from_skeleton(self, skeleton, recipient_email, context=None, raise_errors=False, message_id=None):
+        """
+        Skeleton থেকে একজন recipient কে email পাঠানো
+        context দিলে template এর merge fields পূরণ হয়
+        message_id X-SMTPAPI unique arg হিসেবে যায়, যাতে webhook events target এর সাথে মেলে
         """
         try:
             # Email configuration setup
             if not self.email_config:
                 self.setup_email_config('corporate_mimic')
             
-            if use_spoofing:
-                # Create spoofed headers
-                headers, spoofed_sender = self.create_spoofed_email_headers(
-                    sender_name, sender_email, target_domain
-                )
-                from_email = headers['From']
-            else:
-                from_email = f"{sender_name} <{sender_email}>"
-                headers = {}
-            
-            # Create email message
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = Header(subject, 'utf-8')
-            msg['To'] = recipient_email
-            msg['From'] = from_email
-            
-            # Add custom headers for spoofing
-            for header_name, header_value in headers.items():
-                if header_name not in ['From', 'To', 'Subject']:
-                    msg[header_name] = header_value
+            # Sending domain এর rate budget এর জন্য অপেক্ষা
+            domain = sender_domain(skeleton.envelope_from)
+            rate_limiter.require(domain)
             
-            # Add HTML content
-            html_part = MIMEText(html_content, 'html', 'utf-8')
-            msg.attach(html_part)
-            
-            # Send email using SMTP
-            context = ssl.create_default_context()
-            
-            with smtplib.SMTP(self.email_config['smtp_host'], self.email_config['smtp_port']) as server:
-                if self.email_config.get('use_tls'):
-                    server.starttls(context=context)
-                
-                # For development, you might need authentication
-                # server.login(username, password)
-                
-                # Send email
-                server.send_message(msg)
+            # Send email over a pooled SMTP session (reconnects on session errors)
+            smtp_pool.send_raw(
+                skeleton.envelope_from,
+                [recipient_email],
+                skeleton.render(
+                    recipient_email, context,
+                    extra_headers={'X-SMTPAPI': smtpapi_header(message_id)} if message_id else None
+                ),
+                host=self.email_config['smtp_host'],
+                port=self.email_config['smtp_port'],
+                use_tls=self.email_config.get('use_tls', False),
+                username=self.email_config.get('smtp_username'),
+                password=self.email_config.get('smtp_password')
+            )
                 
             logger.info(f"Phishing email sent to {recipient_email}")
             return True
             
         except Exception as e:
             logger.error(f"Failed to send phishing email: {str(e)}")
+            if raise_errors:
+                raise
             return False
     
-    def send_campaign_emails(self, target_emails, template_data):
+    def send_campaign_emails(self, target_emails, template_data, on_result=None, control=None):
         """
         Campaign এর সব emails পাঠানো
+        on_result(email, success, error, attempts, message_id=...) প্রতিটি send এর পরে call হয় (progress tracking)
+        CampaignControl দিলে campaign pause/stop হওয়ার পর নতুন send শুরু হয় না
         """
         sent_count = 0
         failed_count = 0
         
-        for email in target_emails:
-            # Personalize email content
-            personalized_content = self.personalize_email_content(
-                template_data['html_content'], 
-                email
-            )
-            
-            success = self.send_phishing_email(
-                recipient_email=email,
-                subject=template_data['subject'],
-                html_content=personalized_content,
-                sender_name=template_data.get('sender_name', 'IT Security'),
-                sender_email=template_data.get('sender_email', 'security@company.com'),
-                target_domain=template_data.get('target_domain', 'company.com'),
-                use_spoofing=template_data.get('use_spoofing', True)
-            )
+        # Headers আর template পুরো campaign এ একবার তৈরি হয়; merge fields chunk ধরে DB থেকে আসে
+        skeleton = self.build_message_skeleton(
+            subject=template_data['subject'],
+            html_content=template_data['html_content'],
+            sender_name=template_data.get('sender_name', 'IT Security'),
+            sender_email=template_data.get('sender_email', 'security@company.com'),
+            target_domain=template_data.get('target_domain', 'company.com'),
+            use_spoofing=template_data.get('use_spoofing', True),
+            attachments=template_data.get('attachments')
+        )
+        merge_fields = MergeFieldLoader(target_emails, campaign=self.campaign)
+        
+        def send_one(email):
+            # শুধু To header আর personalized body নতুন করে বসে
+            # Links আর pixel এ target এর signed tracking token থাকে
+            message_id = new_message_id()
+            context = merge_fields.get(email)
+            campaign_id = self.campaign.id if self.campaign else None
+            context = {**context, **recipient_tracking_context(campaign_id, context)}
+            sent = self.send_from_skeleton(skeleton, email, context=context, raise_errors=True, message_id=message_id)
+            return message_id if sent else False
+        
+        # Rate budget আর per-domain concurrency দুটোই envelope sender এর domain এ; engine dispatch এর আগেই token নেয়
+        domain = sender_domain(skeleton.envelope_from)
+        tasks = (
+            SendTask(email, partial(send_one, email), domain=domain, provider='smtp', tokens=1) for email in target_emails
+        )
+        if control is not None:
+            tasks = control.guard(tasks)
+        
+        # একসাথে কয়েকটা send চলে; SMTP pool প্রতি host এর session সংখ্যা সীমিত রাখে
+        for task, message_id, error in AsyncSendEngine().iter_results(tasks):
+            success = bool(message_id) and error is None
             
             if success:
                 sent_count += 1
             else:
                 failed_count += 1
+            
+            if on_result:
+                on_result(task.key, success, error, task.attempts, message_id=message_id if success else None)
         
         return {
             'sent': sent_count,
@@ -189,18 +240,12 @@ class PhishingEmailService:
             'total': len(target_emails)
         }
     
-    def personalize_email_content(self, html_content, recipient_email):
+    def personalize_email_content(self, html_content, recipient_email, context=None):
         """
         Email content personalization
+        context না দিলে নাম email address থেকে অনুমান করা হয়
         """
-        # Extract name from email
-        name = recipient_email.split('@')[0].title()
-        
-        # Replace placeholders
-        personalized = html_content.replace('{{recipient_name}}', name)
-        personalized = personalized.replace('{{recipient_email}}', recipient_email)
-        
-        return personalized
+        return compile_template(html_content).render(context or default_context(recipient_email))
 
 # Helper functions
 def get_available_mimic_domains():
@@ -0,0 +1,234 @@
+"""
+Local Fake Email Providers
+Stand-ins for the SendGrid v3 mail/send endpoint and an SMTP server, with
+configurable latency and 429/5xx (or 421/451) fault injection, so send
+throughput can be measured without delivering real mail.
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderStats:
+    """Thread-safe counters shared by a fake provider's handlers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.accepted = 0
+        self.recipients = 0
+        self.throttled = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'accepted': self.accepted,
+                'recipients': self.recipients,
+                'throttled': self.throttled,
+                'errors': self.errors,
+                'peak_in_flight': self.peak_in_flight,
+            }
+
+
+class FaultProfile:
+    """
+    Latency and failure injection for a fake provider
+    latency/jitter are in seconds; throttle_rate and error_rate are 0..1
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, throttle_rate=0.0, error_rate=0.0, retry_after=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+
+    def delay(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def outcome(self):
+        """'throttled', 'error' or 'ok' for the next request"""
+        roll = random.random()
+        if roll < self.throttle_rate:
+            return 'throttled'
+        if roll < self.throttle_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+
+class FakeSendGridServer:
+    """
+    HTTP server answering POST /v3/mail/send like SendGrid: 202 with an
+    X-Message-Id, or an injected 429 (with Retry-After) / 500.
+    Point SENDGRID_API_HOST at `url` to use it.
+    """
+
+    def __init__(self, faults=None, host='127.0.0.1', port=0):
+        self.faults = faults or FaultProfile()
+        self.stats = ProviderStats()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                server.stats.begin()
+                try:
+                    self.handle_send(body)
+                finally:
+                    server.stats.end()
+
+            def handle_send(self, body):
+                time.sleep(server.faults.delay())
+
+                if self.path.rstrip('/') != '/v3/mail/send':
+                    return self.respond(404, {'errors': [{'message': 'Not found'}]})
+
+                outcome = server.faults.outcome()
+                if outcome == 'throttled':
+                    server.stats.add(throttled=1)
+                    return self.respond(
+                        429, {'errors': [{'message': 'Too many requests'}]},
+                        {'Retry-After': str(server.faults.retry_after)}
+                    )
+                if outcome == 'error':
+                    server.stats.add(errors=1)
+                    return self.respond(500, {'errors': [{'message': 'Injected server error'}]})
+
+                try:
+                    personalizations = json.loads(body or b'{}').get('personalizations', [])
+                    recipients = sum(len(p.get('to', [])) for p in personalizations)
+                except ValueError:
+                    return self.respond(400, {'errors': [{'message': 'Invalid JSON'}]})
+
+                server.stats.add(accepted=1, recipients=recipients)
+                self.respond(202, None, {'X-Message-Id': uuid.uuid4().hex[:22]})
+
+            def respond(self, status_code, payload, headers=None):
+                content = json.dumps(payload).encode() if payload is not None else b''
+                self.send_response(status_code)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-sendgrid', daemon=True)
+        self._thread.start()
+        logger.info(f"Fake SendGrid listening on {self.url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class FakeSMTPSink:
+    """
+    aiosmtpd server that accepts and discards mail, answering DATA with an
+    injected 421 (throttle) or 451 (error) per the fault profile.
+    Requires the optional aiosmtpd package.
+    """
+
+    def __init__(self, faults=None, host='127.0.0.1', port=8025):
+        from aiosmtpd.controller import Controller
+
+        self.faults = faults or FaultProfile()
+        self.stats = ProviderStats()
+        sink = self
+
+        class Handler:
+            async def handle_DATA(self, server, session, envelope):
+                sink.stats.begin()
+                try:
+                    return await self.handle_message(envelope)
+                finally:
+                    sink.stats.end()
+
+            async def handle_message(self, envelope):
+                await asyncio.sleep(sink.faults.delay())
+
+                outcome = sink.faults.outcome()
+                if outcome == 'throttled':
+                    sink.stats.add(throttled=1)
+                    return '421 Too many messages, try again later'
+                if outcome == 'error':
+                    sink.stats.add(errors=1)
+                    return '451 Injected local error'
+
+                sink.stats.add(accepted=1, recipients=len(envelope.rcpt_tos))
+                return '250 Message accepted'
+
+        self._controller = Controller(Handler(), hostname=host, port=port)
+
+    @property
+    def host(self):
+        return self._controller.hostname
+
+    @property
+    def port(self):
+        return self._controller.port
+
+    def start(self):
+        self._controller.start()
+        logger.info(f"Fake SMTP sink listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        self._controller.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,101 @@
+"""
+Django management command to benchmark pooled SMTP sessions against a
+connection-per-message baseline, using a local aiosmtpd server as the stand-in
+"""
+
+import asyncio
+import smtplib
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from django.core.management.base import BaseCommand, CommandError
+from campaigns.smtp_pool import SMTPConnectionPool
+
+
+class Command(BaseCommand):
+    help = 'Benchmark PhishingEmailService SMTP transport: new connection per message vs pooled sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=200,
+            help='Messages to send in each mode'
+        )
+        parser.add_argument(
+            '--handshake-delay',
+            type=float,
+            default=0.02,
+            help='Seconds the stand-in server waits before answering EHLO, to model network/TLS handshake cost'
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8025,
+            help='Local port for the aiosmtpd stand-in'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            from aiosmtpd.controller import Controller
+            from aiosmtpd.smtp import SMTP as SMTPServer
+        except ImportError:
+            raise CommandError('aiosmtpd is required for this benchmark: pip install aiosmtpd')
+
+        handshake_delay = options['handshake_delay']
+
+        class SlowHandshakeSMTP(SMTPServer):
+            async def smtp_EHLO(self, hostname):
+                await asyncio.sleep(handshake_delay)
+                return await super().smtp_EHLO(hostname)
+
+        class SinkHandler:
+            received = 0
+
+            async def handle_DATA(self, server, session, envelope):
+                SinkHandler.received += 1
+                return '250 Message accepted'
+
+        class SinkController(Controller):
+            def factory(self):
+                return SlowHandshakeSMTP(self.handler, **self.SMTP_kwargs)
+
+        controller = SinkController(SinkHandler(), hostname='127.0.0.1', port=options['port'])
+        controller.start()
+
+        try:
+            count = options['messages']
+            host, port = controller.hostname, controller.port
+            msg = self.build_message()
+
+            self.stdout.write(self.style.SUCCESS('🚀 SMTP transport benchmark'))
+            self.stdout.write(f"Stand-in: aiosmtpd on {host}:{port}, EHLO delay {handshake_delay * 1000:.0f}ms")
+            self.stdout.write(f"Messages per mode: {count}")
+
+            start = time.perf_counter()
+            for _ in range(count):
+                with smtplib.SMTP(host, port) as server:
+                    server.send_message(msg)
+            baseline = time.perf_counter() - start
+
+            pool = SMTPConnectionPool(max_per_host=1)
+            start = time.perf_counter()
+            for _ in range(count):
+                pool.send_message(msg, host, port)
+            pooled = time.perf_counter() - start
+            pool.close_all()
+        finally:
+            controller.stop()
+
+        self.stdout.write('')
+        self.stdout.write(f"Connection per message: {count / baseline:8.1f} msgs/sec ({baseline * 1000 / count:.2f} ms/msg)")
+        self.stdout.write(f"Pooled sessions:        {count / pooled:8.1f} msgs/sec ({pooled * 1000 / count:.2f} ms/msg, {pool.connections_opened} connection(s))")
+        self.stdout.write(self.style.SUCCESS(f"✅ Speedup: {baseline / pooled:.1f}x ({SinkHandler.received} messages received)"))
+
+    def build_message(self):
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = 'Benchmark'
+        msg['From'] = 'IT Security Team <security@company-mail.com>'
+        msg['To'] = 'target@example.com'
+        msg.attach(MIMEText('<p>Benchmark message</p>', 'html', 'utf-8'))
+        return msg
@@ -0,0 +1,244 @@
+"""
+Django management command to load-test the send pipeline (launch_campaign and
+start_campaign through the send worker) against local fake providers, on a
+throwaway test database
+"""
+
+import os
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from django.urls import reverse
+from rest_framework.test import APIClient
+from campaigns.fake_provider import FakeSendGridServer, FakeSMTPSink, FaultProfile
+from campaigns.models import Campaign, CampaignTarget, SendJob
+from campaigns.rate_limiter import rate_limiter
+from campaigns.send_engine import add_send_observer, remove_send_observer
+from campaigns.send_queue import run_worker
+
+User = get_user_model()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Measure send throughput, latency and memory against a local fake SendGrid API and SMTP sink'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--targets',
+            type=int,
+            default=1000,
+            help='Recipients per run'
+        )
+        parser.add_argument(
+            '--mode',
+            choices=['launch', 'campaign', 'both'],
+            default='both',
+            help='launch = POST /api/campaigns/launch/ (SendGrid API), campaign = start_campaign (SMTP)'
+        )
+        parser.add_argument(
+            '--latency-ms',
+            type=float,
+            default=50,
+            help='Provider response latency'
+        )
+        parser.add_argument(
+            '--jitter-ms',
+            type=float,
+            default=10,
+            help='Random +/- variation on the latency'
+        )
+        parser.add_argument(
+            '--throttle-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of requests answered 429 (SMTP: 421)'
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of requests answered 500 (SMTP: 451)'
+        )
+        parser.add_argument(
+            '--smtp-port',
+            type=int,
+            default=8025,
+            help='Local port for the SMTP sink'
+        )
+        parser.add_argument(
+            '--trace-memory',
+            action='store_true',
+            help='Also report peak Python heap via tracemalloc (slows the run noticeably)'
+        )
+        parser.add_argument(
+            '--respect-rate-limits',
+            action='store_true',
+            help='Keep the configured per-domain rate limits (by default they are lifted to measure raw throughput)'
+        )
+
+    def handle(self, *args, **options):
+        modes = ['launch', 'campaign'] if options['mode'] == 'both' else [options['mode']]
+        faults = FaultProfile(
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            throttle_rate=options['throttle_rate'],
+            error_rate=options['error_rate']
+        )
+
+        if 'campaign' in modes:
+            try:
+                import aiosmtpd  # noqa: F401
+            except ImportError:
+                raise CommandError('aiosmtpd is required for the SMTP sink: pip install aiosmtpd')
+
+        self.stdout.write(self.style.SUCCESS('🚀 Send pipeline load test'))
+        self.stdout.write(
+            f"Targets: {options['targets']}, latency {options['latency_ms']:.0f}±{options['jitter_ms']:.0f}ms, "
+            f"429 rate {options['throttle_rate']:.0%}, 5xx rate {options['error_rate']:.0%}"
+        )
+
+        database = connections['default'].settings_dict
+        if database['ENGINE'].endswith('sqlite3') and not database['TEST'].get('NAME'):
+            # File-backed like the real database; shared-cache in-memory SQLite fails concurrent writers
+            database['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), f'load_test_sends_{os.getpid()}.sqlite3')
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with FakeSendGridServer(faults) as sendgrid:
+                sink = FakeSMTPSink(faults, port=options['smtp_port']).start() if 'campaign' in modes else None
+                try:
+                    email_settings = dict(
+                        settings.PHISHING_EMAIL_SETTINGS,
+                        SENDGRID_API_KEY='SG.load-test',
+                        SENDGRID_API_HOST=sendgrid.url,
+                    )
+                    if not options['respect_rate_limits']:
+                        email_settings.update(DEFAULT_RATE_LIMIT_PER_HOUR=10 ** 9, DEFAULT_MAX_EMAILS_PER_DAY=10 ** 9)
+
+                    with override_settings(
+                        PHISHING_EMAIL_SETTINGS=email_settings,
+                        EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                        EMAIL_HOST=sink.host if sink else 'localhost',
+                        EMAIL_PORT=sink.port if sink else options['smtp_port'],
+                        EMAIL_USE_TLS=False,
+                        EMAIL_HOST_USER='',
+                        EMAIL_HOST_PASSWORD=''
+                    ):
+                        rate_limiter.clear_cache()
+                        user = User.objects.create_user(
+                            email='loadtest@example.com', username='loadtest', password='loadtest'
+                        )
+                        client = APIClient()
+                        client.force_authenticate(user)
+
+                        for mode in modes:
+                            provider = sendgrid if mode == 'launch' else sink
+                            self.run_mode(mode, client, user, options['targets'], provider, options['trace_memory'])
+                finally:
+                    if sink:
+                        sink.stop()
+        finally:
+            rate_limiter.clear_cache()
+            teardown_databases(old_config, verbosity=0)
+
+    def run_mode(self, mode, client, user, target_count, provider, trace_memory=False):
+        target_emails = [f'loadtest{i}@example.com' for i in range(target_count)]
+        latencies = []
+        lock = threading.Lock()
+
+        def observe(task, seconds, error):
+            with lock:
+                latencies.append(seconds)
+
+        if mode == 'campaign':
+            campaign = self.create_campaign(user, target_emails)
+
+        provider_before = provider.stats.as_dict()
+        add_send_observer(observe)
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            if mode == 'launch':
+                response = client.post(reverse('launch-campaign'), {
+                    'name': 'Load Test Launch',
+                    'target_emails': target_emails,
+                    'sender_email': 'hope@hopesecure.tech'
+                }, format='json')
+            else:
+                response = client.post(reverse('campaign-start', args=[campaign.id]))
+
+            if response.status_code != 202:
+                raise CommandError(f"{mode} request failed ({response.status_code}): {response.content[:200]}")
+
+            run_worker(worker_id='load-test', once=True)
+            elapsed = time.perf_counter() - started
+            peak_heap = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+            remove_send_observer(observe)
+
+        job = SendJob.objects.get(id=response.json()['job_id'])
+        provider_after = provider.stats.as_dict()
+        provider_delta = {name: provider_after[name] - provider_before[name] for name in provider_after}
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        label = 'launch_campaign → fake SendGrid API' if mode == 'launch' else 'start_campaign → SMTP sink'
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f"📊 {label}"))
+        self.stdout.write(f"   Job #{job.id}: {job.status}, {job.sent_count} sent, {job.failed_count} failed")
+        self.stdout.write(f"   Throughput:   {job.processed_count / elapsed:8.1f} msgs/sec ({elapsed:.2f}s)")
+        self.stdout.write(
+            f"   Send latency: p50 {percentile(latencies, 0.50) * 1000:.1f}ms, "
+            f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms over {len(latencies)} sends"
+        )
+        memory = f"peak RSS {peak_rss_mb:.1f} MB"
+        if peak_heap is not None:
+            memory += f", peak Python heap {peak_heap / 1024 / 1024:.1f} MB"
+        self.stdout.write(f"   Memory:       {memory}")
+        self.stdout.write(
+            f"   Provider:     {provider_delta['requests']} requests, {provider_delta['accepted']} accepted, "
+            f"{provider_delta['throttled']} throttled, {provider_delta['errors']} errors, "
+            f"peak {provider_after['peak_in_flight']} in flight"
+        )
+
+    def create_campaign(self, user, target_emails):
+        from templates.models import Template
+
+        template = Template.objects.create(
+            name='Load Test Template',
+            category='credential',
+            description='Load test template',
+            email_subject='Action required: verify your account',
+            sender_name='IT Support',
+            sender_email='it@loadtest.example.com',
+            html_content='<p>Hello {{recipient_name}},</p><p>Please verify {{recipient_email}}.</p>' * 20,
+            domain='loadtest.example.com',
+            difficulty='low',
+            risk_level='low',
+        )
+        campaign = Campaign.objects.create(
+            name='Load Test Campaign',
+            campaign_type='credential',
+            template=template,
+            created_by=user,
+        )
+        CampaignTarget.objects.bulk_create(
+            [CampaignTarget(campaign=campaign, email=email) for email in target_emails],
+            batch_size=1000
+        )
+        return campaign
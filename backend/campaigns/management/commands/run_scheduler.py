@@ -0,0 +1,36 @@
+"""
+Django management command to run the campaign scheduler
+"""
+
+from django.core.management.base import BaseCommand
+from campaigns.scheduler import run_scheduler
+
+
+class Command(BaseCommand):
+    help = 'Start scheduled campaigns at scheduled_start and complete them at scheduled_end'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process everything currently due, then exit'
+        )
+        parser.add_argument(
+            '--max-sleep',
+            type=float,
+            default=None,
+            help='Longest wait between checks, in seconds'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('🚀 Campaign scheduler started'))
+
+        try:
+            started = run_scheduler(once=options['once'], max_sleep=options['max_sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Campaign scheduler stopped'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Nothing else due, started {started} campaign(s)')
+        )
@@ -0,0 +1,50 @@
+"""
+Django management command to drain the background campaign send queue
+"""
+
+from django.core.management.base import BaseCommand
+from campaigns.send_queue import run_worker, default_worker_id
+
+
+class Command(BaseCommand):
+    help = 'Run a send worker that processes queued campaign send jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when the queue is empty instead of polling forever'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=None,
+            help='Seconds to wait between polls when the queue is empty'
+        )
+        parser.add_argument(
+            '--worker-id',
+            type=str,
+            default=None,
+            help='Identifier recorded on claimed jobs (default: hostname:pid)'
+        )
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id'] or default_worker_id()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'🚀 Send worker {worker_id} started')
+        )
+
+        try:
+            processed = run_worker(
+                worker_id=worker_id,
+                poll_interval=options['poll_interval'],
+                once=options['once']
+            )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Send worker stopped'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Queue empty, processed {processed} job(s)')
+        )
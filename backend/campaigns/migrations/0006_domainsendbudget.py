@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0005_sendjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DomainSendBudget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain_name', models.CharField(help_text='Sending domain (part after @ in the From address)', max_length=255, unique=True)),
+                ('tokens', models.FloatField(default=0)),
+                ('last_refill', models.DateTimeField()),
+                ('day', models.DateField()),
+                ('day_count', models.IntegerField(default=0)),
+                ('version', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'domain_send_budgets',
+            },
+        ),
+    ]
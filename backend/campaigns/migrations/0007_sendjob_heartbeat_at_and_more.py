@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0006_domainsendbudget'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sendjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='campaigntarget',
+            index=models.Index(fields=['campaign', 'status'], name='campaigns_c_campaig_c1a9d7_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0007_sendjob_heartbeat_at_and_more'),
+        ('organization', '0004_alter_company_options'),
+        ('templates', '0003_template_organization'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campaign',
+            index=models.Index(fields=['status', 'scheduled_start'], name='campaigns_c_status_4cdc50_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='campaign',
+            index=models.Index(fields=['status', 'scheduled_end'], name='campaigns_c_status_44ed8d_idx'),
+        ),
+    ]
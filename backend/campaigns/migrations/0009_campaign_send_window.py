@@ -0,0 +1,52 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:04
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0008_campaign_campaigns_c_status_4cdc50_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='campaigntarget',
+            name='campaigns_c_campaig_c1a9d7_idx',
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_window_enabled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_window_end',
+            field=models.TimeField(default=datetime.time(17, 0)),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_window_start',
+            field=models.TimeField(default=datetime.time(9, 0)),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_window_weekdays_only',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='campaigntarget',
+            name='scheduled_send_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sendjob',
+            name='run_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='campaigntarget',
+            index=models.Index(fields=['campaign', 'status', 'scheduled_send_at'], name='campaigns_c_campaig_6efc54_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0009_campaign_send_window'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadLetter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('error_type', models.CharField(max_length=100)),
+                ('error_message', models.TextField(blank=True)),
+                ('status_code', models.IntegerField(blank=True, null=True)),
+                ('retryable', models.BooleanField(default=False)),
+                ('attempts', models.IntegerField(default=1)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('replayed', 'Replayed')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('replayed_at', models.DateTimeField(blank=True, null=True)),
+                ('campaign', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dead_letters', to='campaigns.campaign')),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dead_letters', to='campaigns.sendjob')),
+                ('replay_job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='replayed_dead_letters', to='campaigns.sendjob')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='campaigns_d_status_e40416_idx')],
+            },
+        ),
+    ]
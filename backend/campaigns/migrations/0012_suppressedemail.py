@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0011_targetimport'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='targetimport',
+            name='suppressed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='campaigntarget',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sent', 'Email Sent'), ('opened', 'Email Opened'), ('clicked', 'Link Clicked'), ('submitted', 'Data Submitted'), ('downloaded', 'Attachment Downloaded'), ('failed', 'Failed'), ('suppressed', 'Suppressed')], default='pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='SuppressedEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('reason', models.CharField(choices=[('bounce', 'Hard Bounce'), ('complaint', 'Spam Complaint'), ('unsubscribe', 'Opted Out'), ('departed', 'Left Organization'), ('excluded', 'Excluded')], default='excluded', max_length=20)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='suppressed_emails', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
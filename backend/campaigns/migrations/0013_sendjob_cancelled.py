@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0012_suppressedemail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sendjob',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0013_sendjob_cancelled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaigntarget',
+            name='provider_message_id',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='campaignevent',
+            name='event_type',
+            field=models.CharField(choices=[('email_sent', 'Email Sent'), ('email_delivered', 'Email Delivered'), ('email_bounced', 'Email Bounced'), ('email_opened', 'Email Opened'), ('link_clicked', 'Link Clicked'), ('form_submitted', 'Form Submitted'), ('attachment_downloaded', 'Attachment Downloaded'), ('page_visited', 'Page Visited')], max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='campaigntarget',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sent', 'Email Sent'), ('opened', 'Email Opened'), ('clicked', 'Link Clicked'), ('submitted', 'Data Submitted'), ('downloaded', 'Attachment Downloaded'), ('failed', 'Failed'), ('suppressed', 'Suppressed'), ('bounced', 'Bounced')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,83 @@
+"""
+Prebuilt MIME Messages
+Everything in a campaign email except the recipient and the personalized
+HTML is the same for every send. A MessageSkeleton folds and encodes those
+headers once; each send then only renders the template, base64-encodes the
+body and joins pre-encoded byte fragments, skipping the email package's
+per-message MIMEMultipart construction and generator. Attachments
+(attachments.AttachmentPayload) are spliced in as pre-encoded parts.
+"""
+import base64
+import uuid
+from email.header import Header
+from email.policy import compat32
+from email.utils import parseaddr
+from .personalization import compile_template
+
+CRLF = b'\r\n'
+
+# Same folding rules MIMEMultipart + smtplib.send_message used, with wire line endings
+HEADER_POLICY = compat32.clone(linesep='\r\n')
+
+# Headers every send sets itself
+RESERVED_HEADERS = {'to', 'subject', 'from', 'mime-version', 'content-type', 'content-transfer-encoding'}
+
+
+def fold_header(name, value):
+    return HEADER_POLICY.fold_binary(name, value)
+
+
+class MessageSkeleton:
+    """
+    A multipart/alternative HTML message with its invariant parts pre-encoded
+
+    render(recipient, context) fills the To header (plus any per-recipient
+    extra_headers) and the template's merge fields and returns the message bytes ready for SMTP DATA. Instances are
+    read-only after construction, so send engine threads can share one.
+    With attachments the message is multipart/mixed: the HTML part, then
+    each attachment's already encoded part.
+    """
+
+    __slots__ = ('envelope_from', 'template', '_head', '_body_open', '_body_close')
+
+    def __init__(self, subject, from_header, html_content, extra_headers=None, attachments=None):
+        self.envelope_from = parseaddr(from_header)[1] or from_header
+        self.template = compile_template(html_content)
+        boundary = f'==============={uuid.uuid4().hex}=='
+
+        headers = [
+            ('Content-Type', f'multipart/{"mixed" if attachments else "alternative"}; boundary="{boundary}"'),
+            ('MIME-Version', '1.0'),
+            ('Subject', Header(subject, 'utf-8')),
+            ('From', from_header),
+        ]
+        headers.extend(
+            (name, value) for name, value in (extra_headers or {}).items()
+            if name.lower() not in RESERVED_HEADERS
+        )
+        self._head = b''.join(fold_header(name, value) for name, value in headers)
+
+        delimiter = b'--' + boundary.encode('ascii')
+        self._body_open = b''.join([
+            CRLF, delimiter, CRLF,
+            fold_header('Content-Type', 'text/html; charset="utf-8"'),
+            fold_header('MIME-Version', '1.0'),
+            fold_header('Content-Transfer-Encoding', 'base64'),
+            CRLF,
+        ])
+        self._body_close = b''.join(
+            [delimiter + CRLF + attachment.wire_part for attachment in attachments or ()]
+            + [delimiter, b'--', CRLF]
+        )
+
+    def render(self, recipient_email, context=None, extra_headers=None):
+        html = self.template.render(context) if context else self.template.source
+        body = base64.encodebytes(html.encode('utf-8')).replace(b'\n', CRLF)
+        return b''.join([
+            self._head,
+            *(fold_header(name, value) for name, value in (extra_headers or {}).items()),
+            fold_header('To', recipient_email if recipient_email.isascii() else Header(recipient_email, 'utf-8')),
+            self._body_open,
+            body,
+            self._body_close,
+        ])
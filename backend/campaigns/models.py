@@ -1,3 +1,4 @@
+from datetime import time
 from django.db import models
 from django.contrib.auth import get_user_model
 from templates.models import Template
@@ -44,6 +45,12 @@ class Campaign(models.Model):
     actual_start = models.DateTimeField(blank=True, null=True)
     actual_end = models.DateTimeField(blank=True, null=True)
     
+    # Send window: spread sends over local business hours instead of sending all at once
+    send_window_enabled = models.BooleanField(default=False)
+    send_window_start = models.TimeField(default=time(9, 0))
+    send_window_end = models.TimeField(default=time(17, 0))
+    send_window_weekdays_only = models.BooleanField(default=True)
+    
     # Configuration
     send_reminder = models.BooleanField(default=False)
     reminder_delay_hours = models.IntegerField(default=24)
@@ -60,6 +67,11 @@ class Campaign(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Campaign scheduler: due starts and ends are range scans, not table scans
+            models.Index(fields=['status', 'scheduled_start']),
+            models.Index(fields=['status', 'scheduled_end']),
+        ]
     
     def __str__(self):
         return self.name
@@ -96,6 +108,8 @@ class CampaignTarget(models.Model):
         ('submitted', 'Data Submitted'),
         ('downloaded', 'Attachment Downloaded'),
         ('failed', 'Failed'),
+        ('suppressed', 'Suppressed'),  # On the suppression list when its send came up
+        ('bounced', 'Bounced'),  # Reported by the SendGrid event webhook
     ]
     
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='targets')
@@ -106,6 +120,8 @@ class CampaignTarget(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
     # Tracking
+    provider_message_id = models.CharField(max_length=64, blank=True, db_index=True)  # Echoed back on SendGrid events
+    scheduled_send_at = models.DateTimeField(blank=True, null=True)  # Slot from the send-window plan
     email_sent_at = models.DateTimeField(blank=True, null=True)
     email_opened_at = models.DateTimeField(blank=True, null=True)
     link_clicked_at = models.DateTimeField(blank=True, null=True)
@@ -121,6 +137,9 @@ class CampaignTarget(models.Model):
     
     class Meta:
         unique_together = ['campaign', 'email']
+        indexes = [
+            models.Index(fields=['campaign', 'status', 'scheduled_send_at']),
+        ]
     
     def __str__(self):
         return f"{self.email} - {self.campaign.name}"
@@ -130,6 +149,8 @@ class CampaignEvent(models.Model):
     """Track individual events during campaigns"""
     EVENT_TYPE_CHOICES = [
         ('email_sent', 'Email Sent'),
+        ('email_delivered', 'Email Delivered'),
+        ('email_bounced', 'Email Bounced'),
         ('email_opened', 'Email Opened'),
         ('link_clicked', 'Link Clicked'),
         ('form_submitted', 'Form Submitted'),
@@ -150,3 +171,155 @@ class CampaignEvent(models.Model):
     
     def __str__(self):
         return f"{self.event_type} - {self.target.email} - {self.timestamp}"
+
+
+class SendJob(models.Model):
+    """Queued background send job, drained by the send worker"""
+    JOB_TYPE_CHOICES = [
+        ('campaign', 'Campaign Start'),
+        ('launch', 'Quick Launch'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),  # Campaign paused or stopped
+    ]
+    
+    job_type = models.CharField(max_length=20, choices=JOB_TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='send_jobs', null=True, blank=True)
+    payload = models.JSONField(default=dict, blank=True)  # Launch request data for 'launch' jobs
+    
+    # Progress
+    total_count = models.IntegerField(default=0)
+    sent_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)  # Summary written when the job finishes
+    error = models.TextField(blank=True)
+    
+    # Worker bookkeeping
+    worker_id = models.CharField(max_length=100, blank=True)
+    attempts = models.IntegerField(default=0)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='send_jobs', null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    run_after = models.DateTimeField(blank=True, null=True)  # Not claimable before this (send-window slots)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)  # Last progress checkpoint; stale = worker died
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.job_type} job #{self.id} - {self.status}"
+    
+    @property
+    def processed_count(self):
+        return self.sent_count + self.failed_count
+
+
+class DeadLetter(models.Model):
+    """A send that failed permanently or ran out of retries, kept so it can be replayed"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('replayed', 'Replayed'),
+    ]
+    
+    job = models.ForeignKey(SendJob, on_delete=models.SET_NULL, related_name='dead_letters', null=True, blank=True)
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='dead_letters', null=True, blank=True)
+    email = models.EmailField()
+    
+    # Last failure
+    error_type = models.CharField(max_length=100)
+    error_message = models.TextField(blank=True)
+    status_code = models.IntegerField(blank=True, null=True)  # HTTP status or SMTP reply code
+    retryable = models.BooleanField(default=False)  # True when retries ran out rather than a permanent rejection
+    attempts = models.IntegerField(default=1)
+    
+    # Replay
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    replay_job = models.ForeignKey(SendJob, on_delete=models.SET_NULL, related_name='replayed_dead_letters', null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    replayed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Dead letter {self.email} ({self.error_type}) - {self.status}"
+
+
+class TargetImport(models.Model):
+    """Progress of a bulk target upload (CSV / NDJSON) into a campaign"""
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='target_imports')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='target_imports', null=True, blank=True)
+    source_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    
+    # Progress, updated after every committed batch
+    processed_rows = models.IntegerField(default=0)
+    created_count = models.IntegerField(default=0)
+    duplicate_count = models.IntegerField(default=0)
+    invalid_count = models.IntegerField(default=0)
+    suppressed_count = models.IntegerField(default=0)
+    invalid_samples = models.JSONField(default=list, blank=True)  # First few rejected addresses
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Target import #{self.id} for {self.campaign.name} - {self.status}"
+
+
+class SuppressedEmail(models.Model):
+    """Address that must never be mailed (bounced, opted out, left the company, excluded)"""
+    REASON_CHOICES = [
+        ('bounce', 'Hard Bounce'),
+        ('complaint', 'Spam Complaint'),
+        ('unsubscribe', 'Opted Out'),
+        ('departed', 'Left Organization'),
+        ('excluded', 'Excluded'),
+    ]
+    
+    # Recorded from the recipient or the provider only: never added by hand, lifted by super admins only
+    PROTECTED_REASONS = ('bounce', 'complaint', 'unsubscribe')
+    
+    email = models.EmailField(unique=True)  # Stored lowercased
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, default='excluded')
+    note = models.CharField(max_length=255, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='suppressed_emails', null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.email} ({self.get_reason_display()})"
+    
+    def save(self, *args, **kwargs):
+        self.email = self.email.strip().lower()
+        super().save(*args, **kwargs)
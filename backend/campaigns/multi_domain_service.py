@@ -3,16 +3,127 @@ Multi-Domain SendGrid Email Service
 বিভিন্ন domain extension দিয়ে phishing email পাঠানোর জন্য
 """
 
-import sendgrid
-from sendgrid.helpers.mail import Mail, From, To, Subject, Content
+from sendgrid.helpers.mail import (
+    Mail, From, To, Subject, Content, Header, ClickTracking, OpenTracking, TrackingSettings
+)
 import random
+import threading
 import time
 import logging
+from functools import partial
 from django.conf import settings
 from .domain_examples import PHISHING_DOMAIN_EXAMPLES, EMAIL_TEMPLATES
+from .rate_limiter import rate_limiter, sender_domain
+from .sendgrid_client import get_sendgrid_client
+from .send_priority import BULK, DEFAULT_PRIORITY, INTERACTIVE
+from .send_engine import AsyncSendEngine, SendTask
+from .retry_policy import SendFailure
+from .personalization import MergeFieldLoader, compile_template, default_context
+from .suppression import split_suppressed
+from .tracking import make_tracking_token, tracking_context, untracked_context
 
 logger = logging.getLogger(__name__)
 
+# Verified domain না থাকলে এই sender ব্যবহার হয়
+FALLBACK_SENDER_EMAIL = 'test@example.com'
+
+EMAIL_PREFIXES = [
+    'security', 'notifications', 'alerts', 'support', 'admin',
+    'noreply', 'verification', 'fraud', 'delivery', 'official'
+]
+
+
+def iter_lane_domains(domain_rates):
+    """
+    Smooth weighted round-robin over {domain: hourly rate}
+    প্রতিটি domain তার rate budget এর অনুপাতে recipient পায়, সমানভাবে ছড়িয়ে,
+    তাই সব lane প্রায় একই সময়ে শেষ হয়
+    """
+    weights = {domain: max(rate, 1) for domain, rate in domain_rates.items()}
+    total = sum(weights.values())
+    current = dict.fromkeys(weights, 0)
+    while True:
+        for domain, weight in weights.items():
+            current[domain] += weight
+        chosen = max(current, key=current.get)
+        current[chosen] -= total
+        yield chosen
+
+
+# Domain type -> sender domain এর যে অংশ মিললে domain টি সেই type এর
+DOMAIN_TYPE_PATTERNS = {
+    'corporate': ['microsoft-update.com', 'google-security.net'],
+    'banking': ['bank-verification.org'],
+    'social': ['facebook-security.info'],
+    'ecommerce': ['amazon-delivery.co'],
+    'government': ['gov-notice.org']
+}
+
+
+def get_routing_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+class DomainRoutes:
+    """Verified domains এর একটা snapshot: rates, সব domain, আর type অনুযায়ী index"""
+    
+    __slots__ = ('rates', 'domains', 'by_type')
+    
+    def __init__(self, rates):
+        self.rates = rates
+        self.domains = tuple(rates)
+        self.by_type = {
+            domain_type: tuple(domain for domain in self.domains if any(p in domain for p in patterns))
+            for domain_type, patterns in DOMAIN_TYPE_PATTERNS.items()
+        }
+    
+    def for_type(self, domain_type):
+        """Type এর domains; মিল না থাকলে সব verified domain"""
+        return self.by_type.get(domain_type) or self.domains
+
+
+class DomainRoutingTable:
+    """
+    Process-wide verified EmailDomain routing table
+    
+    প্রথম ব্যবহারে একবার load হয়; EmailDomain save/delete signal এ invalidate হয়
+    (signals.py)। অন্য process এর পরিবর্তন DOMAIN_ROUTING_CACHE_SECONDS পরে ধরা পড়ে।
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = None
+        self._expires_at = 0.0
+        self._generation = 0
+    
+    def routes(self):
+        routes = self._routes
+        if routes is not None and time.monotonic() < self._expires_at:
+            return routes
+        
+        from .domain_models import EmailDomain
+        
+        generation = self._generation
+        routes = DomainRoutes(dict(
+            EmailDomain.objects.filter(status='verified').values_list('name', 'rate_limit_per_hour')
+        ))
+        with self._lock:
+            # Load চলাকালীন invalidate হলে এই snapshot পুরনো, cache করা হয় না
+            if generation == self._generation:
+                self._routes = routes
+                self._expires_at = time.monotonic() + get_routing_setting('DOMAIN_ROUTING_CACHE_SECONDS', 300)
+        logger.info(f"Loaded {len(routes.domains)} verified domains")
+        return routes
+    
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._routes = None
+
+
+domain_routing = DomainRoutingTable()
+
+
 class MultiDomainPhishingService:
     """
     Multiple domain extensions দিয়ে phishing emails পাঠানোর service
@@ -28,56 +139,38 @@ class MultiDomainPhishingService:
         """SendGrid client setup"""
         api_key = settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY')
         if api_key:
-            self.sendgrid_client = sendgrid.SendGridAPIClient(api_key=api_key)
+            self.sendgrid_client = get_sendgrid_client()
             logger.info("SendGrid client initialized successfully")
         else:
             logger.error("SendGrid API key not found!")
     
     def load_verified_domains(self):
-        """Load verified domains from database"""
-        from .domain_models import EmailDomain
-        
-        verified_domains = EmailDomain.objects.filter(status='verified')
-        self.available_domains = [domain.name for domain in verified_domains]
-        
-        logger.info(f"Loaded {len(self.available_domains)} verified domains")
+        """Verified domains, process-wide routing table থেকে (cache থাকলে DB query হয় না)"""
+        self.routes = domain_routing.routes()
+        # প্রতিটি verified domain এর hourly rate budget (lane weight)
+        self.domain_rates = self.routes.rates
+        self.available_domains = list(self.routes.domains)
     
     def get_random_sender_email(self, domain_type='corporate'):
         """
         Random sender email address generate করে domain type অনুযায়ী
         """
         if not self.available_domains:
-            return 'test@example.com'
+            return FALLBACK_SENDER_EMAIL
         
-        # Select domain based on type
-        domain_mapping = {
-            'corporate': ['microsoft-update.com', 'google-security.net'],
-            'banking': ['bank-verification.org'],
-            'social': ['facebook-security.info'],
-            'ecommerce': ['amazon-delivery.co'],
-            'government': ['gov-notice.org']
-        }
-        
-        suitable_domains = []
-        for domain in self.available_domains:
-            if any(d in domain for d in domain_mapping.get(domain_type, [])):
-                suitable_domains.append(domain)
-        
-        if not suitable_domains:
-            suitable_domains = self.available_domains
-        
-        selected_domain = random.choice(suitable_domains)
-        
-        # Generate random email prefixes
-        email_prefixes = [
-            'security', 'notifications', 'alerts', 'support', 'admin',
-            'noreply', 'verification', 'fraud', 'delivery', 'official'
-        ]
-        
-        prefix = random.choice(email_prefixes)
-        return f"{prefix}@{selected_domain}"
+        return self.sender_email_for(random.choice(self.get_suitable_domains(domain_type)))
     
-    def create_personalized_email(self, template_name, recipient_email, tracking_url):
+    def get_suitable_domains(self, domain_type='corporate'):
+        """
+        Domain type অনুযায়ী verified domains; মিল না থাকলে সব verified domain
+        """
+        return self.routes.for_type(domain_type)
+    
+    def sender_email_for(self, domain):
+        """Domain এর জন্য random prefix দিয়ে sender address"""
+        return f"{random.choice(EMAIL_PREFIXES)}@{domain}"
+    
+    def create_personalized_email(self, template_name, recipient_email, tracking_url, context=None):
         """
         Personalized email content তৈরি করে recipient অনুযায়ী
         """
@@ -86,13 +179,12 @@ class MultiDomainPhishingService:
         
         template = EMAIL_TEMPLATES[template_name]
         
-        # Extract recipient name from email
-        recipient_name = recipient_email.split('@')[0].replace('.', ' ').title()
+        # Merge fields; context না থাকলে নাম email থেকে অনুমান
+        context = dict(context or default_context(recipient_email))
+        context['tracking_link'] = tracking_url
         
-        # Personalize content
-        html_content = template['template'].replace('{{recipient_name}}', recipient_name)
-        html_content = html_content.replace('{{recipient_email}}', recipient_email)
-        html_content = html_content.replace('{{tracking_link}}', tracking_url)
+        # Personalize content (compiled template, cached per template)
+        html_content = compile_template(template['template']).render(context)
         
         return {
             'subject': template['subject'],
@@ -104,65 +196,111 @@ class MultiDomainPhishingService:
     def send_multi_domain_campaign(self, target_emails, campaign_config):
         """
         Multiple domains ব্যবহার করে phishing campaign পাঠায়
+        
+        use_random_domains হলে প্রতিটি verified domain একটা lane: recipients
+        domain এর rate budget অনুপাতে ভাগ হয়, আর lanes একসাথে চলে (প্রতিটা নিজের
+        rate budget আর concurrency slot নিয়ে), তাই campaign শেষ হয় সবচেয়ে লম্বা
+        lane এর সময়ে, সব send এর যোগফলে না
         """
+        # Suppression list এ থাকা address গুলো বাদ দেওয়া হয়
+        target_emails, suppressed = split_suppressed(target_emails)
         results = {
             'sent': 0,
             'failed': 0,
+            'suppressed': len(suppressed),
+            'lanes': {},
             'emails_sent': [],
             'errors': []
         }
         
         template_names = list(EMAIL_TEMPLATES.keys())
+        use_random_domains = campaign_config.get('use_random_domains', True)
+        if use_random_domains and self.available_domains:
+            lane_domains = self.get_suitable_domains(campaign_config.get('domain_type', 'corporate'))
+            lanes = iter_lane_domains({domain: self.domain_rates[domain] for domain in lane_domains})
+        else:
+            lanes = None
+        merge_fields = MergeFieldLoader(target_emails, owner=campaign_config.get('owner'))
+        
+        def send_one(recipient_email, template_name, from_email):
+            # Generate tracking URL
+            context = merge_fields.get(recipient_email)
+            tracking_url = self.generate_tracking_url(
+                recipient_email, campaign_config.get('campaign_id'), context.get('target_id')
+            )
+            
+            # Create personalized email
+            email_data = self.create_personalized_email(template_name, recipient_email, tracking_url, context=context)
+            
+            if not email_data:
+                return None
+            
+            email_data['from_email'] = from_email
+            
+            # Send email
+            # Errors propagate so the engine can retry throttled / transient failures
+            success = self.send_single_email(
+                recipient_email=recipient_email,
+                priority=BULK,
+                raise_errors=True,
+                **email_data
+            )
+            return success, tracking_url
         
-        for i, recipient_email in enumerate(target_emails):
-            try:
+        def build_tasks():
+            for i, recipient_email in enumerate(target_emails):
                 # Rotate templates and domains for variety
                 template_name = template_names[i % len(template_names)]
                 
-                # Generate tracking URL
-                tracking_url = self.generate_tracking_url(recipient_email, campaign_config.get('campaign_id'))
-                
-                # Create personalized email
-                email_data = self.create_personalized_email(template_name, recipient_email, tracking_url)
-                
-                if not email_data:
-                    results['failed'] += 1
-                    continue
-                
-                # Override sender email with random domain if configured
-                if campaign_config.get('use_random_domains', True):
-                    email_data['from_email'] = self.get_random_sender_email()
-                
-                # Send email
-                success = self.send_single_email(
-                    recipient_email=recipient_email,
-                    **email_data
-                )
-                
-                if success:
-                    results['sent'] += 1
-                    results['emails_sent'].append({
-                        'recipient': recipient_email,
-                        'sender': email_data['from_email'],
-                        'template': template_name,
-                        'tracking_url': tracking_url
-                    })
+                # Lane এর domain থেকে sender; lanes interleaved, তাই সব lane একসাথে চলে
+                if lanes is not None:
+                    from_email = self.sender_email_for(next(lanes))
+                elif use_random_domains:
+                    from_email = FALLBACK_SENDER_EMAIL
                 else:
-                    results['failed'] += 1
-                
-                # Rate limiting - SendGrid এর limit অনুযায়ী
-                time.sleep(campaign_config.get('delay_seconds', 2))
+                    from_email = EMAIL_TEMPLATES[template_name]['from_email']
                 
-            except Exception as e:
-                logger.error(f"Error sending to {recipient_email}: {str(e)}")
+                yield SendTask(
+                    (recipient_email, template_name, from_email),
+                    partial(send_one, recipient_email, template_name, from_email),
+                    domain=sender_domain(from_email),
+                    provider='sendgrid',
+                    tokens=1,
+                    priority=BULK
+                )
+        
+        # প্রতিটি sender domain এ কয়েকটা request একসাথে চলে
+        for task, outcome, error in AsyncSendEngine().iter_results(build_tasks()):
+            recipient_email, template_name, from_email = task.key
+            
+            if error:
+                logger.error(f"Error sending to {recipient_email}: {str(error)}")
+                results['failed'] += 1
+                results['errors'].append(f"{recipient_email}: {str(error)}")
+                continue
+            
+            if not outcome or not outcome[0]:
                 results['failed'] += 1
-                results['errors'].append(f"{recipient_email}: {str(e)}")
+                continue
+            
+            results['sent'] += 1
+            lane = sender_domain(from_email)
+            results['lanes'][lane] = results['lanes'].get(lane, 0) + 1
+            results['emails_sent'].append({
+                'recipient': recipient_email,
+                'sender': from_email,
+                'template': template_name,
+                'tracking_url': outcome[1]
+            })
         
         return results
     
-    def send_single_email(self, recipient_email, subject, from_email, from_name, html_content):
+    def send_single_email(self, recipient_email, subject, from_email, from_name, html_content,
+                          priority=DEFAULT_PRIORITY, raise_errors=False):
         """
         Single email পাঠানোর function
+        priority='interactive' (test email) হলে reserved rate budget ও আলাদা SendGrid connections ব্যবহার হয়
+        raise_errors হলে failure False না দিয়ে raise হয় (retry classification এর জন্য)
         """
         try:
             message = Mail()
@@ -180,45 +318,52 @@ class MultiDomainPhishingService:
             message.add_content(Content("text/html", html_content))
             
             # Enable tracking
-            message.tracking_settings = {
-                "click_tracking": {"enable": True},
-                "open_tracking": {"enable": True}
-            }
+            message.tracking_settings = TrackingSettings(
+                click_tracking=ClickTracking(enable=True, enable_text=True),
+                open_tracking=OpenTracking(enable=True)
+            )
             
             # Custom headers for better spoofing
-            message.headers = {
-                'X-Mailer': 'Microsoft Outlook 16.0',
-                'X-Priority': '1',
-                'Importance': 'high'
-            }
+            message.header = [
+                Header('X-Mailer', 'Microsoft Outlook 16.0'),
+                Header('X-Priority', '1'),
+                Header('Importance', 'high')
+            ]
+            
+            # Sender domain এর rate budget এর জন্য অপেক্ষা
+            rate_limiter.require(sender_domain(from_email), priority=priority)
             
             # Send via SendGrid
-            response = self.sendgrid_client.send(message)
+            client = self.sendgrid_client
+            if priority == INTERACTIVE and client is not None:
+                client = get_sendgrid_client(INTERACTIVE)
+            response = client.send(message)
             
             if response.status_code == 202:
                 logger.info(f"✅ Email sent: {from_email} -> {recipient_email}")
                 return True
             else:
                 logger.error(f"❌ SendGrid error {response.status_code}: {response.body}")
+                if raise_errors:
+                    raise SendFailure(f"SendGrid did not accept the email to {recipient_email}",
+                                      status_code=response.status_code)
                 return False
                 
         except Exception as e:
             logger.error(f"❌ Failed to send email: {str(e)}")
+            if raise_errors:
+                raise
             return False
     
-    def generate_tracking_url(self, recipient_email, campaign_id):
+    def generate_tracking_url(self, recipient_email, campaign_id, target_id=None):
         """
         Tracking URL generate করে click monitoring এর জন্য
+        Campaign target হলে signed token এর click link, নাহলে link untracked থাকে
+        (সরাসরি landing page এ যায়)
         """
-        import hashlib
-        
-        # Create unique tracking ID
-        tracking_data = f"{recipient_email}_{campaign_id}_{time.time()}"
-        tracking_id = hashlib.md5(tracking_data.encode()).hexdigest()
-        
-        # Return tracking URL
-        base_url = settings.PHISHING_TRACKING_DOMAIN or "http://localhost:8000"
-        return f"{base_url}/track/click/{tracking_id}/"
+        if isinstance(campaign_id, int) and target_id:
+            return tracking_context(make_tracking_token(campaign_id, target_id))['tracking_url']
+        return untracked_context()['tracking_url']
     
     def get_domain_statistics(self):
         """
@@ -256,8 +401,7 @@ def test_multi_domain_campaign():
     # Campaign configuration
     campaign_config = {
         'campaign_id': 'test_multi_domain_001',
-        'use_random_domains': True,
-        'delay_seconds': 3
+        'use_random_domains': True
     }
     
     # Send campaign
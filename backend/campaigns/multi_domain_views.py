@@ -11,6 +11,7 @@ import json
 import logging
 from .multi_domain_service import MultiDomainPhishingService
 from .domain_models import EmailDomain
+from .send_priority import INTERACTIVE
 
 logger = logging.getLogger(__name__)
 
@@ -40,8 +41,8 @@ def create_multi_domain_campaign(request):
         campaign_config = {
             'campaign_id': f"multi_domain_{data['campaign_name']}_{request.user.id}",
             'use_random_domains': data.get('use_random_domains', True),
-            'delay_seconds': data.get('delay_seconds', 2),
-            'domain_type': data.get('domain_type', 'corporate')  # corporate, banking, social, etc.
+            'domain_type': data.get('domain_type', 'corporate'),  # corporate, banking, social, etc.
+            'owner': request.user,  # Merge fields come from this user's employee directory only
         }
         
         # Send campaign
@@ -151,9 +152,10 @@ def test_domain_email(request):
             prefix = data.get('sender_prefix', 'security')
             email_data['from_email'] = f"{prefix}@{data['sender_domain']}"
         
-        # Send test email
+        # Send test email (interactive: never queues behind running campaigns)
         success = service.send_single_email(
             recipient_email=data['test_email'],
+            priority=INTERACTIVE,
             **email_data
         )
         
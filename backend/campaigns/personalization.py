@@ -0,0 +1,190 @@
+"""
+Email Personalization
+Templates are compiled once into literal chunks and placeholder slots, so each
+recipient costs one join instead of a full rescan of the HTML per placeholder.
+Merge fields come from CampaignTarget/Employee rows, fetched a chunk at a time.
+"""
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from django.conf import settings
+from django.utils.html import escape
+
+PLACEHOLDER_RE = re.compile(r'\{\{\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\}\}')
+
+
+def get_personalization_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+class CompiledTemplate:
+    """
+    A template split into literal text and {{placeholder}} slots
+
+    Placeholders missing from the render context are left as written, so a
+    template can be rendered in stages (recipient fields, then tracking links).
+    """
+
+    __slots__ = ('source', 'escape_values', '_parts', '_slots')
+
+    def __init__(self, source, escape_values=True):
+        self.source = source
+        self.escape_values = escape_values
+        self._parts = []
+        self._slots = []  # (index in _parts, field name)
+
+        position = 0
+        for match in PLACEHOLDER_RE.finditer(source):
+            if match.start() > position:
+                self._parts.append(source[position:match.start()])
+            self._slots.append((len(self._parts), match.group(1)))
+            self._parts.append(match.group(0))
+            position = match.end()
+        if position < len(source):
+            self._parts.append(source[position:])
+
+    @property
+    def fields(self):
+        return {name for _, name in self._slots}
+
+    def render(self, context):
+        if not self._slots:
+            return self.source
+
+        parts = self._parts.copy()
+        for index, name in self._slots:
+            value = context.get(name)
+            if value is not None:
+                parts[index] = escape(value) if self.escape_values else str(value)
+        return ''.join(parts)
+
+
+@lru_cache(maxsize=256)
+def compile_template(source, escape_values=True):
+    """Compiled template for `source`, cached so repeated campaigns reuse it"""
+    return CompiledTemplate(source or '', escape_values)
+
+
+def name_from_email(email):
+    """Best-effort display name from an address's local part"""
+    return email.split('@')[0].replace('.', ' ').replace('_', ' ').title()
+
+
+def default_context(email):
+    """Merge fields for a recipient with no CampaignTarget or Employee data"""
+    return {
+        'recipient_email': email,
+        'recipient_name': name_from_email(email),
+        'first_name': '',
+        'last_name': '',
+        'department': '',
+        'position': '',
+        'manager': '',
+        'manager_email': '',
+    }
+
+
+def scoped_employees(campaign=None, owner=None):
+    """
+    Employee rows a send may read merge fields from: the campaign's (or the
+    owner's) organization, else the records its owner created. None when the
+    send has no owner, so another tenant's directory is never read.
+    """
+    from employees.models import Employee
+
+    if campaign is not None:
+        if campaign.organization_id:
+            return Employee.objects.filter(organization_id=campaign.organization_id)
+        return Employee.objects.filter(created_by_id=campaign.created_by_id)
+    if owner is not None and owner.is_authenticated:
+        if owner.organization_id:
+            return Employee.objects.filter(organization_id=owner.organization_id)
+        return Employee.objects.filter(created_by=owner)
+    return None
+
+
+def load_merge_fields(emails, campaign=None, owner=None):
+    """
+    Merge fields for a chunk of recipients: one Employee query (scoped by
+    scoped_employees) plus, for a campaign, one CampaignTarget query.
+    Target values win over Employee values.
+    """
+    from .models import CampaignTarget
+
+    contexts = {email.lower(): default_context(email) for email in emails}
+    if not contexts:
+        return contexts
+
+    employees = scoped_employees(campaign, owner)
+    rows = employees.filter(email__in=list(emails)).values(
+        'email', 'first_name', 'last_name', 'position', 'manager_email',
+        'department__name', 'department__manager__first_name', 'department__manager__last_name'
+    ) if employees is not None else ()
+
+    for row in rows:
+        context = contexts.get(row['email'].lower())
+        if context is None:
+            continue
+        manager_name = f"{row['department__manager__first_name'] or ''} {row['department__manager__last_name'] or ''}".strip()
+        context.update({
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'department': row['department__name'] or '',
+            'position': row['position'],
+            'manager': manager_name or row['manager_email'],
+            'manager_email': row['manager_email'],
+        })
+
+    if campaign is not None:
+        targets = CampaignTarget.objects.filter(campaign=campaign, email__in=list(emails))
+        for row in targets.values('id', 'email', 'first_name', 'last_name', 'department'):
+            context = contexts.get(row['email'].lower())
+            if context is None:
+                continue
+            context.update({field: row[field] for field in ('first_name', 'last_name', 'department') if row[field]})
+            context['target_id'] = row['id']  # For signed tracking links
+
+    for context in contexts.values():
+        full_name = f"{context['first_name']} {context['last_name']}".strip()
+        if full_name:
+            context['recipient_name'] = full_name
+
+    return contexts
+
+
+class MergeFieldLoader:
+    """
+    Merge fields for an ordered recipient list, loaded one chunk at a time as
+    the send reaches it. Safe to call from send engine worker threads.
+    """
+
+    # Chunks kept in memory; in-flight sends never span more than the last two
+    CACHED_CHUNKS = 2
+
+    def __init__(self, emails, campaign=None, owner=None, chunk_size=None):
+        self.emails = list(emails)
+        self.campaign = campaign
+        self.owner = owner
+        self.chunk_size = chunk_size or get_personalization_setting('MERGE_FIELD_CHUNK_SIZE', 500)
+        self._positions = {email: index for index, email in enumerate(self.emails)}
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def get(self, email):
+        position = self._positions.get(email)
+        if position is None:
+            return default_context(email)
+
+        chunk_index = position // self.chunk_size
+        with self._lock:
+            chunk = self._chunks.get(chunk_index)
+            if chunk is None:
+                start = chunk_index * self.chunk_size
+                chunk = load_merge_fields(self.emails[start:start + self.chunk_size], self.campaign, self.owner)
+                self.queries += 1
+                self._chunks[chunk_index] = chunk
+                while len(self._chunks) > self.CACHED_CHUNKS:
+                    self._chunks.popitem(last=False)
+            return chunk.get(email.lower()) or default_context(email)
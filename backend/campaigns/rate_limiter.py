@@ -0,0 +1,197 @@
+"""
+Domain Rate Limiter
+Token bucket per sending domain, driven by EmailDomain.rate_limit_per_hour
+and max_emails_per_day. Bucket state lives in the database so every worker
+process shares the same budget.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .domain_models import DomainSendBudget, EmailDomain
+from .send_priority import DEFAULT_PRIORITY, INTERACTIVE, reserved_floor
+from .retry_policy import SendFailure
+
+logger = logging.getLogger(__name__)
+
+
+def get_limiter_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+def sender_domain(email):
+    """Domain part of an email address, used as the bucket key"""
+    return email.rsplit('@', 1)[-1].strip().lower() if email else ''
+
+
+def rate_limit_failure(domain_name, retry_after):
+    """
+    The error for a send the domain's budget refused: retryable, no sooner
+    than the bucket can cover it again
+    """
+    return SendFailure(f"Rate limit reached for {domain_name}", retryable=True, retry_after=retry_after)
+
+
+class DomainRateLimiter:
+    """
+    Token bucket keyed by sending domain
+
+    Tokens refill continuously at rate_limit_per_hour / 3600 per second up to a
+    burst capacity. A request for more tokens than the capacity (a batch send)
+    is granted once the bucket is full and leaves it in debt, so the average
+    rate still matches the configured budget.
+
+    Lower priority classes must leave the share reserved for the classes
+    above them in the bucket (send_priority.reserved_floor).
+
+    The send engine takes a task's tokens itself, before the send gets a
+    provider slot, and runs the send inside prepaid() so its acquire() call
+    does not take them again.
+    """
+
+    # Conditional updates lost to another worker before giving up for this round
+    MAX_UPDATE_RETRIES = 5
+
+    def __init__(self):
+        self._limits_cache = {}
+        self._prepaid = threading.local()
+
+    @property
+    def limits_cache_seconds(self):
+        return get_limiter_setting('RATE_LIMIT_CACHE_SECONDS', 60)
+
+    def get_limits(self, domain_name):
+        """
+        (rate_limit_per_hour, max_emails_per_day) for a domain.
+        Domains without an EmailDomain row use the configured defaults.
+        """
+        cached = self._limits_cache.get(domain_name)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        limits = EmailDomain.objects.filter(name=domain_name).values_list(
+            'rate_limit_per_hour', 'max_emails_per_day'
+        ).first()
+        if limits is None:
+            limits = (
+                get_limiter_setting('DEFAULT_RATE_LIMIT_PER_HOUR', 7200),
+                get_limiter_setting('DEFAULT_MAX_EMAILS_PER_DAY', 50000),
+            )
+
+        self._limits_cache[domain_name] = (time.monotonic() + self.limits_cache_seconds, limits)
+        return limits
+
+    def clear_cache(self):
+        self._limits_cache.clear()
+
+    def _get_budget(self, domain_name, capacity, now):
+        budget, created = DomainSendBudget.objects.get_or_create(
+            domain_name=domain_name,
+            defaults={'tokens': capacity, 'last_refill': now, 'day': now.date()}
+        )
+        return budget
+
+    def try_acquire(self, domain_name, count=1, priority=DEFAULT_PRIORITY):
+        """
+        Take `count` tokens without waiting, leaving the reserve of the
+        priority classes above `priority` untouched.
+        Returns (granted, seconds_until_worth_retrying).
+        """
+        rate_per_hour, max_per_day = self.get_limits(domain_name)
+        if rate_per_hour <= 0 or max_per_day <= 0:
+            return False, float('inf')
+
+        rate = rate_per_hour / 3600.0
+        capacity = max(1.0, rate * get_limiter_setting('RATE_LIMIT_BURST_SECONDS', 60))
+        needed = min(count, capacity)
+        floor = reserved_floor(priority, capacity, needed)
+
+        for _ in range(self.MAX_UPDATE_RETRIES):
+            now = timezone.now()
+            today = now.date()
+            budget = self._get_budget(domain_name, capacity, now)
+
+            day_count = budget.day_count if budget.day == today else 0
+            if day_count + count > max_per_day:
+                tomorrow = datetime.combine(today + timedelta(days=1), datetime.min.time(), tzinfo=now.tzinfo)
+                return False, (tomorrow - now).total_seconds()
+
+            elapsed = max(0.0, (now - budget.last_refill).total_seconds())
+            tokens = min(capacity, budget.tokens + elapsed * rate)
+            if tokens - floor < needed:
+                return False, (needed + floor - tokens) / rate
+
+            updated = DomainSendBudget.objects.filter(id=budget.id, version=budget.version).update(
+                tokens=tokens - count,
+                last_refill=now,
+                day=today,
+                day_count=day_count + count,
+                version=F('version') + 1
+            )
+            if updated:
+                return True, 0.0
+
+        # Lost every race to other workers; back off briefly
+        return False, 0.05
+
+    def max_wait(self, priority=DEFAULT_PRIORITY):
+        """Longest wait for budget before a send gives up; interactive sends give up after seconds"""
+        if priority == INTERACTIVE:
+            return get_limiter_setting('RATE_LIMIT_INTERACTIVE_MAX_WAIT_SECONDS', 5)
+        return get_limiter_setting('RATE_LIMIT_MAX_WAIT_SECONDS', 300)
+
+    @contextmanager
+    def prepaid(self, domain_name):
+        """
+        The caller has already taken this thread's next send's tokens for
+        domain_name (try_acquire); the first acquire() for it in the block
+        returns at once
+        """
+        self._prepaid.domain = domain_name
+        try:
+            yield
+        finally:
+            self._prepaid.domain = None
+
+    def _wait_for(self, domain_name, count, timeout, priority):
+        """(granted, seconds until the budget could cover the send when refused)"""
+        if getattr(self._prepaid, 'domain', None) == domain_name:
+            self._prepaid.domain = None
+            return True, 0.0
+        if timeout is None:
+            timeout = self.max_wait(priority)
+        deadline = time.monotonic() + timeout
+
+        while True:
+            granted, wait = self.try_acquire(domain_name, count, priority=priority)
+            if granted:
+                return True, 0.0
+            if time.monotonic() + wait > deadline:
+                logger.warning(f"Rate limit budget exhausted for {domain_name} (retry in {wait:.0f}s)")
+                return False, wait
+            time.sleep(max(wait, 0.01))
+
+    def acquire(self, domain_name, count=1, timeout=None, priority=DEFAULT_PRIORITY):
+        """
+        Block until `count` tokens are available for the domain.
+        Returns False without waiting when the budget cannot recover within
+        `timeout` seconds (e.g. the daily cap has been reached).
+        """
+        return self._wait_for(domain_name, count, timeout, priority)[0]
+
+    def require(self, domain_name, count=1, timeout=None, priority=DEFAULT_PRIORITY):
+        """
+        acquire() for a send: a refusal raises a retryable rate_limit_failure,
+        the one classification every send path gives a throttled domain
+        """
+        granted, wait = self._wait_for(domain_name, count, timeout, priority)
+        if not granted:
+            raise rate_limit_failure(domain_name, wait)
+
+
+# Process-wide limiter; bucket state itself is shared through the database
+rate_limiter = DomainRateLimiter()
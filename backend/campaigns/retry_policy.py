@@ -0,0 +1,101 @@
+"""
+Send Retry Policy
+Classifies send failures as retryable (throttling, transient provider or
+network errors) or permanent, and computes jittered exponential backoff that
+never retries sooner than a provider's Retry-After.
+"""
+import random
+import smtplib
+from datetime import datetime, timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+from django.conf import settings
+
+# HTTP statuses worth retrying: timeouts, throttling and transient server errors
+RETRYABLE_HTTP_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Connection-level failures; the next attempt gets a fresh connection
+RETRYABLE_NETWORK_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def get_retry_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+class SendFailure(Exception):
+    """
+    A send refused without a provider exception (e.g. the domain's rate
+    budget ran out), carrying its own classification
+    """
+
+    def __init__(self, message, retryable=False, retry_after=None, status_code=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+def parse_retry_after(headers):
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date), or None"""
+    value = headers.get('Retry-After') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(dt_timezone.utc)).total_seconds())
+
+
+def classify_error(error):
+    """
+    (retryable, retry_after_seconds, status_code) for a failed send
+    Unknown exceptions are permanent: retrying a bug only repeats it.
+    """
+    if isinstance(error, SendFailure):
+        return error.retryable, error.retry_after, error.status_code
+
+    # python_http_client.HTTPError (SendGrid API)
+    status_code = getattr(error, 'status_code', None)
+    if isinstance(status_code, int):
+        return status_code in RETRYABLE_HTTP_STATUSES, parse_retry_after(getattr(error, 'headers', None)), status_code
+
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(400 <= code < 500 for code in codes), None, codes[0] if codes else None
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 4xx replies (421 busy, 451 local error, 452 storage) are temporary; 5xx are final
+        return 400 <= error.smtp_code < 500, None, error.smtp_code
+    if isinstance(error, RETRYABLE_NETWORK_ERRORS):
+        return True, None, None
+    return False, None, None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before retrying after failed attempt number `attempt`:
+    full-jitter exponential backoff, or just past the provider's Retry-After
+    """
+    base = get_retry_setting('SEND_RETRY_BASE_DELAY_SECONDS', 1)
+    if retry_after is not None:
+        # A little jitter on top so throttled sends don't all come back in the same instant
+        return retry_after + random.uniform(0, base)
+    cap = get_retry_setting('SEND_RETRY_MAX_DELAY_SECONDS', 60)
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def describe_error(error):
+    """DeadLetter fields for a failed send; error is None when the send just reported failure"""
+    if error is None:
+        return {'error_type': 'SendFailed', 'error_message': 'Send reported failure', 'status_code': None, 'retryable': False}
+
+    retryable, _, status_code = classify_error(error)
+    return {
+        'error_type': type(error).__name__,
+        'error_message': str(error)[:2000],
+        'status_code': status_code,
+        'retryable': retryable,
+    }
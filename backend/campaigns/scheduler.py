@@ -0,0 +1,138 @@
+"""
+Campaign Scheduler
+Starts 'scheduled' campaigns at scheduled_start (handing them to the send
+queue) and completes them at scheduled_end, cancelling their queued sends. Due campaigns are found through
+the (status, scheduled_start) / (status, scheduled_end) indexes and claimed
+with conditional updates, so several scheduler processes can run safely.
+"""
+import logging
+import time
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Campaign
+from .send_queue import cancel_queued_jobs, enqueue_campaign_send
+
+logger = logging.getLogger(__name__)
+
+# Statuses a campaign can be completed from when its window closes
+ENDABLE_STATUSES = ['scheduled', 'active', 'paused']
+
+
+def get_scheduler_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+def start_due_campaigns(now=None, batch_size=None):
+    """
+    Activate scheduled campaigns whose start time has passed and queue their sends.
+    A campaign whose send window cannot be planned is paused, so it is not
+    retried every pass; starting it again (after fixing its domain) resumes it.
+    Returns the ids of the campaigns this process started.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or get_scheduler_setting('SCHEDULER_BATCH_SIZE', 100)
+    due_ids = list(
+        Campaign.objects.filter(status='scheduled', scheduled_start__lte=now)
+        .filter(Q(scheduled_end__isnull=True) | Q(scheduled_end__gt=now))
+        .order_by('scheduled_start')
+        .values_list('id', flat=True)[:batch_size]
+    )
+
+    started = []
+    for campaign_id in due_ids:
+        try:
+            with transaction.atomic():
+                # Claim and enqueue together: a crash can't leave an active campaign without a send job
+                claimed = Campaign.objects.filter(id=campaign_id, status='scheduled').update(
+                    status='active',
+                    actual_start=now,
+                    updated_at=now
+                )
+                if not claimed:
+                    continue
+                campaign = Campaign.objects.get(id=campaign_id)
+                job = enqueue_campaign_send(campaign, user=campaign.created_by)
+        except ValueError as e:
+            # Send window could not be planned (e.g. the domain has no rate budget)
+            Campaign.objects.filter(id=campaign_id, status='scheduled').update(status='paused', updated_at=now)
+            logger.error(f"Could not start scheduled campaign #{campaign_id}, paused it: {e}")
+            continue
+
+        started.append(campaign_id)
+        logger.info(f"Scheduled campaign #{campaign_id} started, send job #{job.id}")
+    return started
+
+
+def complete_ended_campaigns(now=None, batch_size=None):
+    """
+    Complete campaigns whose scheduled_end has passed. Scheduled campaigns
+    whose whole window passed without starting are completed unsent.
+    Queued send jobs are cancelled with the campaign; a running one halts
+    through send_control, since 'completed' is a halt status.
+    Returns the number of campaigns completed.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or get_scheduler_setting('SCHEDULER_BATCH_SIZE', 100)
+    ended_ids = list(
+        Campaign.objects.filter(status__in=ENDABLE_STATUSES, scheduled_end__lte=now)
+        .order_by('scheduled_end')
+        .values_list('id', flat=True)[:batch_size]
+    )
+
+    completed = 0
+    for campaign_id in ended_ids:
+        with transaction.atomic():
+            claimed = Campaign.objects.filter(id=campaign_id, status__in=ENDABLE_STATUSES).update(
+                status='completed',
+                actual_end=now,
+                updated_at=now
+            )
+            if claimed:
+                cancel_queued_jobs(campaign_id)
+        completed += claimed
+    if completed:
+        logger.info(f"Completed {completed} campaign(s) at scheduled end")
+    return completed
+
+
+def next_wakeup(now=None, max_sleep=None):
+    """
+    Seconds until the next scheduled start or end, capped at max_sleep so
+    campaigns scheduled in the meantime are picked up. Only future moments
+    count: anything already due was handled by this pass.
+    """
+    now = now or timezone.now()
+    max_sleep = max_sleep or get_scheduler_setting('SCHEDULER_MAX_SLEEP_SECONDS', 30)
+
+    next_start = Campaign.objects.filter(status='scheduled', scheduled_start__gt=now) \
+        .order_by('scheduled_start').values_list('scheduled_start', flat=True).first()
+    next_end = Campaign.objects.filter(status__in=ENDABLE_STATUSES, scheduled_end__gt=now) \
+        .order_by('scheduled_end').values_list('scheduled_end', flat=True).first()
+
+    upcoming = [moment for moment in (next_start, next_end) if moment is not None]
+    if not upcoming:
+        return max_sleep
+    return max(0.0, min(max_sleep, (min(upcoming) - now).total_seconds()))
+
+
+def run_scheduler(once=False, max_sleep=None):
+    """
+    Start and complete campaigns as they come due, sleeping until the next
+    due time in between. Returns the number of campaigns started.
+    """
+    started = 0
+    while True:
+        now = timezone.now()
+        started_ids = start_due_campaigns(now)
+        completed = complete_ended_campaigns(now)
+        started += len(started_ids)
+
+        # A full batch means more are already due; go again without sleeping
+        batch_size = get_scheduler_setting('SCHEDULER_BATCH_SIZE', 100)
+        if len(started_ids) >= batch_size or completed >= batch_size:
+            continue
+        if once:
+            return started
+        time.sleep(next_wakeup(max_sleep=max_sleep))
@@ -0,0 +1,101 @@
+"""
+Campaign Send Context
+Everything the emails of one campaign run share (sending domain and its
+tracking flags, sender identity, compiled template) is resolved once before
+the first send. Domain and template statistics are counted in memory and
+written with one F() update per run instead of a read and a write per email.
+Template attachments are loaded (and encoded) once and shared by every message.
+"""
+import logging
+import threading
+from sendgrid.helpers.mail import ClickTracking, Mail, OpenTracking, TrackingSettings
+from django.db.models import F
+from django.utils import timezone
+from .attachments import load_template_attachments
+from .domain_models import EmailDomain
+from .personalization import compile_template
+from .rate_limiter import sender_domain
+
+logger = logging.getLogger(__name__)
+
+
+def build_tracking_settings(domain):
+    """SendGrid tracking settings for a custom domain's flags (None without a domain)"""
+    if domain is None:
+        return None
+    return TrackingSettings(
+        click_tracking=ClickTracking(enable=domain.click_tracking_enabled, enable_text=domain.click_tracking_enabled),
+        open_tracking=OpenTracking(enable=domain.open_tracking_enabled)
+    )
+
+
+class SendContext:
+    """
+    Per-run send state shared by every recipient
+
+    Safe to use from send engine worker threads: sends only read it, and
+    record_sent() just bumps a counter. Call flush() once the run is done.
+    """
+
+    def __init__(self, sender_email, subject, html_content, domain=None, template_id=None, attachments=None):
+        self.sender_email = sender_email
+        self.sender_domain = sender_domain(sender_email)
+        self.subject = subject
+        self.template = compile_template(html_content)
+        self.domain = domain
+        self.template_id = template_id
+        self.tracking_settings = build_tracking_settings(domain)
+        self.attachments = attachments or []
+        self._lock = threading.Lock()
+        self._sent = 0
+
+    @classmethod
+    def resolve(cls, sender_email, subject, html_content, domain_id=None, template_id=None):
+        """
+        Load the sending domain and the template's attachments once
+        Raises EmailDomain.DoesNotExist for an unknown domain_id
+        """
+        domain = EmailDomain.objects.get(id=domain_id) if domain_id else None
+        return cls(
+            sender_email, subject, html_content, domain=domain, template_id=template_id,
+            attachments=load_template_attachments(template_id)
+        )
+
+    def build_message(self, recipient_email, html_content=None, context=None):
+        """
+        SendGrid Mail for one recipient: the given HTML, or the context's
+        template rendered with `context`
+        """
+        if html_content is None:
+            html_content = self.template.render(context) if context else self.template.source
+        message = Mail(
+            from_email=self.sender_email,
+            to_emails=recipient_email,
+            subject=self.subject,
+            html_content=html_content
+        )
+        if self.tracking_settings is not None:
+            message.tracking_settings = self.tracking_settings
+        for attachment in self.attachments:
+            message.add_attachment(attachment.sendgrid_attachment)
+        return message
+
+    def record_sent(self):
+        with self._lock:
+            self._sent += 1
+
+    def flush(self):
+        """Write the run's domain and template statistics (one update each)"""
+        with self._lock:
+            sent, self._sent = self._sent, 0
+            template_id, self.template_id = self.template_id, None
+
+        if self.domain is not None and sent:
+            EmailDomain.objects.filter(id=self.domain.id).update(
+                emails_sent=F('emails_sent') + sent,
+                last_used=timezone.now()
+            )
+        if template_id:
+            from templates.models import Template
+            Template.objects.filter(id=template_id).update(usage_count=F('usage_count') + 1)
+        logger.debug(f"Send context flushed: {sent} sent via {self.sender_domain}")
@@ -0,0 +1,275 @@
+"""
+Async Send Engine
+Keeps a bounded number of sends in flight per provider and per sending
+domain. Provider calls (SendGrid HTTP, SMTP) are blocking, so the asyncio
+loop dispatches them onto a thread pool. A task with `tokens` waits for its
+domain's rate budget holding only its domain slot, so a throttled domain
+never sits on provider slots other domains could use; tasks without tokens
+wait inside the send itself. Sends that fail with a retryable
+error are retried with backoff (see retry_policy); while they wait they
+hold no slot, so up to one extra send per slot can be backing off.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from django.conf import settings
+from django.db import connections
+from .rate_limiter import rate_limit_failure, rate_limiter
+from .retry_policy import backoff_delay, classify_error
+from .send_priority import DEFAULT_PRIORITY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER_CONCURRENCY = {
+    'sendgrid': 10,
+    'smtp': 5,
+}
+
+
+def get_engine_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+# Callables notified with (task, seconds, error) after every send, e.g. the load test harness
+_send_observers = []
+
+
+def add_send_observer(observer):
+    _send_observers.append(observer)
+
+
+def remove_send_observer(observer):
+    if observer in _send_observers:
+        _send_observers.remove(observer)
+
+
+class SendTask:
+    """
+    One send for the engine: `send` is a blocking callable whose return value
+    is handed back with the task; `key` identifies the task to the caller.
+    `attempts` counts the calls made, retries included.
+    `tokens` is the rate budget the engine takes for `domain` (at `priority`)
+    before each attempt; the send's own rate_limiter.require() for that
+    domain then returns at once. 0 leaves the waiting to the send.
+    """
+
+    __slots__ = ('key', 'send', 'domain', 'provider', 'tokens', 'priority', 'attempts')
+
+    def __init__(self, key, send, domain='', provider='sendgrid', tokens=0, priority=DEFAULT_PRIORITY):
+        self.key = key
+        self.send = send
+        self.domain = domain
+        self.provider = provider
+        self.tokens = tokens
+        self.priority = priority
+        self.attempts = 0
+
+    def __repr__(self):
+        return f"<SendTask {self.key} via {self.provider}/{self.domain}>"
+
+
+class AsyncSendEngine:
+    """
+    Bounded-concurrency sender
+
+    Tasks are consumed lazily, so a 100k-recipient generator never holds more
+    than the in-flight tasks in memory. Results are delivered to the calling
+    thread in completion order, after any retries.
+
+    Tasks are still pulled in order, so while one domain stays throttled the
+    others can run ahead of it by at most the in-flight allowance.
+    """
+
+    def __init__(self, provider_concurrency=None, domain_concurrency=None, max_attempts=None):
+        self.provider_concurrency = provider_concurrency or get_engine_setting(
+            'SEND_CONCURRENCY_PER_PROVIDER', DEFAULT_PROVIDER_CONCURRENCY
+        )
+        self.domain_concurrency = domain_concurrency or get_engine_setting('SEND_CONCURRENCY_PER_DOMAIN', 10)
+        self.max_attempts = max_attempts or get_engine_setting('SEND_RETRY_MAX_ATTEMPTS', 4)
+
+    def provider_limit(self, provider):
+        return self.provider_concurrency.get(provider, DEFAULT_PROVIDER_CONCURRENCY.get(provider, 5))
+
+    @property
+    def max_workers(self):
+        return sum(self.provider_concurrency.values()) or 1
+
+    def retry_delay(self, task, error):
+        """Seconds to wait before retrying a failed task, or None to give up"""
+        if error is None or task.attempts >= self.max_attempts:
+            return None
+        retryable, retry_after, _ = classify_error(error)
+        if not retryable:
+            return None
+        if retry_after is not None and retry_after > get_engine_setting('SEND_RETRY_MAX_DELAY_SECONDS', 60):
+            # The provider wants longer than a send should hold its place; leave it to a replay
+            return None
+        return backoff_delay(task.attempts, retry_after)
+
+    def _call(self, task):
+        started = time.perf_counter()
+        task.attempts += 1
+        try:
+            with rate_limiter.prepaid(task.domain) if task.tokens else nullcontext():
+                result, error = task.send(), None
+        except Exception as e:
+            logger.error(f"Send task {task.key} failed (attempt {task.attempts}): {str(e)}")
+            result, error = None, e
+
+        for observer in list(_send_observers):
+            observer(task, time.perf_counter() - started, error)
+        return result, error
+
+    async def _dispatch(self, tasks, emit, stop):
+        loop = asyncio.get_running_loop()
+        workers = self.max_workers
+        provider_slots = {}
+        domain_slots = {}
+        in_flight = asyncio.Semaphore(workers)
+        backing_off = asyncio.Semaphore(workers)
+        pending = set()
+
+        async def take_budget(task):
+            """
+            Wait for the task's tokens; None once taken, or the error to report
+            (a retryable rate_limit_failure when the budget cannot recover in time, e.g. the daily cap)
+            """
+            deadline = loop.time() + rate_limiter.max_wait(task.priority)
+            while True:
+                try:
+                    granted, wait = await loop.run_in_executor(
+                        executor, rate_limiter.try_acquire, task.domain, task.tokens, task.priority
+                    )
+                except Exception as e:
+                    logger.error(f"Rate budget for send task {task.key} could not be checked: {str(e)}")
+                    return e
+                if granted:
+                    return None
+                if loop.time() + wait > deadline:
+                    logger.warning(f"Rate limit budget exhausted for {task.domain} (retry in {wait:.0f}s)")
+                    return rate_limit_failure(task.domain, wait)
+                await asyncio.sleep(max(wait, 0.01))
+
+        async def run_one(task):
+            domain_slot = domain_slots.setdefault(
+                (task.provider, task.domain), asyncio.Semaphore(self.domain_concurrency)
+            )
+            provider_slot = provider_slots.setdefault(
+                task.provider, asyncio.Semaphore(self.provider_limit(task.provider))
+            )
+            try:
+                while True:
+                    async with domain_slot:
+                        # Budget before the provider slot, so a throttled domain never holds
+                        # provider slots other domains could use
+                        error = await take_budget(task) if task.tokens else None
+                        if error is not None:
+                            emit((task, None, error))
+                            return
+                        async with provider_slot:
+                            result, error = await loop.run_in_executor(executor, self._call, task)
+                    delay = None if stop.is_set() else self.retry_delay(task, error)
+                    if delay is None:
+                        break
+                    logger.warning(f"Retrying send task {task.key} in {delay:.1f}s")
+                    if backing_off.locked():
+                        # As many sends are already backing off as there are slots; keep this
+                        # one's slot so the number of started-but-unfinished tasks stays bounded
+                        await asyncio.sleep(delay)
+                        continue
+                    # Back off outside every slot so other sends keep flowing
+                    async with backing_off:
+                        in_flight.release()
+                        try:
+                            await asyncio.sleep(delay)
+                        finally:
+                            await in_flight.acquire()
+                emit((task, result, error))
+            finally:
+                in_flight.release()
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='send-engine')
+        try:
+            tasks = iter(tasks)
+            while not stop.is_set():
+                # Take a slot before pulling the next task, so a task source that
+                # checks for pause/stop (CampaignControl.guard) is asked as late as possible
+                await in_flight.acquire()
+                task = next(tasks, None)
+                if task is None or stop.is_set():
+                    in_flight.release()
+                    break
+                future = asyncio.ensure_future(run_one(task))
+                pending.add(future)
+                future.add_done_callback(pending.discard)
+
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            await loop.run_in_executor(None, self._close_worker_connections, executor, workers)
+            executor.shutdown(wait=True)
+
+    def _close_worker_connections(self, executor, workers):
+        """Close the database connection each worker thread opened (rate limiter, stats)"""
+        barrier = threading.Barrier(workers)
+
+        def close():
+            try:
+                barrier.wait(timeout=5)
+            except threading.BrokenBarrierError:
+                pass
+            connections.close_all()
+
+        for future in [executor.submit(close) for _ in range(workers)]:
+            future.result()
+
+    def iter_results(self, tasks):
+        """
+        Run tasks and yield (task, result, error) as each send completes.
+        `tasks` is consumed on the engine thread, so it must not touch the database.
+        """
+        results = queue.Queue()
+        stop = threading.Event()
+        done = object()
+        failure = []
+
+        def runner():
+            try:
+                asyncio.run(self._dispatch(tasks, results.put, stop))
+            except Exception as e:
+                failure.append(e)
+            finally:
+                results.put(done)
+
+        thread = threading.Thread(target=runner, name='send-engine-loop', daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            # Caller stopped early: schedule nothing new, let in-flight sends finish
+            stop.set()
+            thread.join()
+
+        if failure:
+            raise failure[0]
+
+    def run(self, tasks, on_result=None):
+        """
+        Run tasks to completion, calling on_result(task, result, error) on the
+        calling thread for each one. Returns the number of tasks processed.
+        """
+        processed = 0
+        for task, result, error in self.iter_results(tasks):
+            processed += 1
+            if on_result:
+                on_result(task, result, error)
+        return processed
@@ -0,0 +1,50 @@
+"""
+Send Priority Classes
+Sends are tagged interactive (test emails an admin is waiting on), campaign
+(started and scheduled campaigns, launches) or bulk (multi-domain blasts).
+A class may not spend the slice of a domain's rate budget reserved for the
+classes above it, so a test email finds tokens waiting even while a large
+campaign drains the same domain. Interactive sends also get their own
+SendGrid connections (sendgrid_client).
+"""
+from django.conf import settings
+
+INTERACTIVE = 'interactive'
+CAMPAIGN = 'campaign'
+BULK = 'bulk'
+
+# Highest priority first
+PRIORITY_CLASSES = (INTERACTIVE, CAMPAIGN, BULK)
+
+DEFAULT_PRIORITY = CAMPAIGN
+
+DEFAULT_RESERVED_SHARES = {
+    INTERACTIVE: 0.1,
+    CAMPAIGN: 0.3,
+}
+
+
+def get_priority_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+def get_reserved_shares():
+    return get_priority_setting('SEND_PRIORITY_RESERVED_SHARES', DEFAULT_RESERVED_SHARES)
+
+
+def reserved_floor(priority, capacity, needed=1.0):
+    """
+    Tokens a `priority` send must leave in a bucket of `capacity`: the shares
+    reserved for every higher class, at least one token each so a test email
+    never waits for a refill. Never so high that the class could not send at all.
+    """
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown send priority: {priority}")
+
+    shares = get_reserved_shares()
+    floor = 0.0
+    for higher in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(priority)]:
+        share = shares.get(higher, 0)
+        if share > 0:
+            floor += max(capacity * share, 1.0)
+    return max(0.0, min(floor, capacity - needed))
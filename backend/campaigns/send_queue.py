@@ -0,0 +1,483 @@
+"""
+Background Send Queue
+Database-backed job queue so campaign sends run in worker processes instead of the HTTP request
+"""
+import logging
+import os
+import socket
+import time
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Campaign, CampaignTarget, DeadLetter, SendJob
+from .retry_policy import describe_error
+from .suppression import split_suppressed
+from .send_control import HALT_STATUSES, CampaignControl
+from .attachments import load_template_attachments
+
+logger = logging.getLogger(__name__)
+
+
+def get_queue_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_campaign_send(campaign, user=None):
+    """
+    Queue a send job for every target of an existing campaign
+    With a send window the targets are planned into per-minute slots first,
+    and the job is not claimable before the first slot.
+    """
+    run_after = None
+    if campaign.send_window_enabled:
+        from .send_window import plan_campaign_sends
+        run_after = plan_campaign_sends(campaign)['first_send_at']
+
+    return SendJob.objects.create(
+        job_type='campaign',
+        campaign=campaign,
+        created_by=user,
+        total_count=campaign.targets.count(),
+        run_after=run_after
+    )
+
+
+def enqueue_launch(payload, user=None):
+    """
+    Queue a quick launch (launch_campaign payload) for the send worker
+    """
+    return SendJob.objects.create(
+        job_type='launch',
+        payload=payload,
+        created_by=user,
+        total_count=len(payload.get('target_emails', []))
+    )
+
+
+def start_inline_launch(payload, user=None, worker_id=None):
+    """
+    Record a quick launch that the current process sends itself (streaming
+    launch). The job is created already running so no worker can claim it.
+    """
+    now = timezone.now()
+    return SendJob.objects.create(
+        job_type='launch',
+        status='running',
+        payload=payload,
+        created_by=user,
+        total_count=len(payload.get('target_emails', [])),
+        worker_id=worker_id or f"inline:{default_worker_id()}",
+        attempts=1,
+        started_at=now,
+        heartbeat_at=now
+    )
+
+
+def reclaim_stale_jobs():
+    """
+    Requeue running jobs whose worker stopped checkpointing (crashed or killed).
+    Campaign jobs resume from their still-pending targets; launch jobs have no
+    per-target record to resume from, so they are failed rather than resent.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=get_queue_setting('SEND_JOB_STALE_SECONDS', 900))
+    max_attempts = get_queue_setting('SEND_JOB_MAX_ATTEMPTS', 3)
+    stale = SendJob.objects.filter(status='running').filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+
+    reclaimed = 0
+    for job in stale:
+        # Conditional on the heartbeat we read, so a job that just checkpointed is left alone
+        still_stale = SendJob.objects.filter(id=job.id, status='running', heartbeat_at=job.heartbeat_at)
+        if job.job_type == 'campaign' and job.attempts < max_attempts:
+            updated = still_stale.update(status='queued', worker_id='')
+            if updated:
+                logger.warning(f"Requeued stale send job #{job.id} (worker {job.worker_id})")
+        else:
+            updated = still_stale.update(
+                status='failed',
+                error=f"Worker {job.worker_id} stopped after {job.processed_count} of {job.total_count} sends",
+                finished_at=now
+            )
+            if updated:
+                logger.warning(f"Failed stale send job #{job.id} (worker {job.worker_id})")
+        reclaimed += updated
+    return reclaimed
+
+
+def claim_next_job(worker_id):
+    """
+    Atomically claim the oldest queued job, or return None when the queue is empty
+    The conditional UPDATE means two workers can never claim the same job
+    """
+    reclaim_stale_jobs()
+    candidate_ids = list(
+        SendJob.objects.filter(status='queued')
+        .filter(Q(run_after__isnull=True) | Q(run_after__lte=timezone.now()))
+        .order_by('created_at').values_list('id', flat=True)[:10]
+    )
+    for job_id in candidate_ids:
+        claimed = SendJob.objects.filter(id=job_id, status='queued').update(
+            status='running',
+            worker_id=worker_id,
+            started_at=timezone.now(),
+            heartbeat_at=timezone.now(),
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return SendJob.objects.get(id=job_id)
+    return None
+
+
+class JobProgress:
+    """
+    Collects per-recipient results and checkpoints them onto the job, the
+    campaign and its targets every `flush_every` results (or `flush_seconds`)
+
+    Target status and job counts are written in one transaction, so after a
+    crash every target is either still 'pending' or recorded as sent/failed.
+    Failed recipients are written to the dead-letter table in the same
+    transaction. The message id a send was tagged with is stored on its
+    target so SendGrid webhook events can find it (sendgrid_events).
+    """
+
+    def __init__(self, job, flush_every=None, flush_seconds=None):
+        self.job = job
+        self.flush_every = flush_every or get_queue_setting('SEND_PROGRESS_FLUSH_EVERY', 25)
+        self.flush_seconds = flush_seconds or get_queue_setting('SEND_PROGRESS_FLUSH_SECONDS', 5)
+        self.sent = job.sent_count
+        self.failed = job.failed_count
+        self.target_ids = {}  # email -> CampaignTarget id for campaign jobs
+        self.campaign_sent_offset = 0  # Campaign sends recorded by earlier jobs
+        self._checkpoint = []
+        self._dead_letters = []
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def record(self, recipient, success, error=None, attempts=1, message_id=None):
+        if success:
+            self.sent += 1
+        else:
+            self.failed += 1
+            self._dead_letters.append(
+                DeadLetter(
+                    job=self.job,
+                    campaign=self.job.campaign,
+                    email=recipient,
+                    attempts=attempts,
+                    **describe_error(error)
+                )
+            )
+
+        target_id = self.target_ids.get(recipient)
+        if target_id is not None:
+            self._checkpoint.append(
+                CampaignTarget(
+                    id=target_id,
+                    status='sent' if success else 'failed',
+                    email_sent_at=timezone.now() if success else None,
+                    provider_message_id=message_id or '',
+                    updated_at=timezone.now()
+                )
+            )
+
+        self._pending += 1
+        if self._pending >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        targets, self._checkpoint = self._checkpoint, []
+        dead_letters, self._dead_letters = self._dead_letters, []
+
+        with transaction.atomic():
+            if targets:
+                CampaignTarget.objects.bulk_update(
+                    targets, ['status', 'email_sent_at', 'provider_message_id', 'updated_at']
+                )
+            if dead_letters:
+                DeadLetter.objects.bulk_create(dead_letters)
+
+            self.job.sent_count = self.sent
+            self.job.failed_count = self.failed
+            self.job.heartbeat_at = timezone.now()
+            self.job.save(update_fields=['sent_count', 'failed_count', 'heartbeat_at'])
+
+            campaign = self.job.campaign
+            if campaign is not None:
+                # save() rather than update() so the post_save signal pushes live stats to the dashboard
+                campaign.emails_sent = self.campaign_sent_offset + self.sent
+                campaign.save(update_fields=['emails_sent', 'updated_at'])
+
+
+def build_campaign_template_data(campaign):
+    """Template data used for every email in a campaign"""
+    return {
+        'subject': campaign.template.email_subject,
+        'html_content': campaign.template.html_content,
+        'sender_name': campaign.template.sender_name or 'IT Security Team',
+        'sender_email': campaign.template.sender_email or 'security@company.com',
+        'target_domain': getattr(campaign.template, 'domain', 'company.com'),
+        'use_spoofing': True,
+        # Encoded once per run (and cached across runs), shared by every message
+        'attachments': load_template_attachments(campaign.template_id)
+    }
+
+
+def run_campaign_job(job, progress):
+    """
+    Send every still-pending target of job.campaign
+    A requeued job picks up where the previous worker's last checkpoint left off
+
+    For a send-window campaign only targets whose slot has come are sent;
+    job.run_after is moved to the next slot so run_job requeues the job.
+    Targets added to the suppression list since import are marked suppressed.
+    Pausing or stopping the campaign halts the send (see send_control); the
+    targets not reached stay pending for the resume.
+    """
+    from .simple_email_service import SimpleSendGridService
+    from .email_service import PhishingEmailService
+
+    campaign = job.campaign
+
+    # Initialize simplified email service for now
+    try:
+        email_service = SimpleSendGridService(campaign)
+    except Exception:
+        email_service = PhishingEmailService(campaign)
+
+    pending = CampaignTarget.objects.filter(campaign=campaign, status='pending')
+    if campaign.send_window_enabled:
+        now = timezone.now()
+        job.run_after = pending.filter(scheduled_send_at__gt=now).order_by('scheduled_send_at') \
+            .values_list('scheduled_send_at', flat=True).first()
+        pending = pending.filter(Q(scheduled_send_at__isnull=True) | Q(scheduled_send_at__lte=now))
+
+    progress.target_ids = dict(pending.values_list('email', 'id'))
+    target_emails, suppressed = split_suppressed(list(progress.target_ids))
+    if suppressed:
+        CampaignTarget.objects.filter(id__in=[progress.target_ids.pop(email) for email in suppressed]) \
+            .update(status='suppressed')
+    already_sent = campaign.targets.exclude(status__in=['pending', 'failed', 'suppressed']).count()
+    progress.campaign_sent_offset = already_sent - progress.sent
+    if progress.sent or progress.failed:
+        logger.info(f"Resuming send job #{job.id}: {len(target_emails)} targets still pending")
+    template_data = build_campaign_template_data(campaign)
+
+    with CampaignControl(campaign.id) as control:
+        email_service.send_campaign_emails(
+            target_emails, template_data, on_result=progress.record, control=control
+        )
+    progress.flush()
+
+    # Only the counters: status may have been changed by a pause/stop meanwhile
+    campaign.emails_sent = progress.campaign_sent_offset + progress.sent
+    campaign.target_count = campaign.targets.count()
+    campaign.save(update_fields=['emails_sent', 'target_count', 'updated_at'])
+
+    result = {
+        'emails_sent': progress.sent,
+        'emails_failed': progress.failed,
+        'total_targets': campaign.target_count
+    }
+    if control.halted:
+        job.run_after = None
+        result['halted'] = control.halted
+    return result
+
+
+def run_launch_job(job, progress):
+    """Send a quick launch stored in job.payload"""
+    from .campaign_launch_service import iter_launch_results
+
+    for result in iter_launch_results(job.payload):
+        progress.record(result['recipient'], result['success'], result.get('error'), result.get('attempts', 1))
+    progress.flush()
+
+    return build_launch_summary(job, progress)
+
+
+def build_launch_summary(job, progress):
+    """Final result stored on a launch job"""
+    total = job.total_count
+    success_rate = round((progress.sent / total) * 100, 2) if total else 0
+    return {
+        'campaign_name': job.payload.get('name'),
+        'successful_sends': progress.sent,
+        'failed_sends': progress.failed,
+        'total_targets': total,
+        'success_rate': success_rate
+    }
+
+
+JOB_RUNNERS = {
+    'campaign': run_campaign_job,
+    'launch': run_launch_job,
+}
+
+
+def run_job(job):
+    """
+    Drain a claimed job and record its final status
+    """
+    progress = JobProgress(job)
+    logger.info(f"Running send job #{job.id} ({job.job_type}, {job.total_count} targets)")
+
+    try:
+        result = JOB_RUNNERS[job.job_type](job, progress)
+    except Exception as e:
+        logger.exception(f"Send job #{job.id} failed")
+        return finish_job(job, progress, error=str(e))
+
+    if result.get('halted'):
+        return cancel_job(job, progress, result)
+    if job.run_after and job.run_after > timezone.now():
+        return requeue_job(job, progress, result)
+    return finish_job(job, progress, result=result)
+
+
+def requeue_job(job, progress, result=None):
+    """
+    Hand a partly sent job back to the queue until job.run_after (the next
+    send-window slot). Attempts restart since the worker did not fail.
+    """
+    progress.flush()
+    if result is not None:
+        job.result = result
+    job.status = 'queued'
+    job.worker_id = ''
+    job.attempts = 0
+    job.save(update_fields=['status', 'result', 'worker_id', 'attempts', 'run_after'])
+    logger.info(f"Send job #{job.id} waiting for next send slot at {job.run_after}: {progress.sent} sent so far")
+    return job
+
+
+def cancel_job(job, progress, result):
+    """
+    End a job whose campaign was paused or stopped mid-send. Resuming the
+    campaign queues a new job for the targets still pending.
+    """
+    progress.flush()
+    job.result = result
+    job.status = 'cancelled'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'run_after', 'finished_at'])
+    logger.info(f"Send job #{job.id} halted (campaign {result['halted']}): {progress.sent} sent before the halt")
+    return job
+
+
+def cancel_queued_jobs(campaign):
+    """Cancel a campaign's jobs that have not started; running ones halt via CampaignControl"""
+    return SendJob.objects.filter(campaign=campaign, status='queued').update(
+        status='cancelled', finished_at=timezone.now()
+    )
+
+
+def finish_job(job, progress, result=None, error=None):
+    """
+    Checkpoint remaining progress and record a job's final status
+    """
+    progress.flush()
+    if result is not None:
+        job.result = result
+    job.status = 'failed' if error else 'completed'
+    job.error = error or ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+    logger.info(f"Send job #{job.id} {job.status}: {progress.sent} sent, {progress.failed} failed")
+    return job
+
+
+def replay_dead_letters(dead_letters, user=None):
+    """
+    Send pending dead letters again. Campaign recipients go back to 'pending'
+    and are sent by a new campaign job (or by one already queued); launch
+    recipients are resent as one new launch job per original launch.
+    Campaigns with a running job are skipped: that job's pending set is
+    already fixed, and a second job would resend it. So are paused, stopped
+    or finished campaigns, whose job would halt without sending; their
+    letters stay pending until the campaign is active again.
+    Returns (replayed count, skipped count, jobs).
+    """
+    letters = list(dead_letters.filter(status='pending').select_related('job').order_by('id'))
+    by_campaign = defaultdict(list)
+    by_launch = defaultdict(list)
+    skipped = 0
+    for letter in letters:
+        if letter.campaign_id:
+            by_campaign[letter.campaign_id].append(letter)
+        elif letter.job_id and letter.job.job_type == 'launch':
+            by_launch[letter.job_id].append(letter)
+        else:
+            skipped += 1
+
+    now = timezone.now()
+    replayed = 0
+    jobs = []
+    with transaction.atomic():
+        halted = set(
+            Campaign.objects.filter(id__in=list(by_campaign), status__in=HALT_STATUSES).values_list('id', flat=True)
+        )
+        for campaign_id, group in by_campaign.items():
+            active_jobs = SendJob.objects.filter(campaign_id=campaign_id, status__in=['queued', 'running'])
+            if campaign_id in halted or active_jobs.filter(status='running').exists():
+                skipped += len(group)
+                continue
+
+            emails = {letter.email for letter in group}
+            CampaignTarget.objects.filter(campaign_id=campaign_id, email__in=emails).update(
+                status='pending', scheduled_send_at=None, updated_at=now
+            )
+            job = active_jobs.first()
+            if job is None:
+                job = SendJob.objects.create(
+                    job_type='campaign',
+                    campaign=Campaign.objects.get(id=campaign_id),
+                    created_by=user,
+                    total_count=len(emails)
+                )
+            jobs.append(job)
+            replayed += DeadLetter.objects.filter(id__in=[letter.id for letter in group]).update(
+                status='replayed', replay_job=job, replayed_at=now
+            )
+
+        for group in by_launch.values():
+            original = group[0].job
+            emails = list(dict.fromkeys(letter.email for letter in group))
+            job = enqueue_launch(dict(original.payload, target_emails=emails), user=user)
+            jobs.append(job)
+            replayed += DeadLetter.objects.filter(id__in=[letter.id for letter in group]).update(
+                status='replayed', replay_job=job, replayed_at=now
+            )
+
+    logger.info(f"Replayed {replayed} dead letter(s) in {len(jobs)} job(s), skipped {skipped}")
+    return replayed, skipped, jobs
+
+
+def run_worker(worker_id=None, poll_interval=None, once=False):
+    """
+    Claim and run jobs until interrupted (or until the queue is empty when once=True)
+    """
+    worker_id = worker_id or default_worker_id()
+    poll_interval = poll_interval or get_queue_setting('SEND_WORKER_POLL_SECONDS', 2)
+    processed = 0
+
+    while True:
+        job = claim_next_job(worker_id)
+        if job is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+
+        run_job(job)
+        processed += 1
@@ -0,0 +1,177 @@
+"""
+Campaign Send Windows
+Spreads a campaign's pending targets across local business hours as a
+per-minute send plan (CampaignTarget.scheduled_send_at). No minute in the plan
+holds more sends than the sending domain's rate budget allows.
+"""
+import logging
+import math
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import CampaignTarget
+from .rate_limiter import rate_limiter, sender_domain
+
+logger = logging.getLogger(__name__)
+
+UTC_OFFSET_RE = re.compile(r'^UTC\s*([+-])\s*(\d{1,2})(?::?(\d{2}))?$')
+
+MINUTE = timedelta(minutes=1)
+
+
+def get_window_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+def parse_utc_offset(value):
+    """tzinfo for a Company.timezone value such as 'UTC+8' or 'UTC-5'; UTC if unparseable"""
+    match = UTC_OFFSET_RE.match((value or '').strip())
+    if not match:
+        return dt_timezone.utc
+    sign, hours, minutes = match.groups()
+    offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+    return dt_timezone(-offset if sign == '-' else offset, name=value)
+
+
+def window_minutes(campaign):
+    """Length of the daily send window in minutes"""
+    start = campaign.send_window_start.hour * 60 + campaign.send_window_start.minute
+    end = campaign.send_window_end.hour * 60 + campaign.send_window_end.minute
+    if end <= start:
+        raise ValueError('Send window end must be after its start')
+    return end - start
+
+
+def next_window_open(moment, tz, campaign):
+    """Earliest UTC minute at or after `moment` that falls inside the local send window"""
+    local = moment.astimezone(tz)
+    for days_ahead in range(8):
+        day = local.date() + timedelta(days=days_ahead)
+        if campaign.send_window_weekdays_only and day.weekday() >= 5:
+            continue
+        opens = datetime.combine(day, campaign.send_window_start, tzinfo=tz)
+        closes = datetime.combine(day, campaign.send_window_end, tzinfo=tz)
+        if local < closes:
+            return max(local, opens).astimezone(dt_timezone.utc)
+    raise ValueError('Send window never opens')
+
+
+def in_window(moment, tz, campaign):
+    local = moment.astimezone(tz)
+    if campaign.send_window_weekdays_only and local.weekday() >= 5:
+        return False
+    return campaign.send_window_start <= local.time() < campaign.send_window_end
+
+
+def resolve_target_timezones(campaign, targets):
+    """
+    Group (id, email) targets by local UTC offset. Targets of an organization
+    campaign use the company's timezone; otherwise each target's employee
+    record decides, falling back to UTC.
+    """
+    from employees.models import Employee
+
+    default = campaign.organization.timezone if campaign.organization_id else 'UTC+0'
+    zones = {}
+    if not campaign.organization_id:
+        chunk_size = get_window_setting('MERGE_FIELD_CHUNK_SIZE', 500)
+        for start in range(0, len(targets), chunk_size):
+            emails = [email for _, email in targets[start:start + chunk_size]]
+            zones.update(
+                Employee.objects.filter(email__in=emails, organization__isnull=False)
+                .values_list('email', 'organization__timezone')
+            )
+
+    groups = {}
+    for target_id, email in targets:
+        groups.setdefault(zones.get(email, default), []).append(target_id)
+    return groups
+
+
+def get_minute_budget(campaign):
+    """(sends per minute, sends per day) allowed for the campaign's sending domain"""
+    sender = campaign.template.sender_email or 'security@company.com'
+    rate_per_hour, max_per_day = rate_limiter.get_limits(sender_domain(sender))
+    per_minute = min(rate_per_hour / 60.0, get_window_setting('SEND_WINDOW_MAX_PER_MINUTE', 600))
+    return per_minute, max_per_day
+
+
+def plan_campaign_sends(campaign, start=None):
+    """
+    Assign every pending target a scheduled_send_at minute.
+
+    Each timezone group is paced to finish within one local send window,
+    spilling into following windows only when the rate budget is exhausted.
+    Returns a summary of the plan.
+    """
+    start = start or timezone.now()
+    start = (start + MINUTE - timedelta(microseconds=1)).replace(second=0, microsecond=0)
+    per_minute, max_per_day = get_minute_budget(campaign)
+    if per_minute <= 0 or max_per_day <= 0:
+        raise ValueError('Sending domain has no rate budget')
+
+    targets = list(
+        CampaignTarget.objects.filter(campaign=campaign, status='pending').order_by('id').values_list('id', 'email')
+    )
+    minutes_per_window = window_minutes(campaign)
+    queues = [
+        {'tz': parse_utc_offset(zone), 'ids': ids, 'next': 0, 'pace': math.ceil(len(ids) / minutes_per_window)}
+        for zone, ids in resolve_target_timezones(campaign, targets).items()
+    ]
+
+    assignments = []
+    plan = Counter()
+    day_counts = Counter()
+    credit = 0.0
+    minute = start
+    turn = 0
+
+    while any(q['next'] < len(q['ids']) for q in queues):
+        waiting = [q for q in queues if q['next'] < len(q['ids'])]
+        active = [q for q in waiting if in_window(minute, q['tz'], campaign)]
+        if not active:
+            minute = min(next_window_open(minute, q['tz'], campaign) for q in waiting)
+            continue
+
+        # Budget accrues per minute; a sub-1/minute rate sends one every few minutes
+        credit = min(credit + per_minute, max(per_minute, 1.0))
+        available = min(int(credit), max_per_day - day_counts[minute.date()])
+        if available <= 0:
+            minute += MINUTE
+            continue
+
+        # Rotate which group goes first so no timezone starves the others
+        turn = (turn + 1) % len(active)
+        for q in active[turn:] + active[:turn]:
+            take = min(q['pace'], len(q['ids']) - q['next'], available)
+            if take <= 0:
+                continue
+            assignments.extend((target_id, minute) for target_id in q['ids'][q['next']:q['next'] + take])
+            q['next'] += take
+            available -= take
+            credit -= take
+            plan[minute] += take
+            day_counts[minute.date()] += take
+
+        minute += MINUTE
+
+    with transaction.atomic():
+        CampaignTarget.objects.bulk_update(
+            [CampaignTarget(id=target_id, scheduled_send_at=slot) for target_id, slot in assignments],
+            ['scheduled_send_at'],
+            batch_size=1000
+        )
+
+    summary = {
+        'targets': len(assignments),
+        'timezones': len(queues),
+        'per_minute_budget': round(per_minute, 2),
+        'busiest_minute': max(plan.values(), default=0),
+        'first_send_at': min(plan) if plan else None,
+        'last_send_at': max(plan) if plan else None,
+    }
+    logger.info(f"Send plan for campaign #{campaign.id}: {summary}")
+    return summary
@@ -0,0 +1,143 @@
+"""
+Shared SendGrid Client
+One process-wide SendGridAPIClient whose HTTP calls go through a pooled,
+keep-alive requests.Session instead of a fresh urllib connection per call.
+Interactive sends (test emails) get a second, small client of their own so
+they never wait for a connection behind a campaign filling the main pool.
+"""
+import io
+import logging
+import threading
+import urllib.error
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from python_http_client import Client
+from python_http_client.exceptions import handle_error
+from sendgrid import SendGridAPIClient
+from .send_priority import INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+
+def get_client_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+class _PooledResponse:
+    """Adapts a requests.Response to the urllib response interface python_http_client reads"""
+
+    def __init__(self, response):
+        self._response = response
+
+    def getcode(self):
+        return self._response.status_code
+
+    def read(self):
+        return self._response.content
+
+    def info(self):
+        return self._response.headers
+
+
+class PooledHTTPClient(Client):
+    """
+    python_http_client.Client that sends every request over a shared
+    requests.Session, so TCP/TLS connections are kept alive and reused
+    """
+
+    def __init__(self, session, host, **kwargs):
+        super().__init__(host, **kwargs)
+        self._session = session
+
+    def _build_client(self, name=None):
+        url_path = self._url_path + [name] if name else self._url_path
+        return PooledHTTPClient(
+            self._session,
+            host=self.host,
+            version=self._version,
+            request_headers=self.request_headers,
+            url_path=url_path,
+            append_slash=self.append_slash,
+            timeout=self.timeout
+        )
+
+    def _make_request(self, opener, request, timeout=None):
+        response = self._session.request(
+            request.get_method(),
+            request.get_full_url(),
+            data=request.data,
+            headers=dict(request.header_items()),
+            timeout=timeout or self.timeout
+        )
+
+        if response.status_code >= 400:
+            # Raise the same typed errors (BadRequestsError, ...) the urllib transport raises
+            error = urllib.error.HTTPError(
+                request.get_full_url(), response.status_code, response.reason,
+                response.headers, io.BytesIO(response.content)
+            )
+            raise handle_error(error)
+
+        return _PooledResponse(response)
+
+
+def build_session(pool_size=None):
+    """requests.Session with a keep-alive connection pool sized from settings"""
+    if pool_size is None:
+        pool_size = get_client_setting('SENDGRID_POOL_SIZE', 10)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def build_sendgrid_client(api_key=None, session=None):
+    """
+    SendGridAPIClient using the pooled transport
+    """
+    api_key = api_key if api_key is not None else settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY')
+    host = get_client_setting('SENDGRID_API_HOST', 'https://api.sendgrid.com')
+    timeout = (
+        get_client_setting('SENDGRID_CONNECT_TIMEOUT', 5),
+        get_client_setting('SENDGRID_READ_TIMEOUT', 30),
+    )
+
+    sg = SendGridAPIClient(api_key=api_key, host=host)
+    sg.client = PooledHTTPClient(
+        session or build_session(),
+        host=host,
+        request_headers=sg._default_headers,
+        version=3,
+        timeout=timeout
+    )
+    return sg
+
+
+_client_lock = threading.Lock()
+# lane -> (settings key, client)
+_shared_clients = {}
+
+
+def get_sendgrid_client(priority=None):
+    """
+    Process-wide SendGrid client shared by every caller.
+    priority='interactive' returns the client reserved for test emails.
+    Rebuilt only if the API key or host setting changes.
+    """
+    lane = INTERACTIVE if priority == INTERACTIVE else 'shared'
+    key = (
+        settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY'),
+        get_client_setting('SENDGRID_API_HOST', 'https://api.sendgrid.com'),
+    )
+    with _client_lock:
+        cached = _shared_clients.get(lane)
+        if cached is None or cached[0] != key:
+            session = None
+            if lane == INTERACTIVE:
+                session = build_session(get_client_setting('SENDGRID_INTERACTIVE_POOL_SIZE', 2))
+            cached = (key, build_sendgrid_client(api_key=key[0], session=session))
+            _shared_clients[lane] = cached
+            logger.info(f"SendGrid {lane} client initialized for {key[1]}")
+        return cached[1]
@@ -0,0 +1,261 @@
+"""
+SendGrid Event Webhook
+SendGrid POSTs delivery and engagement events in batches of up to several
+hundred per request. The signed body is verified, the JSON array is decoded
+one event at a time, and the batch is applied in a single transaction: one
+query loads the targets, then one bulk_update, one bulk_create of
+CampaignEvents and one counter update per campaign.
+
+Campaign sends tag every message with a MESSAGE_ID_ARG unique arg (the
+X-SMTPAPI header on the SMTP relay). SendGrid echoes it on every event, and
+the same id is stored on CampaignTarget.provider_message_id when the send
+is recorded.
+"""
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from sendgrid.helpers.eventwebhook import EventWebhook
+from .models import Campaign, CampaignEvent, CampaignTarget
+from .suppression import suppress
+
+logger = logging.getLogger(__name__)
+
+# Unique arg carrying our per-message id through SendGrid
+MESSAGE_ID_ARG = 'hs_message_id'
+
+SIGNATURE_HEADER = 'X-Twilio-Email-Event-Webhook-Signature'
+TIMESTAMP_HEADER = 'X-Twilio-Email-Event-Webhook-Timestamp'
+
+# Status progression; events never move a target backwards
+STATUS_RANK = {status: rank for rank, status in enumerate(
+    ['pending', 'sent', 'opened', 'clicked', 'submitted', 'downloaded']
+)}
+
+# SendGrid event -> (target status, first-seen timestamp field, CampaignEvent type, Campaign counter)
+ENGAGEMENT_EVENTS = {
+    'open': ('opened', 'email_opened_at', 'email_opened', 'emails_opened'),
+    'click': ('clicked', 'link_clicked_at', 'link_clicked', 'links_clicked'),
+}
+
+BOUNCE_EVENTS = ('bounce', 'dropped')
+
+# SendGrid event -> SuppressedEmail reason
+SUPPRESS_EVENTS = {
+    'bounce': 'bounce',
+    'spamreport': 'complaint',
+    'unsubscribe': 'unsubscribe',
+    'group_unsubscribe': 'unsubscribe',
+}
+
+WHITESPACE = re.compile(r'\s*')
+
+
+class WebhookSignatureError(Exception):
+    """The webhook request is not signed by SendGrid (or too old to trust)"""
+
+
+def get_events_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+def new_message_id():
+    return uuid.uuid4().hex
+
+
+def smtpapi_header(message_id):
+    """X-SMTPAPI header value that makes SendGrid echo message_id on the message's events"""
+    return json.dumps({'unique_args': {MESSAGE_ID_ARG: message_id}})
+
+
+_verifier_lock = threading.Lock()
+_verifier = (None, None)  # (verification key, EventWebhook)
+
+
+def get_verifier(public_key):
+    """EventWebhook for the key, parsed once per process rather than per request"""
+    global _verifier
+    with _verifier_lock:
+        if _verifier[0] != public_key:
+            _verifier = (public_key, EventWebhook(public_key))
+        return _verifier[1]
+
+
+def verify_signature(payload, signature, timestamp, public_key=None):
+    """
+    Check SendGrid's ECDSA signature over timestamp + body
+    Raises WebhookSignatureError when the key is not configured, the
+    signature does not match or the timestamp is outside the allowed skew.
+    """
+    public_key = public_key or get_events_setting('SENDGRID_WEBHOOK_VERIFICATION_KEY', '')
+    if not public_key:
+        raise WebhookSignatureError('Event webhook verification key is not configured')
+    if not signature or not timestamp:
+        raise WebhookSignatureError('Missing signature headers')
+
+    try:
+        age = abs(time.time() - int(timestamp))
+    except ValueError:
+        raise WebhookSignatureError('Malformed timestamp')
+    if age > get_events_setting('SENDGRID_WEBHOOK_MAX_AGE_SECONDS', 600):
+        raise WebhookSignatureError('Timestamp outside the allowed window')
+
+    try:
+        verifier = get_verifier(public_key)
+        valid = verifier.verify_signature(payload.decode('utf-8'), signature, timestamp)
+    except Exception as e:
+        raise WebhookSignatureError(f'Signature could not be checked: {e}')
+    if not valid:
+        raise WebhookSignatureError('Signature mismatch')
+
+
+def iter_events(payload):
+    """
+    Decode a JSON array one element at a time
+    Raises ValueError for anything that is not a JSON array.
+    """
+    text = payload.decode('utf-8') if isinstance(payload, bytes) else payload
+    decoder = json.JSONDecoder()
+
+    index = WHITESPACE.match(text, 0).end()
+    if text[index:index + 1] != '[':
+        raise ValueError('Expected a JSON array of events')
+    index = WHITESPACE.match(text, index + 1).end()
+    if text[index:index + 1] == ']':
+        return
+
+    while True:
+        event, index = decoder.raw_decode(text, index)
+        yield event
+        index = WHITESPACE.match(text, index).end()
+        separator = text[index:index + 1]
+        index = WHITESPACE.match(text, index + 1).end()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f'Unexpected {separator!r} at position {index} in event array')
+
+
+def event_time(event):
+    try:
+        return datetime.fromtimestamp(int(event['timestamp']), tz=dt_timezone.utc)
+    except (KeyError, TypeError, ValueError):
+        return timezone.now()
+
+
+def apply_events(events):
+    """
+    Apply a batch of SendGrid events to campaign targets in one transaction
+    An event names its target by message id, or (tracking hits from signed
+    tokens) by campaign_id and target_id. Events that match no target
+    (tests, launches, other systems on the same account) are counted and ignored.
+    """
+    events = [
+        event for event in events
+        if isinstance(event, dict) and (event.get(MESSAGE_ID_ARG) or event.get('target_id'))
+    ]
+    rows = CampaignTarget.objects.filter(
+        Q(provider_message_id__in={event[MESSAGE_ID_ARG] for event in events if event.get(MESSAGE_ID_ARG)})
+        | Q(id__in={event['target_id'] for event in events if event.get('target_id')})
+    ).only('id', 'campaign_id', 'email', 'status', 'email_opened_at', 'link_clicked_at', 'provider_message_id')
+    by_message_id, by_id = {}, {}
+    for target in rows:
+        by_id[target.id] = target
+        if target.provider_message_id:
+            by_message_id[target.provider_message_id] = target
+
+    def find_target(event):
+        if event.get('target_id'):
+            target = by_id.get(event['target_id'])
+            return target if target is not None and target.campaign_id == event.get('campaign_id') else None
+        return by_message_id.get(event[MESSAGE_ID_ARG])
+
+    now = timezone.now()
+    changed = {}
+    campaign_events = []
+    counters = defaultdict(lambda: defaultdict(int))
+    to_suppress = defaultdict(list)
+    seen = set()
+    unmatched = 0
+
+    for event in events:
+        target = find_target(event)
+        kind = event.get('event')
+        if target is None:
+            unmatched += 1
+            continue
+        # SendGrid may deliver an event twice within a batch
+        event_id = event.get('sg_event_id')
+        if event_id:
+            if event_id in seen:
+                continue
+            seen.add(event_id)
+
+        event_type = None
+        if kind in ENGAGEMENT_EVENTS:
+            status, field, event_type, counter = ENGAGEMENT_EVENTS[kind]
+            if getattr(target, field) is None:
+                setattr(target, field, event_time(event))
+                counters[target.campaign_id][counter] += 1
+                changed[target.id] = target
+            if STATUS_RANK.get(target.status, -1) < STATUS_RANK[status]:
+                target.status = status
+                changed[target.id] = target
+        elif kind in BOUNCE_EVENTS:
+            event_type = 'email_bounced'
+            if target.status in ('pending', 'sent'):
+                target.status = 'bounced'
+                changed[target.id] = target
+        elif kind == 'delivered':
+            event_type = 'email_delivered'
+
+        if kind in SUPPRESS_EVENTS:
+            to_suppress[SUPPRESS_EVENTS[kind]].append(target.email)
+
+        if event_type:
+            campaign_events.append(CampaignEvent(
+                campaign_id=target.campaign_id,
+                target=target,
+                event_type=event_type,
+                ip_address=event.get('ip') or None,
+                user_agent=event.get('useragent', ''),
+                additional_data={
+                    key: event[key] for key in ('sg_event_id', 'timestamp', 'url', 'reason', 'type') if key in event
+                }
+            ))
+
+    for target in changed.values():
+        target.updated_at = now
+
+    with transaction.atomic():
+        if changed:
+            CampaignTarget.objects.bulk_update(
+                list(changed.values()), ['status', 'email_opened_at', 'link_clicked_at', 'updated_at']
+            )
+        if campaign_events:
+            CampaignEvent.objects.bulk_create(campaign_events)
+        for campaign_id, counts in counters.items():
+            Campaign.objects.filter(id=campaign_id).update(
+                updated_at=now, **{counter: F(counter) + count for counter, count in counts.items()}
+            )
+        for reason, emails in to_suppress.items():
+            suppress(emails, reason=reason, note='SendGrid event webhook')
+
+    logger.info(
+        f"Applied {len(events)} tagged events: {len(campaign_events)} recorded, "
+        f"{len(changed)} targets updated, {unmatched} unmatched"
+    )
+    return {
+        'received': len(events),
+        'recorded': len(campaign_events),
+        'targets_updated': len(changed),
+        'unmatched': unmatched,
+    }
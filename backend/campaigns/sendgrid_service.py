@@ -3,22 +3,24 @@ SendGrid Enhanced Email Service for Phishing Campaigns
 SendGrid API integration with advanced tracking features
 """
 
-import sendgrid
-from sendgrid.helpers.mail import Mail, From, To, Subject, Content, Personalization
-# Updated imports for newer SendGrid version
-try:
-    from sendgrid.helpers.tracking import ClickTracking, OpenTracking, SubscriptionTracking
-except ImportError:
-    # Fallback for newer versions
-    ClickTracking = None
-    OpenTracking = None
-    SubscriptionTracking = None
+from sendgrid.helpers.mail import (
+    Mail, From, To, Subject, Content, Personalization, Substitution, Header, ReplyTo,
+    TrackingSettings, ClickTracking, OpenTracking
+)
 import json
-import time
 import logging
+from functools import partial
 from django.conf import settings
 from django.core.mail import send_mail
+from django.utils.html import escape
 from .email_service import PhishingEmailService
+from .rate_limiter import rate_limiter, sender_domain
+from .retry_policy import SendFailure, classify_error
+from .send_engine import AsyncSendEngine, SendTask
+from .sendgrid_client import get_sendgrid_client
+from .personalization import MergeFieldLoader, compile_template, default_context
+from .suppression import split_suppressed
+from .tracking import make_tracking_token, tracking_context, untracked_context
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +30,9 @@ class SendGridPhishingService(PhishingEmailService):
     Features: Advanced tracking, templates, webhooks
     """
     
+    # SendGrid's mail/send endpoint accepts at most 1000 personalizations per request
+    MAX_PERSONALIZATIONS_PER_REQUEST = 1000
+    
     def __init__(self, campaign=None):
         super().__init__(campaign)
         self.sendgrid_client = None
@@ -37,33 +42,78 @@ class SendGridPhishingService(PhishingEmailService):
         """Initialize SendGrid client"""
         api_key = settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY')
         if api_key:
-            self.sendgrid_client = sendgrid.SendGridAPIClient(api_key=api_key)
+            self.sendgrid_client = get_sendgrid_client()
         else:
             logger.warning("SendGrid API key not found in settings")
     
-    def create_tracking_links(self, html_content, campaign_id, recipient_email):
+    def generate_tracking_id(self, campaign_id, recipient_email, target_id=None):
+        """
+        Tracking ID for a recipient: a signed token for a campaign target, so
+        hits decode back to it without a lookup; None (untracked) otherwise
+        """
+        if campaign_id and target_id:
+            return make_tracking_token(campaign_id, target_id)
+        return None
+    
+    def create_tracking_links(self, html_content, campaign_id, recipient_email, target_id=None):
         """
         Create tracking links for click monitoring
         """
-        import hashlib
-        
         # Generate unique tracking ID
-        tracking_id = hashlib.md5(f"{campaign_id}_{recipient_email}_{time.time()}".encode()).hexdigest()
-        
-        # Replace placeholder links with tracking URLs
-        base_url = getattr(settings, 'BASE_URL', 'http://localhost:8000')
-        tracking_url = f"{base_url}/api/campaigns/track-click/{tracking_id}/"
+        tracking_id = self.generate_tracking_id(campaign_id, recipient_email, target_id)
+        links = tracking_context(tracking_id) if tracking_id else untracked_context()
         
         # Replace common link patterns
-        html_content = html_content.replace('{{tracking_url}}', tracking_url)
-        html_content = html_content.replace('{{click_here}}', tracking_url)
+        html_content = compile_template(html_content).render(links)
         
         # Add tracking pixel for email opens
-        tracking_pixel = f'<img src="{base_url}/api/campaigns/track-open/{tracking_id}/" width="1" height="1" style="display:none;" />'
-        html_content += tracking_pixel
+        if tracking_id:
+            tracking_pixel = f'<img src="{links["tracking_pixel_url"]}" width="1" height="1" style="display:none;" />'
+            html_content += tracking_pixel
         
         return html_content, tracking_id
     
+    def _build_base_message(self, subject, html_content, sender_name, sender_email, target_domain, use_spoofing,
+                            attachments=None):
+        """
+        Build a SendGrid Mail with sender, subject, content and tracking but no recipients
+        attachments are pre-encoded AttachmentPayloads whose Attachment helpers are shared, not rebuilt
+        """
+        # Setup spoofed sender if enabled
+        if use_spoofing:
+            headers, spoofed_sender = self.create_spoofed_email_headers(
+                sender_name, sender_email, target_domain
+            )
+            from_email = spoofed_sender
+        else:
+            from_email = sender_email
+        
+        # Create SendGrid Mail object
+        message = Mail()
+        
+        # Set sender
+        message.from_email = From(from_email, sender_name)
+        
+        # Set subject
+        message.subject = Subject(subject)
+        
+        # Set content
+        message.add_content(Content("text/html", html_content))
+        
+        # Enable tracking
+        message.tracking_settings = self._setup_tracking_settings()
+        
+        # Add custom headers for spoofing
+        if use_spoofing:
+            message.add_header(Header('X-Originating-IP', '[192.168.1.100]'))
+            message.add_header(Header('X-Mailer', 'Microsoft Outlook 16.0'))
+            message.reply_to = ReplyTo(from_email)
+        
+        for attachment in attachments or ():
+            message.add_attachment(attachment.sendgrid_attachment)
+        
+        return message
+    
     def send_phishing_email_sendgrid(self, 
                                    recipient_email, 
                                    subject, 
@@ -72,9 +122,14 @@ class SendGridPhishingService(PhishingEmailService):
                                    sender_email="security@company.com",
                                    target_domain="company.com",
                                    use_spoofing=True,
-                                   campaign_id=None):
+                                   campaign_id=None,
+                                   attachments=None,
+                                   target_id=None,
+                                   raise_errors=False):
         """
         Send phishing email using SendGrid API
+        target_id (the recipient's CampaignTarget) makes the tracking links a signed token
+        With raise_errors, failures are raised (so they can be retried) instead of returning False
         """
         try:
             if not self.sendgrid_client:
@@ -84,43 +139,19 @@ class SendGridPhishingService(PhishingEmailService):
             # Create tracking links
             if campaign_id:
                 html_content, tracking_id = self.create_tracking_links(
-                    html_content, campaign_id, recipient_email
+                    html_content, campaign_id, recipient_email, target_id
                 )
             
-            # Setup spoofed sender if enabled
-            if use_spoofing:
-                headers, spoofed_sender = self.create_spoofed_email_headers(
-                    sender_name, sender_email, target_domain
-                )
-                from_email = spoofed_sender
-            else:
-                from_email = sender_email
-            
-            # Create SendGrid Mail object
-            message = Mail()
-            
-            # Set sender
-            message.from_email = From(from_email, sender_name)
+            message = self._build_base_message(
+                subject, html_content, sender_name, sender_email, target_domain, use_spoofing, attachments
+            )
             
             # Set recipient  
             message.add_to(To(recipient_email))
             
-            # Set subject
-            message.subject = Subject(subject)
-            
-            # Set content
-            message.add_content(Content("text/html", html_content))
-            
-            # Enable tracking
-            message.tracking_settings = self._setup_tracking_settings()
-            
-            # Add custom headers for spoofing
-            if use_spoofing:
-                message.headers = {
-                    'X-Originating-IP': '[192.168.1.100]',
-                    'X-Mailer': 'Microsoft Outlook 16.0',
-                    'Reply-To': from_email
-                }
+            # Wait for the sending domain's rate budget
+            from_domain = sender_domain(message.from_email.email)
+            rate_limiter.require(from_domain)
             
             # Send email
             response = self.sendgrid_client.send(message)
@@ -130,82 +161,281 @@ class SendGridPhishingService(PhishingEmailService):
                 return True
             else:
                 logger.error(f"SendGrid API error: {response.status_code} - {response.body}")
+                if raise_errors:
+                    raise SendFailure(f"SendGrid did not accept the email to {recipient_email}", status_code=response.status_code)
                 return False
                 
         except Exception as e:
             logger.error(f"Failed to send SendGrid email: {str(e)}")
+            if raise_errors:
+                raise
             return False
     
+    def create_batch_tracking_content(self, html_content, track=False):
+        """
+        Rewrite every template placeholder into a SendGrid substitution tag
+        ({{first_name}} -> %first_name%) so one request body can serve every
+        recipient in a batch. Returns (content, fields substituted per recipient).
+        With track, a %tracking_pixel% tag is appended (empty for untracked recipients).
+        """
+        template = compile_template(html_content, escape_values=False)
+        fields = template.fields
+        html_content = template.render({field: f'%{field}%' for field in fields})
+        if track:
+            fields = fields | {'tracking_pixel'}
+            html_content += '%tracking_pixel%'
+        return html_content, fields
+    
+    def build_recipient_substitutions(self, recipient_email, fields, campaign_id=None, context=None):
+        """
+        Per-recipient values for the substitution tags used in batch sends,
+        escaped like a compiled template render. Fields with no value are left
+        as written, as a compiled render leaves them.
+        """
+        context = context or default_context(recipient_email)
+        tracking_id = self.generate_tracking_id(campaign_id, recipient_email, context.get('target_id'))
+        values = {**context, **(tracking_context(tracking_id) if tracking_id else untracked_context())}
+        
+        substitutions = {}
+        for field in fields:
+            if field == 'tracking_pixel':
+                substitutions['%tracking_pixel%'] = (
+                    f'<img src="{escape(values["tracking_pixel_url"])}" width="1" height="1" style="display:none;" />'
+                    if tracking_id else ''
+                )
+            elif values.get(field) is not None:
+                substitutions[f'%{field}%'] = escape(values[field])
+            else:
+                substitutions[f'%{field}%'] = f'{{{{{field}}}}}'
+        return substitutions
+    
+    def send_batch_emails_sendgrid(self,
+                                 recipient_emails,
+                                 subject,
+                                 html_content,
+                                 sender_name="IT Security Team",
+                                 sender_email="security@company.com",
+                                 target_domain="company.com",
+                                 use_spoofing=True,
+                                 campaign_id=None,
+                                 merge_fields=None,
+                                 attachments=None,
+                                 raise_errors=False):
+        """
+        Send one template to up to MAX_PERSONALIZATIONS_PER_REQUEST recipients
+        in a single SendGrid request, one personalization per recipient.
+        merge_fields (a MergeFieldLoader) supplies recipient names.
+        attachments (AttachmentPayloads) are encoded once and shared by every batch.
+        Returns a result dict per recipient; with raise_errors a failed batch
+        raises instead (so it can be retried).
+        """
+        if len(recipient_emails) > self.MAX_PERSONALIZATIONS_PER_REQUEST:
+            raise ValueError(
+                f"SendGrid accepts at most {self.MAX_PERSONALIZATIONS_PER_REQUEST} personalizations per request"
+            )
+        
+        def batch_results(success, status_code=None, message_id=None, error=None):
+            return [
+                {
+                    'recipient': email,
+                    'success': success,
+                    'status_code': status_code,
+                    'message_id': message_id,
+                    'error': error
+                }
+                for email in recipient_emails
+            ]
+        
+        try:
+            if not self.sendgrid_client:
+                logger.error("SendGrid client not initialized")
+                return batch_results(False, error='SendGrid client not initialized')
+            
+            html_content, fields = self.create_batch_tracking_content(html_content, track=bool(campaign_id))
+            
+            message = self._build_base_message(
+                subject, html_content, sender_name, sender_email, target_domain, use_spoofing, attachments
+            )
+            
+            for email in recipient_emails:
+                personalization = Personalization()
+                personalization.add_to(To(email))
+                context = merge_fields.get(email) if merge_fields else None
+                for tag, value in self.build_recipient_substitutions(email, fields, campaign_id, context).items():
+                    personalization.add_substitution(Substitution(tag, value))
+                message.add_personalization(personalization)
+            
+            # A batch draws one token per recipient from the sending domain's budget
+            from_domain = sender_domain(message.from_email.email)
+            rate_limiter.require(from_domain, count=len(recipient_emails))
+            
+            response = self.sendgrid_client.send(message)
+            message_id = response.headers.get('X-Message-Id') if response.headers else None
+            
+            if response.status_code == 202:
+                logger.info(f"SendGrid batch of {len(recipient_emails)} emails accepted, Message ID: {message_id or 'Unknown'}")
+                return batch_results(True, response.status_code, message_id)
+            
+            logger.error(f"SendGrid batch API error: {response.status_code} - {response.body}")
+            if raise_errors:
+                raise SendFailure(str(response.body), status_code=response.status_code)
+            return batch_results(False, response.status_code, error=str(response.body))
+            
+        except Exception as e:
+            # python-http-client raises HTTPError for non-2xx responses
+            status_code = getattr(e, 'status_code', None)
+            logger.error(f"Failed to send SendGrid batch of {len(recipient_emails)} emails: {str(e)}")
+            if raise_errors:
+                raise
+            return batch_results(False, status_code, error=str(getattr(e, 'body', '') or e))
+    
     def _setup_tracking_settings(self):
         """
         Configure SendGrid tracking settings
         """
-        tracking_settings = {}
+        tracking_settings = TrackingSettings()
         
-        # For newer SendGrid versions, tracking is handled differently
-        if ClickTracking:
-            # Click tracking
-            click_tracking = ClickTracking()
-            click_tracking.enable = True
-            click_tracking.enable_text = True
-            tracking_settings['click_tracking'] = click_tracking
+        # Click tracking
+        tracking_settings.click_tracking = ClickTracking(enable=True, enable_text=True)
         
-        if OpenTracking:
-            # Open tracking
-            open_tracking = OpenTracking()
-            open_tracking.enable = True
-            open_tracking.substitution_tag = '%tracking_pixel%'
-            tracking_settings['open_tracking'] = open_tracking
+        # Open tracking
+        tracking_settings.open_tracking = OpenTracking(enable=True)
         
         return tracking_settings
     
-    def send_campaign_emails_sendgrid(self, target_emails, template_data, campaign_id=None):
+    def send_campaign_emails_sendgrid(self, target_emails, template_data, campaign_id=None, batch=False, on_result=None):
         """
         Send campaign emails using SendGrid with rate limiting
+        batch=True groups recipients into multi-personalization requests
+        Suppressed recipients are skipped and counted, not reported to on_result
+        Throttled and transient failures are retried by the send engine;
+        on_result(email, success, error, attempts) gets the final outcome
         """
+        if batch:
+            return self.send_campaign_emails_sendgrid_batch(
+                target_emails, template_data, campaign_id=campaign_id, on_result=on_result
+            )
+        
+        target_emails, suppressed = split_suppressed(target_emails)
         sent_count = 0
         failed_count = 0
         
-        # Rate limiting
-        delay = settings.PHISHING_EMAIL_SETTINGS.get('EMAIL_DELAY_SECONDS', 2)
+        # Compile the template once; merge fields are fetched a chunk of recipients at a time
+        template = compile_template(template_data['html_content'])
+        merge_fields = MergeFieldLoader(target_emails, campaign=self.campaign)
         
-        for email in target_emails:
-            try:
-                # Personalize email content
-                personalized_content = self.personalize_email_content(
-                    template_data['html_content'], 
-                    email
-                )
-                
-                success = self.send_phishing_email_sendgrid(
-                    recipient_email=email,
-                    subject=template_data['subject'],
-                    html_content=personalized_content,
-                    sender_name=template_data.get('sender_name', 'IT Security'),
-                    sender_email=template_data.get('sender_email', 'security@company.com'),
-                    target_domain=template_data.get('target_domain', 'company.com'),
-                    use_spoofing=template_data.get('use_spoofing', True),
-                    campaign_id=campaign_id
-                )
-                
-                if success:
-                    sent_count += 1
-                else:
-                    failed_count += 1
-                
-                # Rate limiting delay
-                time.sleep(delay)
-                
-            except Exception as e:
-                logger.error(f"Error sending to {email}: {str(e)}")
+        def send_one(email):
+            # Personalize email content
+            context = merge_fields.get(email)
+            return self.send_phishing_email_sendgrid(
+                recipient_email=email,
+                subject=template_data['subject'],
+                html_content=template.render(context),
+                sender_name=template_data.get('sender_name', 'IT Security'),
+                sender_email=template_data.get('sender_email', 'security@company.com'),
+                target_domain=template_data.get('target_domain', 'company.com'),
+                use_spoofing=template_data.get('use_spoofing', True),
+                campaign_id=campaign_id,
+                attachments=template_data.get('attachments'),
+                target_id=context.get('target_id'),
+                raise_errors=True
+            )
+        
+        from_domain = sender_domain(template_data.get('sender_email', 'security@company.com'))
+        tasks = (
+            SendTask(email, partial(send_one, email), domain=from_domain, provider='sendgrid')
+            for email in target_emails
+        )
+        
+        # Throughput is governed by the per-domain rate limiter in send_phishing_email_sendgrid
+        for task, success, error in AsyncSendEngine().iter_results(tasks):
+            if error:
+                logger.error(f"Error sending to {task.key}: {str(error)}")
+            success = bool(success) and error is None
+            
+            if success:
+                sent_count += 1
+            else:
                 failed_count += 1
+            
+            if on_result:
+                on_result(task.key, success, error, task.attempts)
         
         return {
             'sent': sent_count,
             'failed': failed_count,
+            'suppressed': len(suppressed),
             'total': len(target_emails)
         }
     
+    def send_campaign_emails_sendgrid_batch(self, target_emails, template_data, campaign_id=None, batch_size=None, on_result=None):
+        """
+        Send campaign emails in batches of up to 1000 personalizations per
+        SendGrid request. A throttled batch is retried whole by the send engine;
+        a batch that still fails is reported for each of its recipients.
+        """
+        batch_size = min(
+            batch_size or self.MAX_PERSONALIZATIONS_PER_REQUEST,
+            self.MAX_PERSONALIZATIONS_PER_REQUEST
+        )
+        
+        # SendGrid rejects a request that addresses the same recipient twice
+        unique_emails, suppressed = split_suppressed(list({email.lower(): email for email in target_emails}.values()))
+        
+        sent_count = 0
+        failed_recipients = []
+        merge_fields = MergeFieldLoader(unique_emails, campaign=self.campaign, chunk_size=batch_size)
+        
+        send_batch = partial(
+            self.send_batch_emails_sendgrid,
+            subject=template_data['subject'],
+            html_content=template_data['html_content'],
+            sender_name=template_data.get('sender_name', 'IT Security'),
+            sender_email=template_data.get('sender_email', 'security@company.com'),
+            target_domain=template_data.get('target_domain', 'company.com'),
+            use_spoofing=template_data.get('use_spoofing', True),
+            campaign_id=campaign_id,
+            merge_fields=merge_fields,
+            attachments=template_data.get('attachments'),
+            raise_errors=True
+        )
+        from_domain = sender_domain(template_data.get('sender_email', 'security@company.com'))
+        tasks = (
+            SendTask(batch, partial(send_batch, recipient_emails=batch), domain=from_domain, provider='sendgrid')
+            for batch in (unique_emails[start:start + batch_size] for start in range(0, len(unique_emails), batch_size))
+        )
+        
+        # One request at a time: each already carries up to 1000 recipients' worth of rate budget
+        for task, results, error in AsyncSendEngine(domain_concurrency=1).iter_results(tasks):
+            if error:
+                status_code = classify_error(error)[2]
+                results = [
+                    {'recipient': email, 'success': False, 'status_code': status_code,
+                     'error': str(getattr(error, 'body', '') or error)}
+                    for email in task.key
+                ]
+            
+            for result in results:
+                if result['success']:
+                    sent_count += 1
+                else:
+                    failed_recipients.append({
+                        'recipient': result['recipient'],
+                        'status_code': result['status_code'],
+                        'error': result['error']
+                    })
+                
+                if on_result:
+                    on_result(result['recipient'], result['success'], error, task.attempts)
+        
+        return {
+            'sent': sent_count,
+            'failed': len(failed_recipients),
+            'suppressed': len(suppressed),
+            'total': len(unique_emails),
+            'failed_recipients': failed_recipients
+        }
+    
     def send_template_email(self, recipient_email, template_id, template_data):
         """
         Send email using SendGrid dynamic templates
@@ -242,7 +472,7 @@ def verify_sendgrid_setup():
         return False, "SendGrid API key not configured"
     
     try:
-        client = sendgrid.SendGridAPIClient(api_key=api_key)
+        client = get_sendgrid_client()
         # Test API key by getting user info
         response = client.user.get()
         if response.status_code == 200:
@@ -261,7 +491,7 @@ def get_sendgrid_stats():
         return None
     
     try:
-        client = sendgrid.SendGridAPIClient(api_key=api_key)
+        client = get_sendgrid_client()
         response = client.stats.get()
         if response.status_code == 200:
             return json.loads(response.body)
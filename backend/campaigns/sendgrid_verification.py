@@ -7,17 +7,18 @@ import os
 import json
 import django
 from django.conf import settings
-from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 
 # Setup Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hopesecure_backend.settings')
 django.setup()
 
+from campaigns.sendgrid_client import get_sendgrid_client
+
 class SendGridVerificationManager:
     def __init__(self):
         self.api_key = settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY')
-        self.sg = SendGridAPIClient(api_key=self.api_key)
+        self.sg = get_sendgrid_client()
     
     def create_verified_sender(self, email, name, reply_to=None):
         """
@@ -1,6 +1,7 @@
 """
 SendGrid Verification API Views
-Manage sender verification through web interface
+Manage sender verification through web interface, and receive SendGrid's
+signed event webhook
 """
 
 from rest_framework.decorators import api_view, permission_classes
@@ -8,7 +9,13 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
-from sendgrid import SendGridAPIClient
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .sendgrid_client import get_sendgrid_client
+from .sendgrid_events import (
+    SIGNATURE_HEADER, TIMESTAMP_HEADER, WebhookSignatureError, apply_events, iter_events, verify_signature
+)
 import json
 import logging
 
@@ -21,8 +28,7 @@ def get_verified_senders(request):
     Get list of all verified senders with their status
     """
     try:
-        api_key = settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY')
-        sg = SendGridAPIClient(api_key=api_key)
+        sg = get_sendgrid_client()
         
         response = sg.client.verified_senders.get()
         data = json.loads(response.body.decode('utf-8'))
@@ -71,8 +77,7 @@ def create_verified_sender(request):
                 'error': 'Email is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        api_key = settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY')
-        sg = SendGridAPIClient(api_key=api_key)
+        sg = get_sendgrid_client()
         
         # Create sender data
         data = {
@@ -133,8 +138,7 @@ def resend_verification(request):
                 'error': 'sender_id is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        api_key = settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY')
-        sg = SendGridAPIClient(api_key=api_key)
+        sg = get_sendgrid_client()
         
         # Try different API endpoints for resending verification
         try:
@@ -162,8 +166,7 @@ def delete_verified_sender(request, sender_id):
     Delete a verified sender
     """
     try:
-        api_key = settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY')
-        sg = SendGridAPIClient(api_key=api_key)
+        sg = get_sendgrid_client()
         
         response = sg.client.verified_senders._(sender_id).delete()
         
@@ -186,8 +189,7 @@ def check_verification_status(request):
     Check overall verification status and provide recommendations
     """
     try:
-        api_key = settings.PHISHING_EMAIL_SETTINGS.get('SENDGRID_API_KEY')
-        sg = SendGridAPIClient(api_key=api_key)
+        sg = get_sendgrid_client()
         
         # Get verified senders
         response = sg.client.verified_senders.get()
@@ -248,3 +250,26 @@ def check_verification_status(request):
             'success': False,
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_POST
+def sendgrid_event_webhook(request):
+    """
+    SendGrid Event Webhook: a signed JSON array of delivered / open / click /
+    bounce events, applied to campaign targets in one transaction
+    Plain Django view so the raw body is verified before anything parses it
+    """
+    payload = request.body
+    try:
+        verify_signature(payload, request.headers.get(SIGNATURE_HEADER), request.headers.get(TIMESTAMP_HEADER))
+    except WebhookSignatureError as e:
+        logger.warning(f"Rejected SendGrid webhook: {e}")
+        return JsonResponse({'success': False, 'error': 'Invalid signature'}, status=403)
+    
+    try:
+        result = apply_events(iter_events(payload))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': f'Malformed event batch: {e}'}, status=400)
+    
+    return JsonResponse({'success': True, **result})
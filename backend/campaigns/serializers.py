@@ -1,8 +1,19 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Campaign, CampaignTarget, CampaignEvent
+from .models import Campaign, CampaignTarget, CampaignEvent, DeadLetter, SuppressedEmail, TargetImport
+from .target_import import clean_rows, import_targets
 from templates.serializers import TemplateListSerializer
 
 
+def validate_send_window(attrs, instance=None):
+    """The daily send window must open before it closes"""
+    start = attrs.get('send_window_start', getattr(instance, 'send_window_start', None))
+    end = attrs.get('send_window_end', getattr(instance, 'send_window_end', None))
+    if start is not None and end is not None and end <= start:
+        raise serializers.ValidationError({'send_window_end': 'Send window must end after it starts'})
+    return attrs
+
+
 class CampaignTargetSerializer(serializers.ModelSerializer):
     class Meta:
         model = CampaignTarget
@@ -42,6 +53,7 @@ class CampaignSerializer(serializers.ModelSerializer):
             'target_count', 'emails_sent', 'emails_opened', 'links_clicked',
             'credentials_submitted', 'data_submitted', 'attachments_downloaded',
             'scheduled_start', 'scheduled_end', 'actual_start', 'actual_end',
+            'send_window_enabled', 'send_window_start', 'send_window_end', 'send_window_weekdays_only',
             'send_reminder', 'reminder_delay_hours', 'track_clicks', 'track_downloads',
             'capture_credentials', 'redirect_url', 'created_by', 'created_by_name',
             'created_at', 'updated_at', 'success_rate', 'open_rate', 'click_rate',
@@ -57,8 +69,9 @@ class CampaignSerializer(serializers.ModelSerializer):
 class CampaignCreateSerializer(serializers.ModelSerializer):
     template_id = serializers.IntegerField(write_only=True)
     domain_id = serializers.IntegerField(write_only=True, required=False)  # Add domain_id field
+    # Checked in one pass by validate_target_emails rather than an EmailField per address
     target_emails = serializers.ListField(
-        child=serializers.EmailField(),
+        child=serializers.CharField(),
         write_only=True,
         required=False
     )
@@ -68,10 +81,22 @@ class CampaignCreateSerializer(serializers.ModelSerializer):
         fields = [
             'name', 'description', 'campaign_type', 'template_id', 'domain_id', 'status',
             'scheduled_start', 'scheduled_end', 'send_reminder', 'reminder_delay_hours',
+            'send_window_enabled', 'send_window_start', 'send_window_end', 'send_window_weekdays_only',
             'track_clicks', 'track_downloads', 'capture_credentials', 'redirect_url',
             'target_emails'
         ]
     
+    def validate(self, attrs):
+        return validate_send_window(attrs, self.instance)
+    
+    def validate_target_emails(self, value):
+        valid, invalid, _ = clean_rows(({'email': email} for email in value), set())
+        if invalid:
+            raise serializers.ValidationError(
+                f"{len(invalid)} invalid email address(es), e.g. {', '.join(invalid[:5])}"
+            )
+        return [row['email'] for row in valid]
+    
     def create(self, validated_data):
         from templates.models import Template
         from .domain_models import EmailDomain
@@ -93,14 +118,10 @@ class CampaignCreateSerializer(serializers.ModelSerializer):
             except EmailDomain.DoesNotExist:
                 raise serializers.ValidationError({'domain_id': 'Domain not found'})
         
-        campaign = Campaign.objects.create(template=template, domain=domain, **validated_data)
-        
-        # Create campaign targets
-        for email in target_emails:
-            CampaignTarget.objects.create(campaign=campaign, email=email)
-        
-        campaign.target_count = len(target_emails)
-        campaign.save()
+        # Campaign and targets together; targets are bulk-inserted in batches
+        with transaction.atomic():
+            campaign = Campaign.objects.create(template=template, domain=domain, **validated_data)
+            import_targets(campaign, ({'email': email} for email in target_emails))
         
         return campaign
 
@@ -141,5 +162,56 @@ class CampaignUpdateSerializer(serializers.ModelSerializer):
         model = Campaign
         fields = [
             'name', 'description', 'status', 'scheduled_start', 'scheduled_end',
+            'send_window_enabled', 'send_window_start', 'send_window_end', 'send_window_weekdays_only',
             'send_reminder', 'reminder_delay_hours', 'redirect_url'
         ]
+    
+    def validate(self, attrs):
+        return validate_send_window(attrs, self.instance)
+
+
+class DeadLetterSerializer(serializers.ModelSerializer):
+    """Failed send kept for replay"""
+    class Meta:
+        model = DeadLetter
+        fields = [
+            'id', 'job', 'campaign', 'email', 'error_type', 'error_message', 'status_code',
+            'retryable', 'attempts', 'status', 'replay_job', 'created_at', 'replayed_at'
+        ]
+        read_only_fields = fields
+
+
+class TargetImportSerializer(serializers.ModelSerializer):
+    """Progress of a bulk target upload"""
+    class Meta:
+        model = TargetImport
+        fields = [
+            'id', 'campaign', 'source_format', 'status', 'processed_rows', 'created_count',
+            'duplicate_count', 'invalid_count', 'suppressed_count', 'invalid_samples', 'error',
+            'created_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+
+class SuppressedEmailSerializer(serializers.ModelSerializer):
+    """Address that is never mailed"""
+    class Meta:
+        model = SuppressedEmail
+        fields = ['id', 'email', 'reason', 'note', 'created_by', 'created_at']
+        read_only_fields = fields
+
+
+class SuppressionCreateSerializer(serializers.Serializer):
+    """Addresses to add to the suppression list in one request"""
+    emails = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+    reason = serializers.ChoiceField(
+        choices=[choice for choice in SuppressedEmail.REASON_CHOICES if choice[0] not in SuppressedEmail.PROTECTED_REASONS],
+        default='excluded'
+    )
+    note = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+
+    def validate_emails(self, value):
+        valid, invalid, _ = clean_rows([{'email': email} for email in value], set())
+        if invalid:
+            raise serializers.ValidationError(f"Invalid email addresses: {', '.join(invalid[:10])}")
+        return [row['email'] for row in valid]
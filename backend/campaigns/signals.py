@@ -1,8 +1,12 @@
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from .models import Campaign, CampaignEvent
+from .models import Campaign, CampaignEvent, SuppressedEmail
+from .domain_models import EmailDomain
+from .multi_domain_service import domain_routing
+from .suppression import suppression_list
 from authentication.models import ActivityLog, SystemAlert
 
 
@@ -142,3 +146,18 @@ def activity_log_created(sender, instance, created, **kwargs):
             }
         }
     )
+
+
+@receiver(post_save, sender=SuppressedEmail)
+def suppressed_email_created(sender, instance, created, **kwargs):
+    """Add a newly suppressed address to this process's suppression filter right away"""
+    if created:
+        suppression_list.note_added([instance.email])
+
+
+@receiver(post_save, sender=EmailDomain)
+@receiver(post_delete, sender=EmailDomain)
+def email_domain_changed(sender, instance, **kwargs):
+    """Drop the cached domain routing table; again on commit so no reader caches the old rows"""
+    domain_routing.invalidate()
+    transaction.on_commit(domain_routing.invalidate)
@@ -3,10 +3,17 @@ Simplified SendGrid Email Service for Basic Testing
 """
 
 import json
-import time
 import logging
+from functools import partial
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives, send_mail
+from .rate_limiter import rate_limiter, sender_domain
+from .send_engine import AsyncSendEngine, SendTask
+from .personalization import MergeFieldLoader, compile_template
+from .retry_policy import SendFailure
+from .send_priority import DEFAULT_PRIORITY
+from .sendgrid_events import new_message_id, smtpapi_header
+from .tracking import recipient_tracking_context
 
 logger = logging.getLogger(__name__)
 
@@ -18,70 +25,107 @@ class SimpleSendGridService:
     def __init__(self, campaign=None):
         self.campaign = campaign
     
-    def send_simple_email(self, recipient_email, subject, html_content, sender_email=None):
+    def send_simple_email(self, recipient_email, subject, html_content, sender_email=None, raise_errors=False,
+                          priority=DEFAULT_PRIORITY, attachments=None, message_id=None):
         """
         Send email using Django's send_mail with SendGrid backend
+        With raise_errors, failures are raised (so they can be retried) instead of returning False
+        priority is the send class (send_priority) used against the domain's rate budget
+        attachments are pre-encoded AttachmentPayloads, attached without re-encoding
+        message_id is passed to SendGrid as a unique arg so webhook events can be matched
         """
         try:
             from_email = sender_email or getattr(settings, 'DEFAULT_FROM_EMAIL', 'test@example.com')
             
-            result = send_mail(
-                subject=subject,
-                message=html_content,  # Plain text fallback
-                from_email=from_email,
-                recipient_list=[recipient_email],
-                html_message=html_content,  # HTML content
-                fail_silently=False,
-            )
+            # Wait for the sending domain's rate budget
+            rate_limiter.require(sender_domain(from_email), priority=priority)
+            
+            if attachments or message_id:
+                headers = {'X-SMTPAPI': smtpapi_header(message_id)} if message_id else None
+                message = EmailMultiAlternatives(subject, html_content, from_email, [recipient_email], headers=headers)
+                message.attach_alternative(html_content, 'text/html')
+                for attachment in attachments or ():
+                    message.attach(attachment.mime_part)
+                result = message.send(fail_silently=False)
+            else:
+                result = send_mail(
+                    subject=subject,
+                    message=html_content,  # Plain text fallback
+                    from_email=from_email,
+                    recipient_list=[recipient_email],
+                    html_message=html_content,  # HTML content
+                    fail_silently=False,
+                )
             
             if result == 1:
                 logger.info(f"Email sent successfully to {recipient_email}")
                 return True
             else:
                 logger.error(f"Failed to send email to {recipient_email}")
+                if raise_errors:
+                    raise SendFailure(f"Backend did not accept the email to {recipient_email}")
                 return False
                 
         except Exception as e:
             logger.error(f"Error sending email: {str(e)}")
+            if raise_errors:
+                raise
             return False
     
-    def send_campaign_emails(self, target_emails, template_data):
+    def send_campaign_emails(self, target_emails, template_data, on_result=None, control=None):
         """
         Send campaign emails to multiple recipients
+        on_result(email, success, error, attempts, message_id=...) is called after every send so callers can record progress
+        With a CampaignControl, no new sends start once the campaign is paused or stopped
         """
         sent_count = 0
         failed_count = 0
+        from_email = template_data.get('sender_email') or getattr(settings, 'DEFAULT_FROM_EMAIL', 'test@example.com')
         
-        # Rate limiting
-        delay = getattr(settings, 'EMAIL_DELAY_SECONDS', 2)
+        # Compile the template once; merge fields are fetched a chunk of recipients at a time
+        template = compile_template(template_data['html_content'])
+        merge_fields = MergeFieldLoader(target_emails, campaign=self.campaign)
         
-        for email in target_emails:
-            try:
-                # Personalize email content
-                personalized_content = template_data['html_content'].replace(
-                    '{{recipient_email}}', email
-                ).replace(
-                    '{{recipient_name}}', email.split('@')[0].title()
-                )
-                
-                success = self.send_simple_email(
-                    recipient_email=email,
-                    subject=template_data['subject'],
-                    html_content=personalized_content,
-                    sender_email=template_data.get('sender_email')
-                )
-                
-                if success:
-                    sent_count += 1
-                else:
-                    failed_count += 1
-                
-                # Rate limiting delay
-                time.sleep(delay)
-                
-            except Exception as e:
-                logger.error(f"Error sending to {email}: {str(e)}")
+        def send_one(email):
+            # Personalize email content; links carry the target's signed tracking token
+            message_id = new_message_id()
+            context = merge_fields.get(email)
+            campaign_id = self.campaign.id if self.campaign else None
+            personalized_content = template.render(
+                {**context, **recipient_tracking_context(campaign_id, context)}
+            )
+            
+            sent = self.send_simple_email(
+                recipient_email=email,
+                subject=template_data['subject'],
+                html_content=personalized_content,
+                sender_email=template_data.get('sender_email'),
+                raise_errors=True,
+                attachments=template_data.get('attachments'),
+                message_id=message_id
+            )
+            return message_id if sent else False
+        
+        tasks = (
+            SendTask(email, partial(send_one, email), domain=sender_domain(from_email), provider='smtp', tokens=1)
+            for email in target_emails
+        )
+        if control is not None:
+            tasks = control.guard(tasks)
+        
+        # Sends run concurrently; the engine takes each send's token from the per-domain rate limiter
+        for task, message_id, error in AsyncSendEngine().iter_results(tasks):
+            if error:
+                logger.error(f"Error sending to {task.key}: {str(error)}")
+            success = bool(message_id)
+            
+            if success:
+                sent_count += 1
+            else:
                 failed_count += 1
+            
+            if on_result:
+                on_result(task.key, success, error, task.attempts, message_id=message_id or None)
         
         return {
             'sent': sent_count,
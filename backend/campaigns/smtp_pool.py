@@ -0,0 +1,177 @@
+"""
+SMTP Connection Pool
+Keeps authenticated SMTP sessions open across a campaign so each message
+skips the TCP connect, EHLO and STARTTLS handshake
+"""
+import atexit
+import logging
+import smtplib
+import ssl
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Reply codes that mean the session itself is unusable (421 = service closing channel);
+# 5xx rejections such as 550 / 554 are about the message, not the session
+SESSION_ERROR_CODES = {421, 451, 454}
+
+
+def get_pool_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+def is_session_error(error):
+    """
+    True when an SMTP error means the connection should be dropped and reopened
+    SMTPException subclasses OSError, so server replies are decided by their
+    code first: a rejected recipient or message (550 etc.) leaves the session usable.
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code in SESSION_ERROR_CODES
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, OSError)
+
+
+class SMTPConnectionPool:
+    """
+    Pool of open SMTP sessions keyed by (host, port, tls, username)
+
+    At most `max_per_host` sessions are checked out per host at any time;
+    further callers wait for a free slot. Sessions that fail with a session
+    level error are discarded and the send is retried on a fresh session.
+    """
+
+    def __init__(self, max_per_host=None, max_idle_seconds=None, acquire_timeout=None):
+        self._max_per_host = max_per_host
+        self._max_idle_seconds = max_idle_seconds
+        self._acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._idle = defaultdict(list)  # key -> [(connection, last_used)]
+        self._host_slots = {}
+        self.connections_opened = 0
+
+    @property
+    def max_per_host(self):
+        return self._max_per_host or get_pool_setting('SMTP_POOL_MAX_PER_HOST', 5)
+
+    @property
+    def max_idle_seconds(self):
+        return self._max_idle_seconds or get_pool_setting('SMTP_POOL_MAX_IDLE_SECONDS', 120)
+
+    @property
+    def acquire_timeout(self):
+        return self._acquire_timeout or get_pool_setting('SMTP_POOL_ACQUIRE_TIMEOUT', 30)
+
+    def _slots_for(self, host):
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
+
+    def _open(self, host, port, use_tls, username, password, timeout):
+        connection = smtplib.SMTP(host, port, timeout=timeout)
+        try:
+            if use_tls:
+                connection.starttls(context=ssl.create_default_context())
+            if username:
+                connection.login(username, password or '')
+        except Exception:
+            self._close(connection)
+            raise
+        self.connections_opened += 1
+        logger.debug(f"Opened SMTP session to {host}:{port}")
+        return connection
+
+    def _close(self, connection):
+        try:
+            connection.quit()
+        except Exception:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _checkout_idle(self, key):
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle[key]
+            while idle:
+                connection, last_used = idle.pop()
+                if now - last_used <= self.max_idle_seconds:
+                    return connection
+                # Servers drop idle sessions; close ours rather than fail on first use
+                self._close(connection)
+        return None
+
+    def _checkin(self, key, connection):
+        with self._lock:
+            self._idle[key].append((connection, time.monotonic()))
+
+    @contextmanager
+    def connection(self, host, port, use_tls=False, username=None, password=None, timeout=30):
+        """
+        Check out a session for the duration of the block.
+        Sessions that raise a session-level error are closed instead of returned.
+        """
+        key = (host, port, bool(use_tls), username or '')
+        slots = self._slots_for(host)
+        if not slots.acquire(timeout=self.acquire_timeout):
+            raise smtplib.SMTPException(f"Timed out waiting for a free SMTP session to {host}")
+
+        try:
+            connection = self._checkout_idle(key) or self._open(host, port, use_tls, username, password, timeout)
+            try:
+                yield connection
+            except Exception as e:
+                if is_session_error(e):
+                    self._close(connection)
+                else:
+                    self._checkin(key, connection)
+                raise
+            else:
+                self._checkin(key, connection)
+        finally:
+            slots.release()
+
+    def _send(self, send, host, port, use_tls, username, password, retries):
+        """Run send(connection) on a pooled session, reconnecting on session errors"""
+        for attempt in range(retries + 1):
+            try:
+                with self.connection(host, port, use_tls, username, password) as connection:
+                    return send(connection)
+            except Exception as e:
+                if attempt >= retries or not is_session_error(e):
+                    raise
+                logger.info(f"SMTP session to {host}:{port} failed ({e}), reconnecting")
+
+    def send_message(self, msg, host, port, use_tls=False, username=None, password=None, retries=1):
+        """
+        Send a message over a pooled session, reconnecting on session errors
+        """
+        return self._send(lambda connection: connection.send_message(msg), host, port, use_tls, username, password, retries)
+
+    def send_raw(self, from_addr, to_addrs, data, host, port, use_tls=False, username=None, password=None, retries=1):
+        """
+        Send an already serialized message (bytes) over a pooled session,
+        reconnecting on session errors
+        """
+        return self._send(lambda connection: connection.sendmail(from_addr, to_addrs, data), host, port, use_tls, username, password, retries)
+
+    def close_all(self):
+        with self._lock:
+            idle = [connection for entries in self._idle.values() for connection, _ in entries]
+            self._idle.clear()
+        for connection in idle:
+            self._close(connection)
+
+
+# Process-wide pool shared by every PhishingEmailService instance
+smtp_pool = SMTPConnectionPool()
+atexit.register(smtp_pool.close_all)
@@ -0,0 +1,184 @@
+"""
+Email Suppression List
+Addresses in SuppressedEmail are never mailed. Each process keeps a Bloom
+filter snapshot of the table so most recipients are cleared in O(1) without
+a query; only filter hits are confirmed against the database.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import SuppressedEmail
+
+logger = logging.getLogger(__name__)
+
+# Smallest filter built, so a near-empty table still leaves room to grow incrementally
+MIN_CAPACITY = 10000
+
+CONFIRM_CHUNK_SIZE = 500
+
+
+def get_suppression_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings. The k bit positions come from one
+    blake2b digest by double hashing. No false negatives; false positives at
+    about `error_rate` while no more than `capacity` items are added.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1)
+        self.bit_count = max(64, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / self.capacity * math.log(2)))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.bit_count for i in range(self.hash_count)]
+
+    def add(self, item):
+        """Set the item's bits; an item already present is not counted again"""
+        positions = self._positions(item)
+        if all(self.bits[position >> 3] & (1 << (position & 7)) for position in positions):
+            return
+        for position in positions:
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+
+class SuppressionList:
+    """
+    Per-process Bloom filter snapshot of SuppressedEmail
+
+    New rows are folded in incrementally: rows added in this process right
+    away, rows added elsewhere at most every SUPPRESSION_REFRESH_SECONDS by
+    re-reading every row created since the previous read minus
+    SUPPRESSION_REFRESH_OVERLAP_SECONDS. The overlap catches rows whose
+    transaction committed after newer rows were already read; a row that
+    commits later than that is only picked up by the next rebuild.
+    The filter is rebuilt from scratch when it fills past capacity and every
+    SUPPRESSION_REBUILD_SECONDS, which also drops deleted addresses (until
+    then they are just filter hits that the database check clears).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._read_at = None  # When the last read of the table started
+        self._next_refresh = 0.0
+        self._rebuild_at = 0.0
+
+    def _rebuild(self):
+        capacity = max(MIN_CAPACITY, SuppressedEmail.objects.count() * 2)
+        bloom = BloomFilter(capacity, get_suppression_setting('SUPPRESSION_BLOOM_ERROR_RATE', 0.001))
+        read_at = timezone.now()
+        for email in SuppressedEmail.objects.order_by().values_list('email', flat=True).iterator(chunk_size=5000):
+            bloom.add(email)
+
+        self._filter = bloom
+        self._read_at = read_at
+        self._rebuild_at = time.monotonic() + get_suppression_setting('SUPPRESSION_REBUILD_SECONDS', 3600)
+        logger.info(f"Suppression filter rebuilt: {bloom.count} addresses, {len(bloom.bits) // 1024} KiB")
+
+    def refresh(self, force=False):
+        """Fold in rows added by other processes since the last refresh"""
+        now = time.monotonic()
+        if not force and self._filter is not None and now < self._next_refresh:
+            return
+
+        with self._lock:
+            if self._filter is None or now >= self._rebuild_at:
+                self._rebuild()
+            else:
+                read_at = timezone.now()
+                overlap = timedelta(seconds=get_suppression_setting('SUPPRESSION_REFRESH_OVERLAP_SECONDS', 300))
+                new_rows = SuppressedEmail.objects.filter(created_at__gte=self._read_at - overlap)
+                for email in new_rows.order_by().values_list('email', flat=True).iterator():
+                    self._filter.add(email)
+                self._read_at = read_at
+                if self._filter.full:
+                    self._rebuild()
+            self._next_refresh = now + get_suppression_setting('SUPPRESSION_REFRESH_SECONDS', 5)
+
+    def note_added(self, emails):
+        """Add addresses this process just suppressed, without waiting for a refresh"""
+        with self._lock:
+            if self._filter is None:
+                return
+            for email in emails:
+                self._filter.add(normalize_email(email))
+
+    def might_contain(self, email):
+        return self._filter is None or normalize_email(email) in self._filter
+
+    def clear(self):
+        with self._lock:
+            self._filter = None
+            self._read_at = None
+
+
+# Shared by every send path and import in this process
+suppression_list = SuppressionList()
+
+
+def find_suppressed(emails):
+    """
+    Lowercased addresses among `emails` that are suppressed. The Bloom filter
+    rules out almost every address; only its hits cost a query.
+    """
+    suppression_list.refresh()
+    candidates = list({normalize_email(email) for email in emails if suppression_list.might_contain(email)})
+
+    suppressed = set()
+    for start in range(0, len(candidates), CONFIRM_CHUNK_SIZE):
+        suppressed.update(
+            SuppressedEmail.objects.filter(email__in=candidates[start:start + CONFIRM_CHUNK_SIZE])
+            .values_list('email', flat=True)
+        )
+    return suppressed
+
+
+def split_suppressed(emails):
+    """(sendable, suppressed) partition of a recipient list, order kept"""
+    suppressed = find_suppressed(emails)
+    if not suppressed:
+        return list(emails), []
+
+    sendable, skipped = [], []
+    for email in emails:
+        (skipped if normalize_email(email) in suppressed else sendable).append(email)
+    logger.info(f"Skipping {len(skipped)} suppressed recipient(s)")
+    return sendable, skipped
+
+
+def suppress(emails, reason='excluded', note='', created_by=None):
+    """Add addresses to the suppression list; already-suppressed ones are left as they are"""
+    normalized = list(dict.fromkeys(normalize_email(email) for email in emails if email and email.strip()))
+    SuppressedEmail.objects.bulk_create(
+        [SuppressedEmail(email=email, reason=reason, note=note, created_by=created_by) for email in normalized],
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+    suppression_list.note_added(normalized)
+    return len(normalized)
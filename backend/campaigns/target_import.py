@@ -0,0 +1,189 @@
+"""
+Bulk Target Import
+Validates, dedupes and bulk-inserts campaign targets from a list or from a
+streamed CSV / NDJSON upload, a batch at a time, so company-wide campaigns
+never hold the whole upload in memory or insert one row per query.
+Suppressed addresses are left out.
+"""
+import codecs
+import csv
+import json
+import logging
+import re
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import CampaignTarget
+from .suppression import find_suppressed
+
+logger = logging.getLogger(__name__)
+
+# Pragmatic address check: one compiled pattern instead of a validator call per row
+EMAIL_RE = re.compile(r"^[A-Za-z0-9.!#$%&'*+/=?^_`{|}~-]+@[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?(?:\.[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?)+$")
+MAX_EMAIL_LENGTH = 254
+
+# Optional upload columns copied onto CampaignTarget (truncated to the model's max_length)
+TARGET_FIELDS = ('first_name', 'last_name', 'department')
+
+INVALID_SAMPLE_SIZE = 20
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def get_import_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+def clean_rows(rows, seen):
+    """
+    Validate and dedupe a batch of row dicts (an 'email' key plus optional
+    TARGET_FIELDS) in one pass. `seen` holds lowercased addresses already
+    accepted, so duplicates are caught across batches.
+    Returns (valid rows, invalid addresses, duplicate count).
+    """
+    match = EMAIL_RE.match
+    valid = []
+    invalid = []
+    duplicates = 0
+    for row in rows:
+        email = str(row.get('email') or '').strip()
+        if len(email) > MAX_EMAIL_LENGTH or not match(email):
+            invalid.append(email)
+            continue
+        key = email.lower()
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        valid.append(dict(
+            {field: str(row.get(field) or '').strip()[:100] for field in TARGET_FIELDS},
+            email=email
+        ))
+    return valid, invalid, duplicates
+
+
+def iter_text_lines(stream, chunk_size=READ_CHUNK_SIZE):
+    """Decode a binary stream (upload or request body) into lines, one chunk at a time"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        pending += decoder.decode(chunk or b'', final=not chunk)
+        lines = pending.splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith(('\n', '\r')) else ''
+        yield from lines
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+
+def iter_csv_rows(lines):
+    """
+    Row dicts from CSV lines. A header naming an 'email' column maps the other
+    columns by name; without one the first column is the address.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header:
+        return
+    columns = [column.strip().lower().replace(' ', '_') for column in header]
+    if 'email' not in columns:
+        columns = ['email']
+        yield {'email': header[0]}
+    for values in reader:
+        if values:
+            yield dict(zip(columns, values))
+
+
+def iter_ndjson_rows(lines):
+    """Row dicts from NDJSON lines: objects with an 'email' key, or bare address strings"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            item = line
+        yield item if isinstance(item, dict) else {'email': str(item)}
+
+
+UPLOAD_PARSERS = {
+    'csv': iter_csv_rows,
+    'ndjson': iter_ndjson_rows,
+}
+
+
+def iter_upload_rows(stream, source_format):
+    return UPLOAD_PARSERS[source_format](iter_text_lines(stream))
+
+
+def import_targets(campaign, rows, target_import=None, batch_size=None):
+    """
+    Add targets to a campaign from an iterable of row dicts, a batch at a time.
+
+    Without a TargetImport the batches run in the caller's transaction. With
+    one, each batch commits together with its progress update, so the import
+    can be watched from other requests and a failed upload keeps the batches
+    already counted (re-uploading skips them as duplicates).
+    Returns the number of targets created.
+    """
+    batch_size = batch_size or get_import_setting('TARGET_IMPORT_BATCH_SIZE', 1000)
+    seen = {email.lower() for email in campaign.targets.values_list('email', flat=True).iterator()}
+    existing = len(seen)
+    rows = iter(rows)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        valid, invalid, duplicates = clean_rows(batch, seen)
+        suppressed = find_suppressed([row['email'] for row in valid])
+        if suppressed:
+            valid = [row for row in valid if row['email'].lower() not in suppressed]
+
+        with transaction.atomic():
+            # ignore_conflicts: a concurrent import of the same address is not an error
+            CampaignTarget.objects.bulk_create(
+                [CampaignTarget(campaign=campaign, **row) for row in valid],
+                batch_size=batch_size,
+                ignore_conflicts=True
+            )
+            if target_import is not None:
+                target_import.processed_rows += len(batch)
+                target_import.created_count += len(valid)
+                target_import.duplicate_count += duplicates
+                target_import.invalid_count += len(invalid)
+                target_import.suppressed_count += len(suppressed)
+                room = INVALID_SAMPLE_SIZE - len(target_import.invalid_samples)
+                target_import.invalid_samples += invalid[:max(room, 0)]
+                target_import.save(update_fields=[
+                    'processed_rows', 'created_count', 'duplicate_count', 'invalid_count', 'suppressed_count',
+                    'invalid_samples'
+                ])
+
+    campaign.target_count = campaign.targets.count()
+    campaign.save(update_fields=['target_count', 'updated_at'])
+    return campaign.target_count - existing
+
+
+def run_target_import(target_import, rows):
+    """Run an upload into target_import.campaign and record how it ended"""
+    try:
+        import_targets(target_import.campaign, rows, target_import=target_import)
+    except Exception as e:
+        logger.exception(f"Target import #{target_import.id} failed")
+        target_import.status = 'failed'
+        target_import.error = str(e)
+    else:
+        target_import.status = 'completed'
+    target_import.finished_at = timezone.now()
+    target_import.save(update_fields=['status', 'error', 'finished_at'])
+    logger.info(
+        f"Target import #{target_import.id} {target_import.status}: {target_import.created_count} created, "
+        f"{target_import.duplicate_count} duplicates, {target_import.invalid_count} invalid, "
+        f"{target_import.suppressed_count} suppressed"
+    )
+    return target_import
@@ -1,3 +1,1499 @@
-from django.test import TestCase
+"""
+Test suite for HopeSecure campaign sending
+"""
+import asyncio
+import json
+from email import message_from_bytes
+from email.header import decode_header, make_header
+import smtplib
+import tempfile
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from unittest import mock
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import int_to_base36
+from rest_framework.test import APITestCase
+from rest_framework import status
+from python_http_client.exceptions import BadRequestsError, TooManyRequestsError
+from sendgrid.helpers.mail import Mail
+from ellipticcurve.ecdsa import Ecdsa
+from ellipticcurve.privateKey import PrivateKey
+from templates.models import Template
+from .models import Campaign, CampaignTarget, DeadLetter, SendJob, SuppressedEmail, TargetImport
+from .send_queue import claim_next_job, enqueue_campaign_send, enqueue_launch, replay_dead_letters, run_job
+from .sendgrid_service import SendGridPhishingService
+from .domain_models import EmailDomain
+from .rate_limiter import DomainRateLimiter, rate_limiter
+from .smtp_pool import SMTPConnectionPool
+from .sendgrid_client import build_sendgrid_client, get_sendgrid_client
+from .send_engine import AsyncSendEngine, SendTask
+from .retry_policy import SendFailure, backoff_delay, classify_error
+from .scheduler import complete_ended_campaigns, next_wakeup, start_due_campaigns
+from .send_window import plan_campaign_sends
+from .custom_domain_email_service import CustomDomainEmailService
+from .campaign_launch_service import iter_launch_results
+from .multi_domain_service import MultiDomainPhishingService
+from .fake_provider import FakeSendGridServer, FaultProfile
+from .personalization import MergeFieldLoader, compile_template, default_context
+from .mime_skeleton import MessageSkeleton
+from .sendgrid_events import MESSAGE_ID_ARG, SIGNATURE_HEADER, TIMESTAMP_HEADER
+from .tracking import TRANSPARENT_GIF, landing_url, make_tracking_token, tracking_buffer
+from .attachments import AttachmentCache, AttachmentPayload, attachment_cache, load_template_attachments, read_attachment
+from .email_service import PhishingEmailService
+from .simple_email_service import SimpleSendGridService
+from .suppression import BloomFilter, find_suppressed, suppress, suppression_list
+from .target_import import import_targets
+from employees.models import Department, Employee
+from organization.models import Company
 
-# Create your tests here.
+User = get_user_model()
+
+
+def create_campaign(user, target_emails):
+    template = Template.objects.create(
+        name='Password Reset',
+        category='credential',
+        description='Test template',
+        email_subject='Reset your password',
+        sender_name='IT Support',
+        sender_email='it@company.com',
+        html_content='<p>Hello {{recipient_name}}</p>',
+        domain='company.com',
+        difficulty='low',
+        risk_level='low',
+    )
+    campaign = Campaign.objects.create(
+        name='Test Campaign',
+        campaign_type='credential',
+        template=template,
+        created_by=user,
+    )
+    for email in target_emails:
+        CampaignTarget.objects.create(campaign=campaign, email=email)
+    return campaign
+
+
+class SendQueueTestCase(TransactionTestCase):
+    """Test the background send queue (sends run on worker threads, so no wrapping transaction)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password='testpass123'
+        )
+        self.campaign = create_campaign(self.user, ['a@example.com', 'b@example.com'])
+        # Budget rows written from several worker threads at once can lock SQLite
+        budget = mock.patch.object(rate_limiter, 'try_acquire', return_value=(True, 0.0))
+        budget.start()
+        self.addCleanup(budget.stop)
+
+    def test_claim_is_exclusive(self):
+        """A queued job can only be claimed once"""
+        job = enqueue_campaign_send(self.campaign, user=self.user)
+
+        claimed = claim_next_job('worker-1')
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.status, 'running')
+        self.assertIsNone(claim_next_job('worker-2'))
+
+    def test_ownerless_jobs_visible_to_staff_only(self):
+        """Scheduler-started jobs (no owner) are not readable by every user"""
+        job = enqueue_campaign_send(self.campaign)
+        url = reverse('send-job-status', args=[job.id])
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(url).json()['id'], job.id)
+
+    @mock.patch('campaigns.simple_email_service.SimpleSendGridService.send_simple_email')
+    def test_run_job_writes_progress(self, send_simple_email):
+        """Running a job records results on the job, campaign and targets"""
+        send_simple_email.side_effect = lambda recipient_email, **kwargs: recipient_email == 'a@example.com'
+        enqueue_campaign_send(self.campaign, user=self.user)
+
+        job = run_job(claim_next_job('worker-1'))
+
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.sent_count, job.failed_count), (1, 1))
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.emails_sent, 1)
+        statuses = dict(self.campaign.targets.values_list('email', 'status'))
+        self.assertEqual(statuses, {'a@example.com': 'sent', 'b@example.com': 'failed'})
+        sent_call = next(c for c in send_simple_email.call_args_list if c.kwargs['recipient_email'] == 'a@example.com')
+        self.assertEqual(self.campaign.targets.get(email='a@example.com').provider_message_id, sent_call.kwargs['message_id'])
+
+    @mock.patch('campaigns.simple_email_service.SimpleSendGridService.send_simple_email', return_value=True)
+    def test_stale_job_resumes_pending_targets(self, send_simple_email):
+        """A job whose worker died is requeued and only sends targets still pending"""
+        job = enqueue_campaign_send(self.campaign, user=self.user)
+        claim_next_job('worker-1')
+        self.campaign.targets.filter(email='a@example.com').update(status='sent')
+        SendJob.objects.filter(id=job.id).update(
+            sent_count=1, heartbeat_at=timezone.now() - timedelta(hours=1)
+        )
+
+        job = run_job(claim_next_job('worker-2'))
+
+        self.assertEqual(job.worker_id, 'worker-2')
+        self.assertEqual((job.sent_count, job.failed_count, job.attempts), (2, 0, 2))
+        recipients = [c.kwargs['recipient_email'] for c in send_simple_email.call_args_list]
+        self.assertEqual(recipients, ['b@example.com'])
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.emails_sent, 2)
+
+    @override_settings(PHISHING_EMAIL_SETTINGS=dict(
+        settings.PHISHING_EMAIL_SETTINGS, SEND_CONTROL_POLL_SECONDS=0.02, SEND_CONCURRENCY_PER_PROVIDER={'smtp': 1}
+    ))
+    @mock.patch('campaigns.simple_email_service.SimpleSendGridService.send_simple_email')
+    def test_pause_halts_running_send_and_resume_continues(self, send_simple_email):
+        """Pausing mid-send stops new sends; the resumed job sends only what was not reached"""
+        campaign = create_campaign(self.user, [f'user{i}@example.com' for i in range(6)])
+        Campaign.objects.filter(id=campaign.id).update(status='active')
+
+        def pause_after_first_send(recipient_email, **kwargs):
+            Campaign.objects.filter(id=campaign.id).update(status='paused')
+            time.sleep(0.2)
+            return True
+
+        send_simple_email.side_effect = pause_after_first_send
+        enqueue_campaign_send(campaign, user=self.user)
+        job = run_job(claim_next_job('worker-1'))
+
+        self.assertEqual((job.status, job.result['halted']), ('cancelled', 'paused'))
+        self.assertEqual(job.sent_count, 1)
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.emails_sent), ('paused', 1))
+        self.assertEqual(campaign.targets.filter(status='pending').count(), 5)
+
+        send_simple_email.side_effect = None
+        send_simple_email.return_value = True
+        Campaign.objects.filter(id=campaign.id).update(status='active')
+        enqueue_campaign_send(campaign, user=self.user)
+        run_job(claim_next_job('worker-1'))
+
+        recipients = [c.kwargs['recipient_email'] for c in send_simple_email.call_args_list]
+        self.assertEqual(sorted(recipients), [f'user{i}@example.com' for i in range(6)])
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.emails_sent, 6)
+
+    @override_settings(PHISHING_EMAIL_SETTINGS=dict(
+        settings.PHISHING_EMAIL_SETTINGS, SEND_CONTROL_POLL_SECONDS=0.02, SEND_CONCURRENCY_PER_PROVIDER={'smtp': 1}
+    ))
+    @mock.patch('campaigns.simple_email_service.SimpleSendGridService.send_simple_email', return_value=True)
+    def test_scheduled_end_halts_running_send(self, send_simple_email):
+        """Reaching scheduled_end mid-send completes the campaign and nothing more goes out"""
+        campaign = create_campaign(self.user, [f'user{i}@example.com' for i in range(6)])
+        Campaign.objects.filter(id=campaign.id).update(
+            status='active', scheduled_end=timezone.now() + timedelta(hours=1)
+        )
+
+        def end_after_first_send(recipient_email, **kwargs):
+            self.assertEqual(complete_ended_campaigns(timezone.now() + timedelta(hours=2)), 1)
+            time.sleep(0.2)
+            return True
+
+        send_simple_email.side_effect = end_after_first_send
+        enqueue_campaign_send(campaign, user=self.user)
+        job = run_job(claim_next_job('worker-1'))
+
+        self.assertEqual((job.status, job.result['halted'], job.sent_count), ('cancelled', 'completed', 1))
+        self.assertEqual(send_simple_email.call_count, 1)
+        self.assertEqual(campaign.targets.filter(status='pending').count(), 5)
+
+    def test_stale_launch_job_not_resent(self):
+        """Launch jobs have no per-target checkpoint, so a dead one is failed"""
+        job = enqueue_launch({'name': 'Launch', 'target_emails': ['a@example.com']}, user=self.user)
+        claim_next_job('worker-1')
+        SendJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+
+        self.assertIsNone(claim_next_job('worker-2'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    @mock.patch('campaigns.simple_email_service.SimpleSendGridService.send_simple_email')
+    def test_failed_send_dead_lettered_and_replayed(self, send_simple_email):
+        """A failed recipient lands in the dead-letter table; replaying it queues a job that resends only it"""
+        send_simple_email.side_effect = lambda recipient_email, **kwargs: recipient_email == 'a@example.com'
+        enqueue_campaign_send(self.campaign, user=self.user)
+        run_job(claim_next_job('worker-1'))
+        letter = DeadLetter.objects.get()
+        self.assertEqual((letter.email, letter.campaign_id, letter.error_type), ('b@example.com', self.campaign.id, 'SendFailed'))
+
+        send_simple_email.side_effect = lambda recipient_email, **kwargs: True
+        replayed, skipped, jobs = replay_dead_letters(DeadLetter.objects.all(), user=self.user)
+        self.assertEqual((replayed, skipped, jobs[0].total_count), (1, 0, 1))
+        job = run_job(claim_next_job('worker-1'))
+
+        self.assertEqual((job.id, job.sent_count), (jobs[0].id, 1))
+        self.assertEqual(send_simple_email.call_args.kwargs['recipient_email'], 'b@example.com')
+        letter.refresh_from_db()
+        self.assertEqual((letter.status, letter.replay_job_id), ('replayed', job.id))
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.emails_sent, 2)
+
+    @mock.patch('campaigns.simple_email_service.SimpleSendGridService.send_simple_email', return_value=True)
+    def test_send_window_job_requeued_until_next_slot(self, send_simple_email):
+        """A send-window job sends only due targets, then waits in the queue for the next slot"""
+        Campaign.objects.filter(id=self.campaign.id).update(send_window_enabled=True)
+        job = SendJob.objects.create(job_type='campaign', campaign=self.campaign, total_count=2)
+        next_slot = timezone.now() + timedelta(hours=1)
+        self.campaign.targets.filter(email='a@example.com').update(scheduled_send_at=timezone.now() - timedelta(minutes=1))
+        self.campaign.targets.filter(email='b@example.com').update(scheduled_send_at=next_slot)
+
+        job = run_job(claim_next_job('worker-1'))
+
+        self.assertEqual((job.status, job.run_after, job.sent_count, job.attempts), ('queued', next_slot, 1, 0))
+        recipients = [c.kwargs['recipient_email'] for c in send_simple_email.call_args_list]
+        self.assertEqual(recipients, ['a@example.com'])
+        self.assertIsNone(claim_next_job('worker-2'))
+
+
+class CampaignSchedulerTestCase(TestCase):
+    """Test the campaign scheduler"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password='testpass123'
+        )
+        self.now = timezone.now()
+
+    def schedule(self, start, end=None):
+        campaign = create_campaign(self.user, ['a@example.com'])
+        Campaign.objects.filter(id=campaign.id).update(status='scheduled', scheduled_start=start, scheduled_end=end)
+        return campaign
+
+    def test_due_campaign_started_once(self):
+        """A due campaign is activated and queued exactly once; future ones are left alone"""
+        due = self.schedule(self.now - timedelta(minutes=1))
+        future = self.schedule(self.now + timedelta(hours=1))
+
+        self.assertEqual(start_due_campaigns(self.now), [due.id])
+        self.assertEqual(start_due_campaigns(self.now), [])
+
+        due.refresh_from_db()
+        self.assertEqual(due.status, 'active')
+        self.assertEqual(due.send_jobs.get().status, 'queued')
+        self.assertFalse(future.send_jobs.exists())
+        self.assertEqual(next_wakeup(self.now, max_sleep=7200), 3600)
+
+    def test_campaign_completed_at_scheduled_end(self):
+        """Active campaigns past scheduled_end are completed"""
+        campaign = self.schedule(self.now - timedelta(hours=2), self.now - timedelta(minutes=1))
+        Campaign.objects.filter(id=campaign.id).update(status='active')
+
+        self.assertEqual(complete_ended_campaigns(self.now), 1)
+
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'completed')
+        self.assertEqual(campaign.actual_end, self.now)
+
+
+    def test_ended_campaign_queued_jobs_cancelled(self):
+        """Completing a campaign cancels the send-window job waiting for its next slot"""
+        campaign = self.schedule(self.now - timedelta(hours=2), self.now - timedelta(minutes=1))
+        Campaign.objects.filter(id=campaign.id).update(status='active')
+        job = SendJob.objects.create(
+            job_type='campaign', campaign=campaign, total_count=1, run_after=self.now - timedelta(seconds=1)
+        )
+
+        complete_ended_campaigns(self.now)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'cancelled')
+        self.assertIsNone(claim_next_job('worker-1'))
+
+    def test_unplannable_campaign_paused_not_retried(self):
+        """A campaign whose send window cannot be planned leaves 'scheduled' instead of spinning the scheduler"""
+        EmailDomain.objects.create(name='company.com', created_by=self.user, rate_limit_per_hour=0)
+        rate_limiter.clear_cache()
+        self.addCleanup(rate_limiter.clear_cache)
+        campaign = self.schedule(self.now - timedelta(minutes=1))
+        Campaign.objects.filter(id=campaign.id).update(send_window_enabled=True)
+
+        self.assertEqual(start_due_campaigns(self.now), [])
+
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'paused')
+        self.assertFalse(campaign.send_jobs.exists())
+        self.assertEqual(next_wakeup(self.now, max_sleep=30), 30)
+
+
+class SendWindowTestCase(TestCase):
+    """Test send-window planning"""
+
+    def setUp(self):
+        rate_limiter.clear_cache()
+        self.user = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password='testpass123'
+        )
+        self.monday = datetime(2026, 10, 19, tzinfo=dt_timezone.utc)
+
+    def tearDown(self):
+        rate_limiter.clear_cache()
+
+    def windowed_campaign(self, emails, start, end):
+        campaign = create_campaign(self.user, emails)
+        Campaign.objects.filter(id=campaign.id).update(
+            send_window_enabled=True, send_window_start=start, send_window_end=end
+        )
+        campaign.refresh_from_db()
+        return campaign
+
+    def test_plan_never_exceeds_domain_minute_budget(self):
+        """Sends are capped at rate_limit_per_hour / 60 per minute, spilling into the next weekday window"""
+        EmailDomain.objects.create(name='company.com', created_by=self.user, rate_limit_per_hour=120)
+        campaign = self.windowed_campaign([f'user{i}@example.com' for i in range(30)], dt_time(9, 0), dt_time(9, 10))
+
+        summary = plan_campaign_sends(campaign, start=self.monday + timedelta(hours=8, minutes=30))
+
+        self.assertEqual((summary['targets'], summary['busiest_minute']), (30, 2))
+        slots = list(campaign.targets.values_list('scheduled_send_at', flat=True))
+        self.assertTrue(all(dt_time(9, 0) <= slot.time() < dt_time(9, 10) for slot in slots))
+        self.assertEqual(summary['first_send_at'], self.monday + timedelta(hours=9))
+        self.assertEqual(sum(slot.date() == self.monday.date() for slot in slots), 20)
+        self.assertEqual(summary['last_send_at'], self.monday + timedelta(days=1, hours=9, minutes=4))
+
+    def test_plan_uses_target_local_business_hours(self):
+        """Targets are planned in their company's timezone; unknown targets fall back to UTC"""
+        company = Company.objects.create(name='Acme', timezone='UTC+8', created_by=self.user)
+        department = Department.objects.create(name='Finance', organization=company)
+        Employee.objects.create(
+            employee_id='E1', first_name='Alice', last_name='Smith', email='alice@example.com',
+            department=department, position='Analyst', hire_date='2024-01-01', organization=company
+        )
+        campaign = self.windowed_campaign(['alice@example.com', 'bob@example.com'], dt_time(9, 0), dt_time(17, 0))
+
+        plan_campaign_sends(campaign, start=self.monday)
+
+        slots = dict(campaign.targets.values_list('email', 'scheduled_send_at'))
+        self.assertEqual(slots['alice@example.com'], self.monday + timedelta(hours=1))
+        self.assertEqual(slots['bob@example.com'], self.monday + timedelta(hours=9))
+
+
+class StartCampaignTestCase(APITestCase):
+    """Test the start campaign endpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.campaign = create_campaign(self.user, ['a@example.com'])
+
+    def test_start_campaign_queues_job(self):
+        """Starting a campaign returns 202 without sending inline"""
+        url = reverse('campaign-start', args=[self.campaign.id])
+
+        with mock.patch('campaigns.simple_email_service.send_mail') as send_mail:
+            response = self.client.post(url)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        send_mail.assert_not_called()
+        job = SendJob.objects.get(id=response.data['job_id'])
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.total_count, 1)
+
+
+class TargetImportTestCase(APITestCase):
+    """Test bulk target ingestion"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.campaign = create_campaign(self.user, ['existing@example.com'])
+
+    @override_settings(PHISHING_EMAIL_SETTINGS=dict(settings.PHISHING_EMAIL_SETTINGS, TARGET_IMPORT_BATCH_SIZE=2))
+    def test_csv_body_validated_deduped_in_batches(self):
+        """A raw CSV body is imported in batches; duplicates (any case, or already targeted) and invalid rows are counted"""
+        body = (
+            'Email,First Name,Department\r\n'
+            'alice@example.com,Alice,Finance\r\n'
+            'ALICE@example.com,Alice,Finance\r\n'
+            'not-an-email,,\r\n'
+            'Existing@example.com,,\r\n'
+            'bob@example.com,Bob,\r\n'
+        ).encode()
+        url = reverse('campaign-target-import', args=[self.campaign.id])
+
+        response = self.client.generic('POST', url, body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            (response.data['processed_rows'], response.data['created_count'], response.data['duplicate_count'], response.data['invalid_count']),
+            (5, 2, 2, 1)
+        )
+        self.assertEqual(response.data['invalid_samples'], ['not-an-email'])
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.target_count, 3)
+        alice = self.campaign.targets.get(email='alice@example.com')
+        self.assertEqual((alice.first_name, alice.department), ('Alice', 'Finance'))
+
+    def test_ndjson_file_upload(self):
+        """An NDJSON multipart upload accepts objects and bare strings, and progress is listed per campaign"""
+        upload = SimpleUploadedFile('targets.ndjson', b'{"email": "carol@example.com", "last_name": "Jones"}\n"dave@example.com"\n\n')
+        url = reverse('campaign-target-import', args=[self.campaign.id])
+
+        response = self.client.post(url, {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created_count'], 2)
+        self.assertEqual(self.campaign.targets.get(email='carol@example.com').last_name, 'Jones')
+        imports = self.client.get(reverse('campaign-target-imports', args=[self.campaign.id])).data
+        self.assertEqual([(i['source_format'], i['status']) for i in imports], [('ndjson', 'completed')])
+
+    def test_create_campaign_bulk_inserts_target_emails(self):
+        """target_emails are deduped on create, and any invalid address rejects the request"""
+        url = reverse('campaign-list-create')
+        data = {'name': 'Company-wide', 'campaign_type': 'credential', 'template_id': self.campaign.template_id}
+
+        rejected = self.client.post(url, dict(data, target_emails=['a@example.com', 'bad@']), format='json')
+        response = self.client.post(url, dict(data, target_emails=['a@example.com', 'A@example.com', 'b@example.com']), format='json')
+
+        self.assertEqual(rejected.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        campaign = Campaign.objects.get(name='Company-wide')
+        self.assertEqual(campaign.target_count, 2)
+        self.assertEqual(sorted(campaign.targets.values_list('email', flat=True)), ['a@example.com', 'b@example.com'])
+
+
+class DeadLetterAPITestCase(APITestCase):
+    """Test listing and replaying dead letters"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        job = SendJob.objects.create(
+            job_type='launch', status='completed', created_by=self.user,
+            payload={'name': 'Launch', 'sender_email': 'it@hopesecure.tech', 'target_emails': ['a@example.com', 'b@example.com']}
+        )
+        for email in ['a@example.com', 'b@example.com']:
+            DeadLetter.objects.create(job=job, email=email, error_type='TooManyRequestsError', status_code=429, retryable=True, attempts=4)
+
+    def test_replay_launch_dead_letters(self):
+        """Replaying requires a filter and queues the failed recipients as a new launch job"""
+        listed = self.client.get(reverse('dead-letter-list'))
+        self.assertEqual(listed.data['count'], 2)
+        self.assertEqual(self.client.post(reverse('dead-letter-replay'), {}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('dead-letter-list'), {'limit': 'all'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('dead-letter-replay'), {'retryable': True}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['replayed'], 2)
+        job = SendJob.objects.get(id=response.data['job_ids'][0])
+        self.assertEqual((job.job_type, job.status, job.payload['target_emails']), ('launch', 'queued', ['a@example.com', 'b@example.com']))
+        self.assertEqual(self.client.get(reverse('dead-letter-list')).data['count'], 0)
+
+    def test_replay_refused_for_inactive_campaign(self):
+        """A paused campaign's letters are not consumed by a job that would halt at once"""
+        campaign = create_campaign(self.user, ['c@example.com'])
+        Campaign.objects.filter(id=campaign.id).update(status='paused')
+        campaign.targets.update(status='failed')
+        letter = DeadLetter.objects.create(campaign=campaign, email='c@example.com', error_type='SendFailed', attempts=1)
+
+        response = self.client.post(reverse('dead-letter-replay'), {'campaign_id': campaign.id}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        letter.refresh_from_db()
+        self.assertEqual(letter.status, 'pending')
+        self.assertEqual(campaign.targets.get().status, 'failed')
+        self.assertFalse(SendJob.objects.filter(campaign=campaign).exists())
+
+        # Mixed with other letters, the paused campaign's are skipped and left pending
+        response = self.client.post(reverse('dead-letter-replay'), {'all': True}, format='json')
+
+        self.assertEqual((response.data['replayed'], response.data['skipped']), (2, 1))
+        letter.refresh_from_db()
+        self.assertEqual(letter.status, 'pending')
+
+
+class LaunchCampaignStreamTestCase(APITestCase):
+    """Test the NDJSON streaming mode of the launch endpoint"""
+
+    @mock.patch('campaigns.campaign_launch_service.iter_launch_results')
+    def test_stream_emits_results_and_summary(self, iter_launch_results):
+        """Each recipient's result is streamed with running counters, followed by a summary"""
+        iter_launch_results.return_value = iter([
+            {'recipient': 'a@example.com', 'success': True, 'message': 'sent', 'details': 202},
+            {'recipient': 'b@example.com', 'success': False, 'message': 'SendGrid error: 500'},
+        ])
+        payload = {'name': 'Launch', 'target_emails': ['a@example.com', 'b@example.com'], 'sender_email': 'it@hopesecure.tech'}
+
+        response = self.client.post(reverse('launch-campaign') + '?stream=ndjson', payload, format='json')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([e['event'] for e in events], ['start', 'result', 'result', 'summary'])
+        self.assertEqual((events[2]['sent'], events[2]['failed'], events[2]['processed']), (1, 1, 2))
+        self.assertEqual(events[3]['successful_sends'], 1)
+        job = SendJob.objects.get(id=events[0]['job_id'])
+        self.assertEqual((job.status, job.sent_count, job.failed_count), ('completed', 1, 1))
+
+
+class LaunchCampaignASGIStreamTestCase(TransactionTestCase):
+    """Test the streaming launch as served by Django's ASGI handler (the view runs on a worker thread)"""
+
+    payload = {'name': 'Launch', 'target_emails': ['a@example.com', 'b@example.com'], 'sender_email': 'it@hopesecure.tech'}
+
+    def serve(self, on_event):
+        """
+        POST a streaming launch through ASGIHandler; on_event(event, disconnect)
+        sees each NDJSON line as it is sent and may set disconnect to hang up
+        """
+        path = reverse('launch-campaign')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'stream=ndjson',
+            'headers': [(b'host', b'testserver'), (b'content-type', b'application/json')],
+            'client': ('127.0.0.1', 5000), 'server': ('testserver', 80),
+        }
+
+        async def run():
+            disconnect = asyncio.Event()
+            body = [{'type': 'http.request', 'body': json.dumps(self.payload).encode(), 'more_body': False}]
+
+            async def receive():
+                if body:
+                    return body.pop()
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.body':
+                    for line in message.get('body', b'').splitlines():
+                        on_event(json.loads(line), disconnect)
+
+            await ASGIHandler()(scope, receive, send)
+
+        asyncio.run(run())
+
+    @mock.patch('campaigns.campaign_launch_service.iter_launch_results')
+    def test_events_sent_as_they_happen(self, iter_launch_results):
+        """The start event reaches the client before the first send completes"""
+        started = threading.Event()
+        waited = []
+
+        def results(payload):
+            waited.append(started.wait(timeout=5))
+            yield {'recipient': 'a@example.com', 'success': True, 'message': 'sent', 'details': 202}
+            yield {'recipient': 'b@example.com', 'success': True, 'message': 'sent', 'details': 202}
+
+        iter_launch_results.side_effect = results
+        events = []
+
+        def on_event(event, disconnect):
+            events.append(event)
+            if event['event'] == 'start':
+                started.set()
+
+        self.serve(on_event)
+
+        self.assertEqual(waited, [True])
+        self.assertEqual([e['event'] for e in events], ['start', 'result', 'result', 'summary'])
+        self.assertEqual(SendJob.objects.get().status, 'completed')
+
+    @mock.patch('campaigns.campaign_launch_service.iter_launch_results')
+    def test_disconnect_closes_launch(self, iter_launch_results):
+        """A client that hangs up mid-launch gets the job finished with the disconnect recorded"""
+        def results(payload):
+            yield {'recipient': 'a@example.com', 'success': True, 'message': 'sent', 'details': 202}
+            time.sleep(0.2)
+            yield {'recipient': 'b@example.com', 'success': True, 'message': 'sent', 'details': 202}
+
+        iter_launch_results.side_effect = results
+        events = []
+
+        def on_event(event, disconnect):
+            events.append(event)
+            if event['event'] == 'result':
+                disconnect.set()
+
+        self.serve(on_event)
+
+        self.assertEqual([e['event'] for e in events], ['start', 'result'])
+        job = SendJob.objects.get()
+        self.assertEqual(job.error, 'Client disconnected before the launch finished')
+
+
+@mock.patch('campaigns.sendgrid_service.rate_limiter.require')
+class SendGridBatchTestCase(TestCase):
+    """Test batched SendGrid personalizations"""
+
+    def setUp(self):
+        self.service = SendGridPhishingService()
+        self.service.sendgrid_client = mock.Mock()
+        self.template_data = {
+            'subject': 'Reset your password',
+            'html_content': '<p>Hello {{recipient_name}}, <a href="{{tracking_url}}">reset</a></p>',
+            'sender_email': 'it@company.com',
+            'use_spoofing': False,
+        }
+
+    def test_recipients_share_requests(self, acquire):
+        """1500 recipients go out in two requests with per-recipient substitutions"""
+        self.service.sendgrid_client.send.return_value = mock.Mock(status_code=202, headers={'X-Message-Id': 'abc'})
+        emails = [f'user{i}@example.com' for i in range(1500)]
+
+        results = self.service.send_campaign_emails_sendgrid(emails, self.template_data, campaign_id=7, batch=True)
+
+        self.assertEqual(results['sent'], 1500)
+        self.assertEqual(self.service.sendgrid_client.send.call_count, 2)
+        body = self.service.sendgrid_client.send.call_args_list[0].args[0].get()
+        self.assertEqual(len(body['personalizations']), 1000)
+        self.assertIn('%recipient_name%', body['content'][0]['value'])
+        substitutions = body['personalizations'][0]['substitutions']
+        self.assertEqual(set(substitutions), {'%recipient_name%', '%tracking_url%', '%tracking_pixel%'})
+        # No campaign targets behind these recipients, so their links are left untracked and carry no pixel
+        self.assertEqual(substitutions['%tracking_url%'], landing_url())
+        self.assertEqual(substitutions['%tracking_pixel%'], '')
+
+    def test_batch_substitutes_every_merge_field_escaped(self, acquire):
+        """Every placeholder becomes a tag, filled with the same escaped values a compiled render uses"""
+        self.service.sendgrid_client.send.return_value = mock.Mock(status_code=202, headers={})
+        merge_fields = mock.Mock()
+        merge_fields.get.return_value = dict(
+            default_context('ann@example.com'), first_name='Ann <b>Lee</b>', department='R&D', target_id=None
+        )
+
+        self.service.send_batch_emails_sendgrid(
+            ['ann@example.com'], 'Subject', '<p>Hi {{first_name}} from {{ department }}</p>',
+            use_spoofing=False, merge_fields=merge_fields
+        )
+
+        body = self.service.sendgrid_client.send.call_args.args[0].get()
+        self.assertEqual(body['content'][0]['value'], '<p>Hi %first_name% from %department%</p>')
+        self.assertEqual(
+            body['personalizations'][0]['substitutions'],
+            {'%first_name%': 'Ann &lt;b&gt;Lee&lt;/b&gt;', '%department%': 'R&amp;D'}
+        )
+
+    def test_failed_batch_reported_per_recipient(self, acquire):
+        """Only recipients in the failed batch are reported as failed"""
+        self.service.sendgrid_client.send.side_effect = [
+            mock.Mock(status_code=202, headers={}),
+            mock.Mock(status_code=500, headers={}, body=b'error'),
+        ]
+        emails = [f'user{i}@example.com' for i in range(3)]
+
+        results = self.service.send_campaign_emails_sendgrid_batch(emails, self.template_data, batch_size=2)
+
+        self.assertEqual(results['sent'], 2)
+        self.assertEqual(results['failed'], 1)
+        self.assertEqual(results['failed_recipients'][0]['recipient'], 'user2@example.com')
+        self.assertEqual(results['failed_recipients'][0]['status_code'], 500)
+
+
+@override_settings(PHISHING_EMAIL_SETTINGS={'RATE_LIMIT_BURST_SECONDS': 60})
+class DomainRateLimiterTestCase(TestCase):
+    """Test the shared per-domain token bucket"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password='testpass123'
+        )
+        self.limiter = DomainRateLimiter()
+
+    def test_burst_then_throttle(self):
+        """A domain can burst one minute of its hourly budget, then must wait"""
+        EmailDomain.objects.create(name='phish.test', created_by=self.user, rate_limit_per_hour=120)
+
+        # Interactive is the top class, so nothing is held back from it
+        granted = [self.limiter.try_acquire('phish.test', priority='interactive')[0] for _ in range(3)]
+        self.assertEqual(granted, [True, True, False])
+        self.assertAlmostEqual(self.limiter.try_acquire('phish.test', priority='interactive')[1], 30, delta=1)
+
+    def test_daily_cap(self):
+        """max_emails_per_day stops sending until the next day"""
+        EmailDomain.objects.create(name='phish.test', created_by=self.user, rate_limit_per_hour=3600, max_emails_per_day=2)
+
+        self.assertTrue(self.limiter.acquire('phish.test', count=2, timeout=0))
+        self.assertFalse(self.limiter.acquire('phish.test', timeout=0))
+
+    def test_priority_reserve(self):
+        """Bulk and campaign sends leave the reserved share for test emails"""
+        EmailDomain.objects.create(name='phish.test', created_by=self.user, rate_limit_per_hour=600)
+
+        def drain(priority):
+            granted = 0
+            while self.limiter.try_acquire('phish.test', priority=priority)[0]:
+                granted += 1
+            return granted
+
+        # Capacity 10: bulk leaves 1 + 3 tokens, campaign leaves 1
+        self.assertEqual(drain('bulk'), 6)
+        self.assertEqual(drain('campaign'), 3)
+        self.assertTrue(self.limiter.acquire('phish.test', priority='interactive', timeout=0))
+
+    def test_refusal_retryable_on_every_path(self):
+        """A refused budget is retryable no sooner than the bucket recovers, whichever service sends"""
+        EmailDomain.objects.create(name='phish.test', created_by=self.user, rate_limit_per_hour=3600, max_emails_per_day=1)
+        self.limiter.require('phish.test', timeout=0)
+        with self.assertRaises(SendFailure) as refused:
+            self.limiter.require('phish.test', timeout=0)
+        retryable, retry_after, _ = classify_error(refused.exception)
+        self.assertTrue(retryable)
+        self.assertGreater(retry_after, 0)
+
+        skeleton_service = PhishingEmailService()
+        skeleton = skeleton_service.build_message_skeleton('Reset', '<p>Hi</p>', 'IT', 'it@phish.test', 'company.com', False)
+        sends = {
+            'smtp': lambda: skeleton_service.send_from_skeleton(skeleton, 'a@example.com', raise_errors=True),
+            'simple': lambda: SimpleSendGridService().send_simple_email(
+                'a@example.com', 'Reset', '<p>Hi</p>', sender_email='it@phish.test', raise_errors=True
+            ),
+            'multi_domain': lambda: MultiDomainPhishingService().send_single_email(
+                'a@example.com', 'Reset', 'it@phish.test', 'IT', '<p>Hi</p>', raise_errors=True
+            ),
+        }
+        with mock.patch.object(rate_limiter, 'try_acquire', return_value=(False, 3600.0)):
+            for path, send in sends.items():
+                with self.subTest(path), self.assertRaises(SendFailure) as refused:
+                    send()
+                self.assertEqual(classify_error(refused.exception)[:2], (True, 3600.0))
+
+
+class SMTPConnectionPoolTestCase(TestCase):
+    """Test pooled SMTP sessions"""
+
+    @mock.patch('campaigns.smtp_pool.smtplib.SMTP')
+    def test_session_reused(self, smtp):
+        """Consecutive messages share one session"""
+        pool = SMTPConnectionPool(max_per_host=2)
+
+        for _ in range(3):
+            pool.send_message(mock.Mock(), 'smtp.test', 587)
+
+        self.assertEqual(smtp.call_count, 1)
+        self.assertEqual(smtp.return_value.send_message.call_count, 3)
+
+    @mock.patch('campaigns.smtp_pool.smtplib.SMTP')
+    def test_reconnect_on_session_error(self, smtp):
+        """A dropped session is discarded and the message retried on a new one"""
+        broken, fresh = mock.Mock(), mock.Mock()
+        broken.send_message.side_effect = smtplib.SMTPServerDisconnected()
+        smtp.side_effect = [broken, fresh]
+        pool = SMTPConnectionPool()
+
+        pool.send_message(mock.Mock(), 'smtp.test', 587)
+
+        self.assertEqual(smtp.call_count, 2)
+        fresh.send_message.assert_called_once()
+        self.assertEqual(pool._idle[('smtp.test', 587, False, '')][0][0], fresh)
+
+    @mock.patch('campaigns.smtp_pool.smtplib.SMTP')
+    def test_rejected_message_keeps_session(self, smtp):
+        """A 550 is the message's failure: it is not resent and the session stays pooled"""
+        session = smtp.return_value
+        for error in (
+            smtplib.SMTPDataError(550, b'Mailbox unavailable'),
+            smtplib.SMTPRecipientsRefused({'x@example.com': (550, b'No such user')}),
+        ):
+            session.send_message.reset_mock()
+            session.send_message.side_effect = error
+            pool = SMTPConnectionPool()
+
+            with self.assertRaises(type(error)):
+                pool.send_message(mock.Mock(), 'smtp.test', 587)
+
+            session.send_message.assert_called_once()
+            self.assertEqual(pool._idle[('smtp.test', 587, False, '')][0][0], session)
+        self.assertEqual(smtp.call_count, 2)
+
+
+class SendGridClientTestCase(TestCase):
+    """Test the shared keep-alive SendGrid client"""
+
+    def test_client_is_shared(self):
+        """Every caller gets the same client instance"""
+        self.assertIs(get_sendgrid_client(), get_sendgrid_client())
+
+    def test_interactive_client_is_separate(self):
+        """Test emails get their own client, so a busy campaign pool cannot block them"""
+        interactive = get_sendgrid_client(priority='interactive')
+
+        self.assertIs(interactive, get_sendgrid_client(priority='interactive'))
+        self.assertIsNot(interactive, get_sendgrid_client())
+
+    def test_requests_use_pooled_session(self):
+        """Fluent API calls are sent through the shared session"""
+        session = mock.Mock()
+        session.request.return_value = mock.Mock(status_code=202, content=b'', headers={'X-Message-Id': 'abc'})
+        sg = build_sendgrid_client(api_key='test-key', session=session)
+
+        response = sg.client.mail.send.post(request_body={'personalizations': []})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.headers['X-Message-Id'], 'abc')
+        method, url = session.request.call_args.args
+        self.assertEqual((method, url), ('POST', 'https://api.sendgrid.com/v3/mail/send'))
+
+
+class AsyncSendEngineTestCase(TestCase):
+    """Test the bounded-concurrency send engine"""
+
+    def test_concurrency_bounded_per_domain(self):
+        """Each sending domain keeps at most its limit of sends in flight"""
+        lock = threading.Lock()
+        in_flight = {'a.test': 0, 'b.test': 0}
+        peak = {'a.test': 0, 'b.test': 0}
+
+        def send(domain):
+            with lock:
+                in_flight[domain] += 1
+                peak[domain] = max(peak[domain], in_flight[domain])
+            time.sleep(0.05)
+            with lock:
+                in_flight[domain] -= 1
+            return True
+
+        tasks = [SendTask(i, lambda d=domain: send(d), domain=domain) for i, domain in enumerate(['a.test', 'b.test'] * 8)]
+        engine = AsyncSendEngine(provider_concurrency={'sendgrid': 10}, domain_concurrency=3)
+
+        results = list(engine.iter_results(tasks))
+
+        self.assertEqual(len(results), 16)
+        self.assertEqual(peak, {'a.test': 3, 'b.test': 3})
+
+    def test_errors_reported_per_task(self):
+        """A failing send is reported with its error and does not stop the others"""
+        def fail():
+            raise RuntimeError('boom')
+
+        tasks = [SendTask('ok', lambda: True), SendTask('bad', fail)]
+        results = {task.key: (result, error) for task, result, error in AsyncSendEngine().iter_results(tasks)}
+
+        self.assertEqual(results['ok'], (True, None))
+        self.assertIsNone(results['bad'][0])
+        self.assertIsInstance(results['bad'][1], RuntimeError)
+
+    @mock.patch('campaigns.send_engine.backoff_delay', return_value=0)
+    def test_retryable_errors_retried(self, backoff_delay):
+        """Throttled sends are retried up to max_attempts; permanent rejections are not retried"""
+        throttled = TooManyRequestsError(429, 'Too Many Requests', b'', {'Retry-After': '2'})
+        flaky_outcomes = iter([throttled, throttled, True])
+
+        def flaky():
+            outcome = next(flaky_outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        def always_throttled():
+            raise throttled
+
+        def rejected():
+            raise smtplib.SMTPRecipientsRefused({'x@example.com': (550, b'No such user')})
+
+        tasks = [SendTask('flaky', flaky), SendTask('throttled', always_throttled), SendTask('rejected', rejected)]
+        results = {
+            task.key: (task.attempts, result, error)
+            for task, result, error in AsyncSendEngine(max_attempts=3).iter_results(tasks)
+        }
+
+        self.assertEqual(results['flaky'], (3, True, None))
+        self.assertEqual(results['throttled'][0], 3)
+        self.assertIs(results['throttled'][2], throttled)
+        self.assertEqual(results['rejected'][0], 1)
+        self.assertEqual(backoff_delay.call_args_list[0].args, (1, 2.0))
+
+    def test_throttled_domain_leaves_provider_slots(self):
+        """A lane waiting for rate budget holds no provider slot, so another lane keeps sending"""
+        released = threading.Event()
+
+        def try_acquire(domain, count=1, priority=None):
+            if domain == 'b.test' or released.is_set():
+                return True, 0.0
+            return False, 0.02
+
+        tasks = [
+            SendTask((domain, i), lambda: True, domain=domain, tokens=1)
+            for i in range(3) for domain in ('a.test', 'b.test')
+        ]
+        # 4 tasks in flight: the throttled lane can hold two (one waiting for budget, one for its domain slot)
+        engine = AsyncSendEngine(provider_concurrency={'sendgrid': 2, 'smtp': 2}, domain_concurrency=1)
+
+        order = []
+        with mock.patch.object(rate_limiter, 'try_acquire', side_effect=try_acquire):
+            for task, result, error in engine.iter_results(tasks):
+                order.append(task.key[0])
+                if order.count('b.test') == 3:
+                    released.set()
+
+        self.assertEqual(order, ['b.test'] * 3 + ['a.test'] * 3)
+
+    @mock.patch('campaigns.send_engine.backoff_delay', return_value=0.3)
+    def test_backoff_releases_slot(self, backoff_delay):
+        """A send waiting to retry holds no slot, so the next send goes out meanwhile"""
+        throttled = TooManyRequestsError(429, 'Too Many Requests', b'', {})
+        outcomes = iter([throttled, True])
+
+        def flaky():
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        tasks = [SendTask('flaky', flaky), SendTask('next', lambda: True)]
+        engine = AsyncSendEngine(provider_concurrency={'sendgrid': 1})
+
+        order = [task.key for task, result, error in engine.iter_results(tasks)]
+
+        self.assertEqual(order, ['next', 'flaky'])
+
+    @mock.patch('campaigns.send_engine.backoff_delay', return_value=0)
+    @mock.patch('campaigns.custom_domain_email_service.rate_limiter.try_acquire', return_value=(True, 0.0))
+    @mock.patch('campaigns.custom_domain_email_service.get_sendgrid_client')
+    def test_custom_domain_launch_retries_throttled_send(self, get_sendgrid_client, acquire, backoff_delay):
+        """A 429 on the custom-domain launch path reaches the retry policy instead of failing the recipient"""
+        get_sendgrid_client.return_value.send.side_effect = [
+            TooManyRequestsError(429, 'Too Many Requests', b'', {}), mock.Mock(status_code=202)
+        ]
+        payload = {
+            'name': 'Launch', 'target_emails': ['a@example.com'], 'sender_email': 'it@hopesecure.tech',
+            'use_custom_domain': True,
+        }
+
+        results = list(iter_launch_results(payload))
+
+        self.assertEqual([(r['success'], r['attempts']) for r in results], [(True, 2)])
+
+    @mock.patch('campaigns.custom_domain_email_service.rate_limiter.try_acquire', return_value=(True, 0.0))
+    def test_sends_concurrently_to_local_provider(self, acquire):
+        """create_campaign_emails keeps several requests in flight against the fake SendGrid endpoint"""
+        email_settings = {
+            'SENDGRID_API_KEY': 'test-key',
+            'SEND_CONCURRENCY_PER_PROVIDER': {'sendgrid': 4},
+            'SEND_CONCURRENCY_PER_DOMAIN': 4,
+        }
+        with FakeSendGridServer(FaultProfile(latency=0.05)) as server:
+            email_settings['SENDGRID_API_HOST'] = server.url
+            with override_settings(PHISHING_EMAIL_SETTINGS=email_settings):
+                results = CustomDomainEmailService().create_campaign_emails(
+                    {'sender_email': 'it@hopesecure.tech'},
+                    [f'user{i}@example.com' for i in range(12)]
+                )
+
+        self.assertEqual(results['successful_sends'], 12)
+        self.assertEqual([r['recipient'] for r in results['results']], [f'user{i}@example.com' for i in range(12)])
+        self.assertEqual(server.stats.peak_in_flight, 4)
+
+
+class FakeProviderTestCase(TestCase):
+    """Test the local SendGrid stand-in"""
+
+    def send(self, server):
+        with override_settings(PHISHING_EMAIL_SETTINGS={'SENDGRID_API_KEY': 'test-key', 'SENDGRID_API_HOST': server.url}):
+            sg = build_sendgrid_client()
+        message = Mail(from_email='it@hopesecure.tech', to_emails='user@example.com', subject='Hi', html_content='<p>Hi</p>')
+        return sg.send(message)
+
+    def test_accepts_mail_send(self):
+        """mail/send answers 202 with a message id and counts recipients"""
+        with FakeSendGridServer() as server:
+            response = self.send(server)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.headers['X-Message-Id'])
+        self.assertEqual(server.stats.as_dict()['recipients'], 1)
+
+    def test_injects_throttling(self):
+        """A throttled request gets 429 with Retry-After, as python_http_client raises it"""
+        with FakeSendGridServer(FaultProfile(throttle_rate=1.0, retry_after=7)) as server:
+            with self.assertRaises(TooManyRequestsError) as raised:
+                self.send(server)
+
+        self.assertEqual(raised.exception.headers['Retry-After'], '7')
+        self.assertEqual(server.stats.throttled, 1)
+
+
+class RetryPolicyTestCase(TestCase):
+    """Test send failure classification and backoff"""
+
+    def test_classify_errors(self):
+        """Throttling, 5xx and SMTP 4xx replies are retryable; other rejections and bugs are permanent"""
+        self.assertEqual(classify_error(TooManyRequestsError(429, '', b'', {'Retry-After': '7'})), (True, 7.0, 429))
+        self.assertEqual(classify_error(BadRequestsError(400, '', b'', {})), (False, None, 400))
+        self.assertEqual(classify_error(smtplib.SMTPDataError(451, b'Local error')), (True, None, 451))
+        self.assertEqual(classify_error(smtplib.SMTPDataError(554, b'Rejected')), (False, None, 554))
+        self.assertEqual(classify_error(smtplib.SMTPServerDisconnected()), (True, None, None))
+        self.assertEqual(classify_error(KeyError('bug')), (False, None, None))
+
+    def test_backoff_grows_and_honors_retry_after(self):
+        """Backoff doubles per attempt up to the cap, and never retries before Retry-After"""
+        with mock.patch('campaigns.retry_policy.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([backoff_delay(attempt) for attempt in (1, 2, 3)], [1, 2, 4])
+            self.assertEqual(backoff_delay(10), 60)
+            self.assertEqual(backoff_delay(1, retry_after=7), 8)
+
+
+class PersonalizationTestCase(TestCase):
+    """Test compiled templates and merge field loading"""
+
+    def test_render_fills_known_placeholders(self):
+        """Known fields are substituted and escaped; unknown placeholders are left for a later pass"""
+        template = compile_template('<p>Hi {{ recipient_name }}, {{recipient_email}}</p><a href="{{tracking_url}}">')
+
+        html = template.render({'recipient_name': 'Tom & Jerry', 'recipient_email': 'tj@example.com'})
+
+        self.assertEqual(html, '<p>Hi Tom &amp; Jerry, tj@example.com</p><a href="{{tracking_url}}">')
+        self.assertIs(compile_template(template.source), template)
+
+    def test_merge_fields_loaded_per_chunk(self):
+        """Employee and target fields are fetched in one pass per chunk of recipients"""
+        user = User.objects.create_user(email='owner@example.com', username='owner', password='testpass123')
+        other = User.objects.create_user(email='other@example.com', username='other', password='testpass123')
+        department = Department.objects.create(name='Finance', manager=user)
+        Employee.objects.create(
+            employee_id='E1', first_name='Alice', last_name='Smith', email='alice@example.com',
+            department=department, position='Analyst', hire_date='2024-01-01', created_by=user
+        )
+        # Another tenant's record for the same address is never read
+        Employee.objects.create(
+            employee_id='E2', first_name='Robert', last_name='Jones', email='bob.jones@example.com',
+            department=department, position='CFO', hire_date='2024-01-01', created_by=other
+        )
+        emails = ['alice@example.com', 'bob.jones@example.com', 'carol@example.com']
+        campaign = create_campaign(user, emails)
+        campaign.targets.filter(email='carol@example.com').update(first_name='Caroline', department='Legal')
+        loader = MergeFieldLoader(emails, campaign=campaign, chunk_size=2)
+
+        with self.assertNumQueries(4):
+            contexts = [loader.get(email) for email in emails]
+
+        self.assertEqual(loader.queries, 2)
+        self.assertEqual(contexts[0]['recipient_name'], 'Alice Smith')
+        self.assertEqual(contexts[0]['department'], 'Finance')
+        self.assertEqual(contexts[1]['recipient_name'], 'Bob Jones')
+        self.assertEqual((contexts[2]['recipient_name'], contexts[2]['department']), ('Caroline', 'Legal'))
+
+        ownerless = MergeFieldLoader(['alice@example.com'])
+        self.assertEqual(ownerless.get('alice@example.com')['recipient_name'], 'Alice')
+        self.assertEqual(MergeFieldLoader(['alice@example.com'], owner=user).get('alice@example.com')['position'], 'Analyst')
+
+
+class SuppressionTestCase(TransactionTestCase):
+    """Test the suppression list and its Bloom filter prefilter (send jobs run on worker threads)"""
+
+    def setUp(self):
+        suppression_list.clear()
+        self.user = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password='testpass123'
+        )
+
+    def test_bloom_filter_prefilters_queries(self):
+        """Suppressed addresses are always found; clean recipients cost no confirmation query"""
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'user{i}@example.com')
+        self.assertTrue(all(f'user{i}@example.com' in bloom for i in range(1000)))
+        false_positives = sum(f'other{i}@example.com' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+        suppress(['Blocked@Example.com'], reason='bounce')
+        suppression_list.refresh(force=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(find_suppressed(['clean@example.com']), set())
+        self.assertEqual(find_suppressed(['BLOCKED@example.com', 'clean@example.com']), {'blocked@example.com'})
+
+    def test_refresh_catches_late_commits(self):
+        """A row that commits after newer rows were read is still folded in by the next refresh"""
+        suppression_list.refresh(force=True)
+        SuppressedEmail.objects.create(email='late@example.com', reason='bounce')
+        SuppressedEmail.objects.filter(email='late@example.com').update(created_at=timezone.now() - timedelta(minutes=1))
+
+        suppression_list.refresh(force=True)
+
+        self.assertTrue(suppression_list.might_contain('late@example.com'))
+
+    def test_suppressions_scoped_and_opt_outs_protected(self):
+        """Users only see their organization's entries; only staff add them and opt-outs are never added by hand"""
+        company = Company.objects.create(name='Acme', created_by=self.user)
+        org_admin = User.objects.create_user(
+            email='admin@acme.test', username='acme-admin', password='testpass123', role='admin', organization=company
+        )
+        colleague = User.objects.create_user(
+            email='staff@acme.test', username='acme-staff', password='testpass123', organization=company
+        )
+        suppress(['owner-excluded@example.com'], created_by=self.user)
+        suppress(['departed@example.com'], reason='departed', created_by=colleague)
+        suppress(['excluded@example.com'], created_by=colleague)
+        suppress(['opted-out@example.com'], reason='unsubscribe', note='SendGrid event webhook')
+        opted_out = SuppressedEmail.objects.get(email='opted-out@example.com')
+        excluded = SuppressedEmail.objects.get(email='excluded@example.com')
+
+        self.client.force_login(self.user)
+        add = lambda reason: self.client.post(
+            reverse('suppression-list'), {'emails': ['other@example.com'], 'reason': reason}, content_type='application/json'
+        )
+        self.assertEqual(add('excluded').status_code, status.HTTP_403_FORBIDDEN)
+        listed = self.client.get(reverse('suppression-list')).json()
+        self.assertEqual([entry['email'] for entry in listed['results']], ['owner-excluded@example.com'])
+        self.assertEqual(self.client.delete(reverse('suppression-delete', args=[excluded.id])).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_login(colleague)
+        self.assertEqual(self.client.get(reverse('suppression-list')).json()['count'], 2)
+        self.assertEqual(self.client.delete(reverse('suppression-delete', args=[excluded.id])).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_login(org_admin)
+        self.assertEqual(self.client.delete(reverse('suppression-delete', args=[opted_out.id])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.delete(reverse('suppression-delete', args=[excluded.id])).status_code, status.HTTP_204_NO_CONTENT)
+
+        self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(add('unsubscribe').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(add('excluded').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.delete(reverse('suppression-delete', args=[opted_out.id])).status_code, status.HTTP_204_NO_CONTENT)
+
+    @mock.patch('campaigns.simple_email_service.SimpleSendGridService.send_simple_email')
+    def test_suppressed_targets_skipped(self, send_simple_email):
+        """Imports leave suppressed addresses out and send jobs mark late-suppressed targets instead of mailing them"""
+        send_simple_email.return_value = True
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('suppression-list'),
+            {'emails': ['left@example.com'], 'reason': 'departed'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        campaign = create_campaign(self.user, [])
+        self.assertEqual(import_targets(campaign, [{'email': e} for e in ('a@example.com', 'b@example.com', 'Left@example.com')]), 2)
+        self.assertEqual(set(campaign.targets.values_list('email', flat=True)), {'a@example.com', 'b@example.com'})
+
+        SuppressedEmail.objects.create(email='B@example.com', reason='unsubscribe')
+        enqueue_campaign_send(campaign, user=self.user)
+        job = run_job(claim_next_job('worker-1'))
+
+        self.assertEqual((job.sent_count, job.failed_count), (1, 0))
+        self.assertEqual(campaign.targets.get(email='b@example.com').status, 'suppressed')
+        self.assertEqual([call.kwargs['recipient_email'] for call in send_simple_email.call_args_list], ['a@example.com'])
+
+
+class MessageSkeletonTestCase(TestCase):
+    """Test prebuilt per-campaign MIME messages"""
+
+    def test_render_produces_personalized_message(self):
+        """Rendered bytes parse back to the same message MIMEMultipart would have built"""
+        skeleton = MessageSkeleton(
+            'Mise à jour du mot de passe',
+            'IT Support <it@c0mpany.com>',
+            '<p>Hello {{recipient_name}}</p>',
+            extra_headers={'From': 'ignored', 'Reply-To': 'it@c0mpany.com', 'X-Mailer': 'Microsoft Outlook 16.0'}
+        )
+
+        msg = message_from_bytes(skeleton.render('alice@example.com', {'recipient_name': 'Alice'}))
+
+        self.assertEqual(skeleton.envelope_from, 'it@c0mpany.com')
+        self.assertEqual(str(make_header(decode_header(msg['Subject']))), 'Mise à jour du mot de passe')
+        self.assertEqual((msg['To'], msg['From'], msg['X-Mailer']), ('alice@example.com', 'IT Support <it@c0mpany.com>', 'Microsoft Outlook 16.0'))
+        self.assertEqual(msg.get_all('From'), ['IT Support <it@c0mpany.com>'])
+        self.assertEqual(msg.get_content_type(), 'multipart/alternative')
+        html_part, = msg.get_payload()
+        self.assertEqual(html_part.get_payload(decode=True).decode('utf-8'), '<p>Hello Alice</p>')
+
+    @mock.patch('campaigns.email_service.rate_limiter.try_acquire', return_value=(True, 0.0))
+    @mock.patch('campaigns.email_service.smtp_pool.send_raw')
+    def test_campaign_builds_one_skeleton(self, send_raw, try_acquire):
+        """A campaign send builds its headers once, fills in each recipient and pays the envelope domain's budget up front"""
+        service = PhishingEmailService()
+        template_data = {'subject': 'Reset', 'html_content': '<p>Hi {{recipient_name}}</p>', 'sender_email': 'it@company.com'}
+
+        with mock.patch.object(service, 'build_message_skeleton', wraps=service.build_message_skeleton) as build:
+            results = service.send_campaign_emails(['a.b@example.com', 'c@example.com'], template_data)
+
+        self.assertEqual(results['sent'], 2)
+        build.assert_called_once()
+        sent = {call.args[1][0]: message_from_bytes(call.args[2]) for call in send_raw.call_args_list}
+        self.assertEqual(sent['a.b@example.com'].get_payload()[0].get_payload(decode=True), b'<p>Hi A B</p>')
+        self.assertEqual({call.args[0] for call in send_raw.call_args_list}, {'it@c0mpany.com'})
+        # One token per send, taken by the engine before dispatch for the domain the mail is sent from
+        self.assertEqual([call.args[0] for call in try_acquire.call_args_list], ['c0mpany.com', 'c0mpany.com'])
+
+
+class TemplateAttachmentTestCase(TestCase):
+    """Test encoded attachment payloads shared across sends"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password='testpass123'
+        )
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        attachment_cache.clear()
+        self.addCleanup(attachment_cache.clear)
+
+    def test_encoded_once_and_attached_to_every_message(self):
+        """Files are read once across runs; SMTP and SendGrid messages carry the same encoded payload"""
+        template = create_campaign(self.user, []).template
+        template.has_attachments = True
+        template.save()
+        template.attachments.create(
+            file=SimpleUploadedFile('invoice.pdf', b'%PDF-1.4 fake'), filename='invoice.pdf',
+            file_type='pdf', file_size=0
+        )
+
+        with mock.patch('campaigns.attachments.read_attachment', wraps=read_attachment) as read:
+            first = load_template_attachments(template.id)
+            second = load_template_attachments(template.id)
+
+        self.assertEqual(read.call_count, 1)
+        self.assertIs(first[0], second[0])
+        self.assertEqual(template.attachments.get().file_size, 13)
+
+        skeleton = MessageSkeleton('Invoice', 'Billing <billing@c0mpany.com>', '<p>See attached</p>', attachments=first)
+        parts = message_from_bytes(skeleton.render('alice@example.com')).get_payload()
+        self.assertEqual([part.get_content_type() for part in parts], ['text/html', 'application/pdf'])
+        self.assertEqual((parts[1].get_filename(), parts[1].get_payload(decode=True)), ('invoice.pdf', b'%PDF-1.4 fake'))
+
+        mails = [Mail('billing@c0mpany.com', email, 'Invoice', '<p>See attached</p>') for email in ('a@example.com', 'b@example.com')]
+        for mail in mails:
+            mail.add_attachment(first[0].sendgrid_attachment)
+        self.assertIs(mails[0].get()['attachments'][0]['content'], mails[1].get()['attachments'][0]['content'])
+
+    def test_cache_bounded(self):
+        """The least recently used payload is evicted once the byte budget is exceeded"""
+        cache = AttachmentCache(max_bytes=30, max_entries=10)
+        payloads = [AttachmentPayload(str(i), f'{i}.bin', 'application/octet-stream', b'x' * 9) for i in range(3)]
+
+        cache.put(payloads[0])
+        cache.put(payloads[1])
+        cache.get(payloads[0].key)
+        cache.put(payloads[2])
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(payloads[1].key))
+        self.assertIs(cache.get(payloads[0].key), payloads[0])
+
+
+class SendContextTestCase(TestCase):
+    """Test per-run send contexts"""
+
+    @mock.patch('campaigns.custom_domain_email_service.rate_limiter.try_acquire', return_value=(True, 0.0))
+    def test_domain_resolved_and_counted_once_per_run(self, acquire):
+        """A custom-domain run reads its domain once, sends valid tracking settings and writes emails_sent once"""
+        user = User.objects.create_user(email='owner@example.com', username='owner', password='testpass123')
+        domain = EmailDomain.objects.create(name='phish.test', created_by=user, open_tracking_enabled=False)
+        service = CustomDomainEmailService()
+        service.sg = mock.Mock()
+        service.sg.send.return_value = mock.Mock(status_code=202)
+
+        with CaptureQueriesContext(connection) as queries:
+            results = service.create_campaign_emails(
+                {'sender_email': 'it@phish.test', 'domain_id': domain.id},
+                [f'user{i}@example.com' for i in range(5)]
+            )
+
+        self.assertEqual(results['successful_sends'], 5)
+        self.assertEqual(len([q for q in queries if 'email_domains' in q['sql']]), 2)
+        domain.refresh_from_db()
+        self.assertEqual(domain.emails_sent, 5)
+        self.assertIsNotNone(domain.last_used)
+        tracking = service.sg.send.call_args.args[0].get()['tracking_settings']
+        self.assertEqual(tracking['click_tracking']['enable'], True)
+        self.assertEqual(tracking['open_tracking']['enable'], False)
+
+
+class MultiDomainLaneTestCase(TransactionTestCase):
+    """Test per-domain send lanes (sends run on worker threads)"""
+
+    def test_recipients_split_by_domain_budget(self):
+        """Each verified domain gets a lane sized by its hourly rate, and messages carry real tracking settings"""
+        user = User.objects.create_user(email='owner@example.com', username='owner', password='testpass123')
+        EmailDomain.objects.create(name='fast.test', status='verified', rate_limit_per_hour=200, created_by=user)
+        EmailDomain.objects.create(name='slow.test', status='verified', rate_limit_per_hour=100, created_by=user)
+        service = MultiDomainPhishingService()
+        service.sendgrid_client = mock.Mock()
+        service.sendgrid_client.send.return_value = mock.Mock(status_code=202)
+
+        with mock.patch('campaigns.multi_domain_service.rate_limiter.try_acquire', return_value=(True, 0.0)):
+            results = service.send_multi_domain_campaign(
+                [f'user{i}@example.com' for i in range(9)], {'campaign_id': 'lanes', 'domain_type': 'banking'}
+            )
+
+        self.assertEqual((results['sent'], results['lanes']), (9, {'fast.test': 6, 'slow.test': 3}))
+        message = service.sendgrid_client.send.call_args.args[0].get()
+        self.assertEqual(message['tracking_settings']['open_tracking'], {'enable': True})
+        self.assertEqual(message['headers']['X-Mailer'], 'Microsoft Outlook 16.0')
+
+    def test_routing_table_cached_until_domain_changes(self):
+        """Services share one routing table; saving an EmailDomain invalidates it"""
+        user = User.objects.create_user(email='owner@example.com', username='owner', password='testpass123')
+        domain = EmailDomain.objects.create(name='bank-verification.org', status='verified', created_by=user)
+        EmailDomain.objects.create(name='microsoft-update.com', status='verified', created_by=user)
+        MultiDomainPhishingService()
+
+        with self.assertNumQueries(0):
+            service = MultiDomainPhishingService()
+        self.assertEqual(service.get_suitable_domains('banking'), ('bank-verification.org',))
+        self.assertEqual(service.get_suitable_domains('social'), service.routes.domains)
+
+        domain.status = 'inactive'
+        domain.save()
+        self.assertEqual(MultiDomainPhishingService().get_suitable_domains('banking'), ('microsoft-update.com',))
+
+
+class SendGridWebhookTestCase(TestCase):
+    """Test the signed SendGrid event webhook"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password='testpass123'
+        )
+        self.campaign = create_campaign(self.user, ['a@example.com', 'b@example.com'])
+        self.campaign.targets.update(status='sent')
+        for target in self.campaign.targets.all():
+            CampaignTarget.objects.filter(id=target.id).update(provider_message_id=f'mid-{target.email[0]}')
+
+        self.private_key = PrivateKey()
+        public_pem = self.private_key.publicKey().toPem()
+        public_key = ''.join(line for line in public_pem.splitlines() if line and not line.startswith('-----'))
+        settings_override = dict(settings.PHISHING_EMAIL_SETTINGS, SENDGRID_WEBHOOK_VERIFICATION_KEY=public_key)
+        self.enterContext(override_settings(PHISHING_EMAIL_SETTINGS=settings_override))
+
+    def post_events(self, events, signature=None):
+        body = json.dumps(events, indent=1)
+        timestamp = str(int(time.time()))
+        signature = signature or Ecdsa.sign(timestamp + body, self.private_key).toBase64()
+        return self.client.post(
+            reverse('sendgrid-event-webhook'), body, content_type='application/json',
+            headers={SIGNATURE_HEADER: signature, TIMESTAMP_HEADER: timestamp}
+        )
+
+    def test_batch_applied(self):
+        """Events update targets, counters and the suppression list; repeats count once"""
+        events = [
+            {'event': 'delivered', MESSAGE_ID_ARG: 'mid-a', 'sg_event_id': 'e1', 'timestamp': 1700000000},
+            {'event': 'open', MESSAGE_ID_ARG: 'mid-a', 'sg_event_id': 'e2', 'timestamp': 1700000100, 'ip': '10.0.0.1'},
+            {'event': 'open', MESSAGE_ID_ARG: 'mid-a', 'sg_event_id': 'e3', 'timestamp': 1700000200},
+            {'event': 'click', MESSAGE_ID_ARG: 'mid-b', 'sg_event_id': 'e4', 'url': 'http://x.test/'},
+            {'event': 'bounce', MESSAGE_ID_ARG: 'mid-b', 'sg_event_id': 'e5', 'type': 'bounce'},
+            {'event': 'open', MESSAGE_ID_ARG: 'mid-unknown', 'sg_event_id': 'e6'},
+            {'event': 'open', 'sg_event_id': 'e7'},
+        ]
+
+        response = self.post_events(events)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['unmatched'], 1)
+        self.campaign.refresh_from_db()
+        self.assertEqual((self.campaign.emails_opened, self.campaign.links_clicked), (1, 1))
+        targets = {t.email: t for t in self.campaign.targets.all()}
+        self.assertEqual((targets['a@example.com'].status, targets['b@example.com'].status), ('opened', 'clicked'))
+        self.assertEqual(int(targets['a@example.com'].email_opened_at.timestamp()), 1700000100)
+        self.assertEqual(
+            sorted(self.campaign.events.values_list('event_type', flat=True)),
+            ['email_bounced', 'email_delivered', 'email_opened', 'email_opened', 'link_clicked']
+        )
+        self.assertTrue(SuppressedEmail.objects.filter(email='b@example.com', reason='bounce').exists())
+
+    def test_unsigned_batch_rejected(self):
+        """A bad signature is refused before any event is applied"""
+        response = self.post_events(
+            [{'event': 'open', MESSAGE_ID_ARG: 'mid-a'}],
+            signature=Ecdsa.sign('forged', self.private_key).toBase64()
+        )
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.campaign.events.exists())
+
+
+class TrackingEndpointTestCase(TestCase):
+    """Test the buffered open / click tracking endpoints"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password='testpass123'
+        )
+        self.campaign = create_campaign(self.user, ['a@example.com', 'b@example.com'])
+        self.campaign.targets.update(status='sent')
+        self.target = self.campaign.targets.get(email='a@example.com')
+        # Flushed by hand below instead of by the background thread
+        self.enterContext(mock.patch.object(tracking_buffer, 'start'))
+        self.addCleanup(tracking_buffer._hits.clear)
+
+    def test_hits_answered_without_database_then_flushed(self):
+        """Pixel and redirect make no queries; the buffered hits are applied on flush"""
+        token = make_tracking_token(self.campaign.id, self.target.id)
+
+        with self.assertNumQueries(0):
+            pixel = self.client.get(reverse('track-open', args=[token]), REMOTE_ADDR='10.0.0.7')
+            click = self.client.get(reverse('track-click', args=[token]))
+
+        self.assertEqual((pixel['Content-Type'], pixel.content), ('image/gif', TRANSPARENT_GIF))
+        self.assertEqual(click.status_code, 302)
+        self.assertEqual(len(tracking_buffer), 2)
+
+        self.assertEqual(tracking_buffer.flush(), 2)
+
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.status, 'clicked')
+        self.assertIsNotNone(self.target.email_opened_at)
+        self.assertEqual(self.campaign.events.get(event_type='email_opened').ip_address, '10.0.0.7')
+
+    def test_forged_tokens_and_bare_message_ids_rejected(self):
+        """Tampered, garbage or bare message ids are refused up front and nothing is buffered"""
+        other = self.campaign.targets.get(email='b@example.com')
+        CampaignTarget.objects.filter(id=other.id).update(provider_message_id='0123456789abcdef0123456789abcdef')
+        token = make_tracking_token(self.campaign.id, self.target.id)
+        campaign_part, _, signature = token.split('.')
+        forged = f'{campaign_part}.{int_to_base36(other.id)}.{signature}'  # Valid signature, other target
+
+        with self.assertNumQueries(0):
+            for tracking_id in (forged, 'not-a-token', token[:-2]):
+                self.assertEqual(self.client.get(reverse('track-click', args=[tracking_id])).status_code, 404)
+            message_id = self.client.get(reverse('track-open', args=['0123456789abcdef0123456789abcdef']))
+
+        self.assertEqual(message_id.status_code, 404)
+        self.assertEqual(len(tracking_buffer), 0)
+
+    def test_multi_domain_links_use_signed_tokens(self):
+        """Multi-domain sends link a campaign target through a routed token and leave anything else untracked"""
+        service = MultiDomainPhishingService()
+
+        tracked = service.generate_tracking_url(self.target.email, self.campaign.id, self.target.id)
+        untracked = service.generate_tracking_url(self.target.email, 'multi_domain_test_1')
+
+        token = make_tracking_token(self.campaign.id, self.target.id)
+        self.assertTrue(tracked.endswith(reverse('track-click', args=[token])))
+        self.assertEqual(untracked, landing_url())
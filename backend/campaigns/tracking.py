@@ -0,0 +1,203 @@
+"""
+Open / Click Tracking
+Tracking hits arrive in bursts (a campaign's opens come together), so the
+endpoints do no I/O: the pixel is a preallocated GIF, the click redirect is
+issued at once, and the hit is appended to an in-process buffer. A
+background thread drains the buffer every TRACKING_FLUSH_SECONDS (sooner
+once TRACKING_FLUSH_BATCH hits are waiting) and applies each batch through
+the same bulk path as the SendGrid event webhook.
+
+A tracking id is a compact HMAC-signed token carrying the campaign and
+target ids, so a hit is authenticated and decoded without any database
+read and forged or garbage ids are refused before anything is buffered.
+Sends with no campaign target get no tracking id at all: their links go
+straight to the landing page and carry no pixel.
+"""
+import atexit
+import base64
+import logging
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import base36_to_int, int_to_base36
+from .sendgrid_events import apply_events
+
+logger = logging.getLogger(__name__)
+
+# 1x1 transparent GIF, served from this one buffer for every open
+TRANSPARENT_GIF = base64.b64decode('R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
+
+
+def get_tracking_setting(name, default):
+    return settings.PHISHING_EMAIL_SETTINGS.get(name, default)
+
+
+TOKEN_SALT = 'campaigns.tracking.token'
+
+# Bytes of the HMAC kept in a token (96 bits)
+TOKEN_SIGNATURE_BYTES = 12
+
+def token_signature(value):
+    digest = salted_hmac(
+        TOKEN_SALT, value, secret=get_tracking_setting('TRACKING_SIGNING_KEY', None), algorithm='sha256'
+    ).digest()
+    return base64.urlsafe_b64encode(digest[:TOKEN_SIGNATURE_BYTES]).decode('ascii')
+
+
+def make_tracking_token(campaign_id, target_id):
+    """'<campaign>.<target>.<signature>' with the ids in base36, e.g. '2s.1ekf.Xq3...'"""
+    value = f"{int_to_base36(campaign_id)}.{int_to_base36(target_id)}"
+    return f"{value}.{token_signature(value)}"
+
+
+def read_tracking_token(token):
+    """(campaign_id, target_id) of a genuine token, None for anything else"""
+    if len(token) > 64:
+        return None
+    value, _, signature = token.rpartition('.')
+    if not value or not constant_time_compare(signature, token_signature(value)):
+        return None
+    campaign, _, target = value.partition('.')
+    try:
+        return base36_to_int(campaign), base36_to_int(target)
+    except ValueError:
+        return None
+
+
+def parse_tracking_id(tracking_id):
+    """
+    Fields identifying the target of a hit: campaign_id / target_id from a
+    signed token. None when the id is not genuine.
+    """
+    ids = read_tracking_token(tracking_id)
+    if ids is None:
+        return None
+    return {'campaign_id': ids[0], 'target_id': ids[1]}
+
+
+def tracking_base_url():
+    return getattr(settings, 'BASE_URL', 'http://localhost:8000')
+
+
+def landing_url():
+    """Awareness page a click ends up on"""
+    return get_tracking_setting('TRACKING_CLICK_REDIRECT_URL', 'http://localhost:5173/')
+
+
+def recipient_tracking_context(campaign_id, merge_context):
+    """
+    Tracking merge fields for one send: a signed token when the recipient
+    is a campaign target (merge_context has its target_id), else untracked
+    """
+    target_id = merge_context.get('target_id')
+    if campaign_id and target_id:
+        return tracking_context(make_tracking_token(campaign_id, target_id))
+    return untracked_context()
+
+
+def tracking_context(tracking_id, base_url=None):
+    """Merge fields that point a template's links and pixel at the tracking endpoints"""
+    base_url = base_url or tracking_base_url()
+    click_url = f"{base_url}/api/campaigns/track-click/{tracking_id}/"
+    return {
+        'tracking_url': click_url,
+        'click_here': click_url,
+        'tracking_pixel_url': f"{base_url}/api/campaigns/track-open/{tracking_id}/",
+    }
+
+
+def untracked_context():
+    """Merge fields for a send nothing can be attributed to: links go to the landing page, no pixel"""
+    url = landing_url()
+    return {'tracking_url': url, 'click_here': url, 'tracking_pixel_url': ''}
+
+
+class TrackingBuffer:
+    """
+    In-memory queue of tracking hits, written in batches off the request path
+
+    add() is a deque append and never blocks; when max_pending hits are
+    already waiting (the database is down or far behind) new hits are
+    dropped and counted rather than growing memory without bound.
+    """
+
+    def __init__(self, flush_seconds=None, flush_batch=None, max_pending=None):
+        self._flush_seconds = flush_seconds
+        self._flush_batch = flush_batch
+        self._max_pending = max_pending
+        self._hits = deque()
+        self._wakeup = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self.dropped = 0
+
+    @property
+    def flush_seconds(self):
+        return self._flush_seconds or get_tracking_setting('TRACKING_FLUSH_SECONDS', 1.0)
+
+    @property
+    def flush_batch(self):
+        return self._flush_batch or get_tracking_setting('TRACKING_FLUSH_BATCH', 500)
+
+    @property
+    def max_pending(self):
+        return self._max_pending or get_tracking_setting('TRACKING_MAX_PENDING', 100000)
+
+    def add(self, kind, target_ref, ip_address=None, user_agent=''):
+        """Queue a hit; target_ref is what parse_tracking_id returned for its id"""
+        if len(self._hits) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._hits.append({
+            'event': kind,
+            'timestamp': int(time.time()),
+            'ip': ip_address,
+            'useragent': user_agent,
+            **target_ref,
+        })
+        if self._thread is None:
+            self.start()
+        if len(self._hits) >= self.flush_batch:
+            self._wakeup.set()
+
+    def __len__(self):
+        return len(self._hits)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='tracking-flusher', daemon=True)
+                self._thread.start()
+                # Hits still queued when the process exits are written once more
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                logger.exception("Tracking flush failed")
+
+    def flush(self):
+        """Write every queued hit, flush_batch per transaction; returns how many were taken"""
+        taken = 0
+        while self._hits:
+            batch = []
+            while self._hits and len(batch) < self.flush_batch:
+                batch.append(self._hits.popleft())
+            taken += len(batch)
+            apply_events(batch)
+        if self.dropped:
+            logger.warning(f"Tracking buffer full: {self.dropped} hits dropped")
+            self.dropped = 0
+        return taken
+
+
+# Process-wide buffer behind the tracking endpoints
+tracking_buffer = TrackingBuffer()
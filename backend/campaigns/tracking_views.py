@@ -0,0 +1,45 @@
+"""
+Tracking Endpoints
+Open pixel and click redirect behind the links in campaign emails.
+Plain Django views (no DRF authentication or content negotiation); the
+tracking id is checked in memory, and a genuine hit is buffered and
+recorded later, see tracking.py.
+"""
+from django.http import HttpResponse, HttpResponseNotFound, HttpResponseRedirect
+from django.views.decorators.http import require_GET
+from .tracking import TRANSPARENT_GIF, landing_url, parse_tracking_id, tracking_buffer
+
+NO_CACHE = 'no-store, no-cache, must-revalidate, max-age=0'
+
+
+def client_details(request):
+    """(ip_address, user_agent) of the hit, behind a proxy if there is one"""
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    ip_address = forwarded.split(',')[0].strip() if forwarded else request.META.get('REMOTE_ADDR')
+    return ip_address or None, request.META.get('HTTP_USER_AGENT', '')[:500]
+
+
+@require_GET
+def track_open(request, tracking_id):
+    """Serve the 1x1 pixel and record an open"""
+    target_ref = parse_tracking_id(tracking_id)
+    if target_ref is None:
+        return HttpResponseNotFound()
+    tracking_buffer.add('open', target_ref, *client_details(request))
+
+    response = HttpResponse(TRANSPARENT_GIF, content_type='image/gif')
+    response['Cache-Control'] = NO_CACHE
+    return response
+
+
+@require_GET
+def track_click(request, tracking_id):
+    """Redirect to the awareness landing page and record a click"""
+    target_ref = parse_tracking_id(tracking_id)
+    if target_ref is None:
+        return HttpResponseNotFound()
+    tracking_buffer.add('click', target_ref, *client_details(request))
+
+    response = HttpResponseRedirect(landing_url())
+    response['Cache-Control'] = NO_CACHE
+    return response
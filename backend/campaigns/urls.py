@@ -4,6 +4,7 @@ from . import campaign_domain_api
 from . import simple_domain_test
 from . import campaign_launch_service
 from . import sendgrid_views
+from . import tracking_views
 
 urlpatterns = [
     # Campaign URLs
@@ -26,6 +27,18 @@ urlpatterns = [
     path('<int:campaign_id>/pause/', views.pause_campaign, name='campaign-pause'),
     path('<int:campaign_id>/stop/', views.stop_campaign, name='campaign-stop'),
     path('<int:campaign_id>/live-stats/', views.campaign_live_stats, name='campaign-live-stats'),
+    path('<int:campaign_id>/send-plan/', views.campaign_send_plan, name='campaign-send-plan'),
+    path('<int:campaign_id>/targets/import/', views.import_campaign_targets, name='campaign-target-import'),
+    path('<int:campaign_id>/target-imports/', views.campaign_target_imports, name='campaign-target-imports'),
+    path('send-jobs/<int:job_id>/', views.send_job_status, name='send-job-status'),
+    path('dead-letters/', views.dead_letter_list, name='dead-letter-list'),
+    path('dead-letters/replay/', views.replay_dead_letter_list, name='dead-letter-replay'),
+    path('suppressions/', views.suppression_list, name='suppression-list'),
+    path('suppressions/<int:suppression_id>/', views.delete_suppression, name='suppression-delete'),
+    
+    # Open / click tracking (links and pixel in campaign emails)
+    path('track-open/<str:tracking_id>/', tracking_views.track_open, name='track-open'),
+    path('track-click/<str:tracking_id>/', tracking_views.track_click, name='track-click'),
     
     # Email configuration endpoints
     path('email-configs/', views.get_email_configurations, name='email-configurations'),
@@ -39,6 +52,7 @@ urlpatterns = [
     path('sendgrid/senders/resend/', sendgrid_views.resend_verification, name='sendgrid-resend-verification'),
     path('sendgrid/senders/<int:sender_id>/delete/', sendgrid_views.delete_verified_sender, name='sendgrid-delete-sender'),
     path('sendgrid/status/', sendgrid_views.check_verification_status, name='sendgrid-verification-status'),
+    path('sendgrid/events/', sendgrid_views.sendgrid_event_webhook, name='sendgrid-event-webhook'),
     
     # Domain management endpoints - Simple API
     path('domains/', include('campaigns.simple_domain_urls')),
@@ -1,16 +1,24 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Count, Avg
+from django.db import transaction
+from django.db.models import Count, Avg, Q
+from django.db.models.functions import TruncMinute
 from django.utils import timezone
 from django.conf import settings
-from .models import Campaign, CampaignTarget, CampaignEvent
+from .models import Campaign, CampaignTarget, CampaignEvent, DeadLetter, SendJob, SuppressedEmail, TargetImport
 from .serializers import (
     CampaignSerializer, CampaignCreateSerializer, CampaignListSerializer,
-    CampaignStatsSerializer, CampaignUpdateSerializer
+    CampaignStatsSerializer, CampaignUpdateSerializer, DeadLetterSerializer, SuppressedEmailSerializer,
+    SuppressionCreateSerializer, TargetImportSerializer
 )
 from .email_service import PhishingEmailService
 from .simple_email_service import SimpleSendGridService, test_sendgrid_connection
+from .send_priority import INTERACTIVE
+from .send_queue import cancel_queued_jobs, enqueue_campaign_send, replay_dead_letters
+from .send_control import HALT_STATUSES
+from .suppression import suppress
+from .target_import import UPLOAD_PARSERS, iter_upload_rows, run_target_import
 # Commenting out problematic import for now
 # from .sendgrid_service import SendGridPhishingService, verify_sendgrid_setup
 
@@ -73,72 +81,238 @@ def campaign_stats(request):
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def start_campaign(request, campaign_id):
-    """Start a campaign and send phishing emails"""
+    """
+    Start a campaign and queue its phishing emails for the send worker
+    Starting a paused campaign resumes it: only targets still pending are sent
+    """
     try:
         campaign = Campaign.objects.get(id=campaign_id, created_by=request.user)
         
         if campaign.status == 'active':
             return Response({'error': 'Campaign is already active'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Update campaign status
-        campaign.status = 'active'
-        campaign.actual_start = timezone.now()
-        campaign.save()
+        if not CampaignTarget.objects.filter(campaign=campaign).exists():
+            return Response({'error': 'No targets found for this campaign'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Initialize simplified email service for now
-        try:
-            email_service = SimpleSendGridService(campaign)
-            use_sendgrid = True
-        except Exception:
-            email_service = PhishingEmailService(campaign)
-            use_sendgrid = False
+        if campaign.send_jobs.filter(status__in=['queued', 'running']).exists():
+            return Response({'error': 'Campaign already has a send in progress'}, status=status.HTTP_409_CONFLICT)
         
-        # Get campaign targets
-        targets = CampaignTarget.objects.filter(campaign=campaign)
-        target_emails = [target.email for target in targets]
+        resuming = campaign.status == 'paused'
         
-        if target_emails:
-            # Prepare template data
-            template_data = {
-                'subject': campaign.template.email_subject,
-                'html_content': campaign.template.html_content,
-                'sender_name': campaign.template.sender_name or 'IT Security Team',
-                'sender_email': campaign.template.sender_email or 'security@company.com',
-                'target_domain': getattr(campaign.template, 'domain', 'company.com'),
-                'use_spoofing': True
-            }
-            
-            # Send campaign emails using appropriate service
-            if use_sendgrid:
-                email_results = email_service.send_campaign_emails(target_emails, template_data)
-            else:
-                email_results = email_service.send_campaign_emails(target_emails, template_data)
-            
-            # Update campaign stats
-            campaign.emails_sent = email_results['sent']
-            campaign.target_count = len(target_emails)
+        # Update campaign status and queue the send together
+        with transaction.atomic():
+            campaign.status = 'active'
+            if not resuming or not campaign.actual_start:
+                campaign.actual_start = timezone.now()
             campaign.save()
             
-            return Response({
-                'message': 'Campaign started successfully',
-                'campaign': {
-                    'id': campaign.id,
-                    'status': campaign.status,
-                    'actual_start': campaign.actual_start.isoformat(),
-                    'emails_sent': email_results['sent'],
-                    'emails_failed': email_results['failed'],
-                    'total_targets': email_results['total']
-                }
-            }, status=status.HTTP_200_OK)
-        else:
-            return Response({'error': 'No targets found for this campaign'}, status=status.HTTP_400_BAD_REQUEST)
+            job = enqueue_campaign_send(campaign, user=request.user)
+        
+        return Response({
+            'message': 'Campaign resumed, remaining emails queued for sending' if resuming else 'Campaign started, emails queued for sending',
+            'job_id': job.id,
+            'campaign': {
+                'id': campaign.id,
+                'status': campaign.status,
+                'actual_start': campaign.actual_start.isoformat(),
+                'total_targets': job.total_count,
+                'first_send_at': job.run_after.isoformat() if job.run_after else None
+            }
+        }, status=status.HTTP_202_ACCEPTED)
         
     except Campaign.DoesNotExist:
         return Response({'error': 'Campaign not found'}, status=status.HTTP_404_NOT_FOUND)
+    except ValueError as e:
+        # Send window could not be planned (e.g. sending domain has no rate budget)
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': f'Failed to start campaign: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def send_job_status(request, job_id):
+    """Get progress of a queued campaign send"""
+    jobs = SendJob.objects.all()
+    if not (request.user.is_staff or is_platform_admin(request.user)):
+        # Jobs without an owner (started by the scheduler) are visible to staff only
+        jobs = jobs.filter(created_by=request.user)
+    try:
+        job = jobs.get(id=job_id)
+    except SendJob.DoesNotExist:
+        return Response({'error': 'Send job not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({
+        'id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'campaign_id': job.campaign_id,
+        'total_count': job.total_count,
+        'sent_count': job.sent_count,
+        'failed_count': job.failed_count,
+        'processed_count': job.processed_count,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'run_after': job.run_after.isoformat() if job.run_after else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }, status=status.HTTP_200_OK)
+
+
+def parse_limit(params, default=100, maximum=1000):
+    """?limit= for list views, clamped to 0..maximum; None when it is not a number"""
+    try:
+        return max(0, min(int(params.get('limit', default)), maximum))
+    except (TypeError, ValueError):
+        return None
+
+
+def filter_dead_letters(user, params):
+    """The user's dead letters, narrowed by ids / campaign_id / status / retryable"""
+    letters = DeadLetter.objects.filter(Q(campaign__created_by=user) | Q(job__created_by=user))
+    if params.get('ids'):
+        letters = letters.filter(id__in=params['ids'])
+    if params.get('campaign_id'):
+        letters = letters.filter(campaign_id=params['campaign_id'])
+    if params.get('status'):
+        letters = letters.filter(status=params['status'])
+    if params.get('retryable') is not None:
+        letters = letters.filter(retryable=str(params['retryable']).lower() in ('1', 'true'))
+    return letters
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def dead_letter_list(request):
+    """List failed sends (pending replay by default)"""
+    params = {
+        'campaign_id': request.query_params.get('campaign_id'),
+        'status': request.query_params.get('status', 'pending'),
+        'retryable': request.query_params.get('retryable'),
+    }
+    letters = filter_dead_letters(request.user, params)
+    limit = parse_limit(request.query_params)
+    if limit is None:
+        return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'count': letters.count(),
+        'results': DeadLetterSerializer(letters[:limit], many=True).data,
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def replay_dead_letter_list(request):
+    """
+    Queue pending dead letters for sending again
+    Body: {"ids": [...]}, {"campaign_id": N} and/or {"retryable": true}, or {"all": true}
+    """
+    params = {key: request.data.get(key) for key in ('ids', 'campaign_id', 'retryable')}
+    if not any(value is not None for value in params.values()) and not request.data.get('all'):
+        return Response(
+            {'error': 'Specify ids, campaign_id or retryable, or all=true to replay everything'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    letters = filter_dead_letters(request.user, dict(params, status='pending'))
+    if letters.filter(campaign__status__in=HALT_STATUSES).exists() and not letters.exclude(
+        campaign__status__in=HALT_STATUSES
+    ).exists():
+        return Response(
+            {'error': 'The campaign is not active; resume it before replaying its dead letters'},
+            status=status.HTTP_409_CONFLICT
+        )
+    replayed, skipped, jobs = replay_dead_letters(letters, user=request.user)
+
+    return Response({
+        'message': f'{replayed} dead letter(s) queued for sending',
+        'replayed': replayed,
+        'skipped': skipped,
+        'job_ids': [job.id for job in jobs],
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+def is_platform_admin(user):
+    return user.is_superuser or user.is_super_admin
+
+
+def can_add_suppressions(user):
+    """The suppression list is checked by every organization's sends, so only staff add to it"""
+    return user.is_staff or is_platform_admin(user)
+
+
+def visible_suppressions(user):
+    """
+    Suppressions the user may see: super admins see all, others those added
+    by someone in their organization (or by themselves). Entries recorded
+    from SendGrid events have no creator and are visible to super admins only.
+    """
+    if is_platform_admin(user):
+        return SuppressedEmail.objects.all()
+    if user.organization_id:
+        return SuppressedEmail.objects.filter(created_by__organization_id=user.organization_id)
+    return SuppressedEmail.objects.filter(created_by=user)
+
+
+def can_lift_suppression(user, entry):
+    """Super admins may lift any entry; organization admins their organization's exclusions"""
+    if is_platform_admin(user):
+        return True
+    return user.is_org_admin and entry.reason not in SuppressedEmail.PROTECTED_REASONS
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def suppression_list(request):
+    """
+    GET: list suppressed addresses visible to the user (?search=, ?reason=)
+    POST: suppress addresses (staff only); body {"emails": [...], "reason": "...", "note": "..."}
+    """
+    if request.method == 'POST':
+        if not can_add_suppressions(request.user):
+            return Response(
+                {'error': 'You do not have permission to suppress addresses'}, status=status.HTTP_403_FORBIDDEN
+            )
+        serializer = SuppressionCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        submitted = suppress(created_by=request.user, **serializer.validated_data)
+        return Response({
+            'message': f'{submitted} address(es) suppressed',
+            'submitted': submitted,
+        }, status=status.HTTP_201_CREATED)
+
+    entries = visible_suppressions(request.user)
+    if request.query_params.get('search'):
+        entries = entries.filter(email__icontains=request.query_params['search'].strip())
+    if request.query_params.get('reason'):
+        entries = entries.filter(reason=request.query_params['reason'])
+    limit = parse_limit(request.query_params)
+    if limit is None:
+        return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'count': entries.count(),
+        'results': SuppressedEmailSerializer(entries[:limit], many=True).data,
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['DELETE'])
+@permission_classes([permissions.IsAuthenticated])
+def delete_suppression(request, suppression_id):
+    """Let an address be mailed again (admins only; opt-outs and bounces need a super admin)"""
+    entry = visible_suppressions(request.user).filter(id=suppression_id).first()
+    if entry is None:
+        return Response({'error': 'Suppressed address not found'}, status=status.HTTP_404_NOT_FOUND)
+    if not can_lift_suppression(request.user, entry):
+        return Response(
+            {'error': 'You do not have permission to lift this suppression'}, status=status.HTTP_403_FORBIDDEN
+        )
+    entry.delete()
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_email_configurations(request):
@@ -244,7 +418,8 @@ def send_test_email(request):
             recipient_email=recipient_email,
             subject="HopeSecure Test Email - Configuration Verification",
             html_content=test_content,
-            sender_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'test@hopesecure.com')
+            sender_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'test@hopesecure.com'),
+            priority=INTERACTIVE
         )
         
         if success:
@@ -275,9 +450,11 @@ def pause_campaign(request, campaign_id):
         if campaign.status != 'active':
             return Response({'error': 'Campaign is not active'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Update campaign status
-        campaign.status = 'paused'
-        campaign.save()
+        # Update campaign status; a running send halts within SEND_CONTROL_POLL_SECONDS
+        with transaction.atomic():
+            campaign.status = 'paused'
+            campaign.save()
+            cancel_queued_jobs(campaign)
         
         return Response({
             'message': 'Campaign paused successfully',
@@ -301,10 +478,12 @@ def stop_campaign(request, campaign_id):
         if campaign.status in ['completed', 'stopped']:
             return Response({'error': 'Campaign is already stopped'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Update campaign status
-        campaign.status = 'stopped'
-        campaign.actual_end = timezone.now()
-        campaign.save()
+        # Update campaign status; a running send halts within SEND_CONTROL_POLL_SECONDS
+        with transaction.atomic():
+            campaign.status = 'stopped'
+            campaign.actual_end = timezone.now()
+            campaign.save()
+            cancel_queued_jobs(campaign)
         
         return Response({
             'message': 'Campaign stopped successfully',
@@ -358,3 +537,86 @@ def campaign_live_stats(request, campaign_id):
         
     except Campaign.DoesNotExist:
         return Response({'error': 'Campaign not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def campaign_send_plan(request, campaign_id):
+    """Get a send-window campaign's per-minute send plan for its pending targets"""
+    try:
+        campaign = Campaign.objects.get(id=campaign_id, created_by=request.user)
+    except Campaign.DoesNotExist:
+        return Response({'error': 'Campaign not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    minutes = CampaignTarget.objects.filter(
+        campaign=campaign, status='pending', scheduled_send_at__isnull=False
+    ).annotate(minute=TruncMinute('scheduled_send_at')).values('minute').annotate(
+        count=Count('id')
+    ).order_by('minute')
+    plan = [{'minute': row['minute'].isoformat(), 'count': row['count']} for row in minutes]
+    
+    return Response({
+        'campaign_id': campaign.id,
+        'send_window_enabled': campaign.send_window_enabled,
+        'send_window_start': campaign.send_window_start.strftime('%H:%M'),
+        'send_window_end': campaign.send_window_end.strftime('%H:%M'),
+        'send_window_weekdays_only': campaign.send_window_weekdays_only,
+        'planned_targets': sum(row['count'] for row in plan),
+        'busiest_minute': max((row['count'] for row in plan), default=0),
+        'plan': plan,
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def import_campaign_targets(request, campaign_id):
+    """
+    Bulk-add targets from a CSV or NDJSON upload, read a chunk at a time.
+    Send the file as multipart field 'file', or as the raw request body with a
+    text/csv or application/x-ndjson Content-Type (?format= overrides either).
+    """
+    try:
+        campaign = Campaign.objects.get(id=campaign_id, created_by=request.user)
+    except Campaign.DoesNotExist:
+        return Response({'error': 'Campaign not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if campaign.send_jobs.filter(status='running').exists():
+        return Response({'error': 'Campaign is sending; add targets after the send finishes'}, status=status.HTTP_409_CONFLICT)
+    
+    content_type = request.content_type or ''
+    source_format = request.query_params.get('format')
+    if content_type.startswith('multipart/form-data'):
+        stream = request.FILES.get('file')
+        if stream and not source_format:
+            source_format = 'ndjson' if stream.name.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+    else:
+        # Raw body: read straight from the request stream, never buffered whole
+        stream = request.stream
+        if not source_format:
+            source_format = 'ndjson' if 'ndjson' in content_type else 'csv' if 'csv' in content_type else None
+    
+    if stream is None:
+        return Response({'error': 'No targets uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+    if source_format not in UPLOAD_PARSERS:
+        return Response({'error': 'Upload must be CSV or NDJSON'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    target_import = TargetImport.objects.create(
+        campaign=campaign, created_by=request.user, source_format=source_format
+    )
+    run_target_import(target_import, iter_upload_rows(stream, source_format))
+    
+    response_status = status.HTTP_201_CREATED if target_import.status == 'completed' else status.HTTP_400_BAD_REQUEST
+    return Response(TargetImportSerializer(target_import).data, status=response_status)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def campaign_target_imports(request, campaign_id):
+    """Progress of a campaign's target uploads, newest first (poll while an upload runs)"""
+    try:
+        campaign = Campaign.objects.get(id=campaign_id, created_by=request.user)
+    except Campaign.DoesNotExist:
+        return Response({'error': 'Campaign not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    imports = campaign.target_imports.all()[:20]
+    return Response(TargetImportSerializer(imports, many=True).data, status=status.HTTP_200_OK)
@@ -6,7 +6,6 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-import sendgrid
 from sendgrid.helpers.mail import Mail
 
 from .models import EmailAccount, EmailAlias, IncomingEmail, SentEmail
@@ -16,6 +15,9 @@ from .serializers import (
     SendEmailSerializer
 )
 from campaigns.domain_models import EmailDomain
+from campaigns.rate_limiter import rate_limiter, sender_domain
+from campaigns.send_priority import INTERACTIVE
+from campaigns.sendgrid_client import get_sendgrid_client
 
 
 class EmailAccountViewSet(viewsets.ModelViewSet):
@@ -39,8 +41,9 @@ class EmailAccountViewSet(viewsets.ModelViewSet):
         account = self.get_object()
         
         try:
-            from django.conf import settings
-            sg = sendgrid.SendGridAPIClient(api_key=settings.PHISHING_EMAIL_SETTINGS['SENDGRID_API_KEY'])
+            # Interactive lane: reserved rate budget and connections, so the
+            # test never waits behind a campaign sending from the same domain
+            sg = get_sendgrid_client(priority=INTERACTIVE)
             
             message = Mail(
                 from_email=account.email_address,
@@ -56,6 +59,12 @@ class EmailAccountViewSet(viewsets.ModelViewSet):
                 '''
             )
             
+            if not rate_limiter.acquire(sender_domain(account.email_address), priority=INTERACTIVE):
+                return Response({
+                    'success': False,
+                    'message': f'Sending limit reached for {account.domain.name}, try again shortly'
+                }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            
             response = sg.send(message)
             
             if response.status_code == 202:
@@ -121,8 +130,7 @@ class SendEmailView(viewsets.ViewSet):
                 html_content = serializer.validated_data.get('html_content', '')
                 
                 # Send via SendGrid
-                from django.conf import settings
-                sg = sendgrid.SendGridAPIClient(api_key=settings.PHISHING_EMAIL_SETTINGS['SENDGRID_API_KEY'])
+                sg = get_sendgrid_client()
                 
                 # Create email message
                 message = Mail(
@@ -217,12 +217,71 @@ SERVER_EMAIL = DEFAULT_FROM_EMAIL
 PHISHING_EMAIL_SETTINGS = {
     'ENABLE_DOMAIN_SPOOFING': True,
     'MAX_EMAILS_PER_CAMPAIGN': 1000,
-    'EMAIL_DELAY_SECONDS': 2,  # Delay between emails
     'TRACK_EMAIL_OPENS': True,
     'TRACK_LINK_CLICKS': True,
     'DEFAULT_SENDER_NAME': 'IT Security Team',
     'DEFAULT_SENDER_DOMAIN': 'security-alerts.com',
     'SENDGRID_API_KEY': os.getenv('SENDGRID_API_KEY', ''),
+    'SENDGRID_API_HOST': os.getenv('SENDGRID_API_HOST', 'https://api.sendgrid.com'),
+    'SENDGRID_POOL_SIZE': 10,  # Keep-alive connections in the shared SendGrid client
+    'SENDGRID_INTERACTIVE_POOL_SIZE': 2,  # Separate connections kept for test emails
+    'SENDGRID_CONNECT_TIMEOUT': 5,  # Seconds
+    'SENDGRID_READ_TIMEOUT': 30,  # Seconds
     'SENDGRID_TEMPLATE_ID': os.getenv('SENDGRID_TEMPLATE_ID', ''),
     'WEBHOOK_URL': os.getenv('SENDGRID_WEBHOOK_URL', ''),
+    # Signed Event Webhook (POST /api/campaigns/sendgrid/events/); requests are rejected until the key is set
+    'SENDGRID_WEBHOOK_VERIFICATION_KEY': os.getenv('SENDGRID_WEBHOOK_VERIFICATION_KEY', ''),
+    'SENDGRID_WEBHOOK_MAX_AGE_SECONDS': 600,  # Oldest signature timestamp accepted (replay window)
+    # Open / click tracking endpoints; hits are buffered in memory and written in batches
+    'TRACKING_CLICK_REDIRECT_URL': os.getenv('TRACKING_CLICK_REDIRECT_URL', 'http://localhost:5173/'),
+    'TRACKING_SIGNING_KEY': os.getenv('TRACKING_SIGNING_KEY') or None,  # HMAC key for tracking tokens; SECRET_KEY when unset
+    'TRACKING_FLUSH_SECONDS': 1.0,
+    'TRACKING_FLUSH_BATCH': 500,  # Hits per transaction; a full batch is written right away
+    'TRACKING_MAX_PENDING': 100000,  # Hits held per process before new ones are dropped
+    # Background send worker (python manage.py run_send_worker)
+    'SEND_WORKER_POLL_SECONDS': 2,  # Idle wait between queue polls
+    'SEND_PROGRESS_FLUSH_EVERY': 25,  # Checkpoint target status and job progress every N emails
+    'SEND_PROGRESS_FLUSH_SECONDS': 5,  # ...or at least this often
+    'SEND_JOB_STALE_SECONDS': 900,  # Requeue running jobs with no checkpoint for this long
+    'SEND_JOB_MAX_ATTEMPTS': 3,  # Then fail them instead
+    'SEND_CONTROL_POLL_SECONDS': 0.5,  # How often a running campaign send checks for pause/stop
+    # Campaign scheduler (python manage.py run_scheduler)
+    'SCHEDULER_BATCH_SIZE': 100,  # Campaigns started/completed per pass
+    'SCHEDULER_MAX_SLEEP_SECONDS': 30,  # Longest wait before checking for newly scheduled campaigns
+    # Send windows (Campaign.send_window_*): per-minute plan capped by the domain's hourly rate / 60
+    'SEND_WINDOW_MAX_PER_MINUTE': 600,  # Upper bound on any single minute of a send plan
+    # Per-domain send rate limiting (EmailDomain.rate_limit_per_hour / max_emails_per_day)
+    'DEFAULT_RATE_LIMIT_PER_HOUR': 7200,  # Domains without an EmailDomain row
+    'DEFAULT_MAX_EMAILS_PER_DAY': 50000,
+    'RATE_LIMIT_BURST_SECONDS': 60,  # Bucket capacity, in seconds of refill
+    'RATE_LIMIT_MAX_WAIT_SECONDS': 300,  # Give up on a send rather than wait longer
+    'RATE_LIMIT_INTERACTIVE_MAX_WAIT_SECONDS': 5,  # Same, for test emails a user is waiting on
+    # Share of each domain's burst budget held back for a priority class;
+    # lower classes (campaign, then bulk) cannot spend it
+    'SEND_PRIORITY_RESERVED_SHARES': {'interactive': 0.1, 'campaign': 0.3},
+    'RATE_LIMIT_CACHE_SECONDS': 60,  # How long domain limits are cached per process
+    'ATTACHMENT_CACHE_MAX_BYTES': 64 * 1024 * 1024,  # Encoded template attachments kept per process
+    'ATTACHMENT_CACHE_MAX_ENTRIES': 64,
+    'DOMAIN_ROUTING_CACHE_SECONDS': 300,  # Verified-domain routing table lifetime; saves in this process invalidate it at once
+    # Pooled SMTP sessions for PhishingEmailService
+    'SMTP_POOL_MAX_PER_HOST': 5,  # Concurrent sessions per SMTP host
+    'SMTP_POOL_MAX_IDLE_SECONDS': 120,  # Close sessions idle longer than this
+    'SMTP_POOL_ACQUIRE_TIMEOUT': 30,  # Wait this long for a free session
+    # Concurrent send engine (campaigns/send_engine.py)
+    'SEND_CONCURRENCY_PER_PROVIDER': {
+        'sendgrid': 10,  # Keep at or below SENDGRID_POOL_SIZE
+        'smtp': 5,  # Keep at or below SMTP_POOL_MAX_PER_HOST
+    },
+    'SEND_CONCURRENCY_PER_DOMAIN': 10,  # In-flight sends per sending domain
+    # Retries for 429 / 5xx / SMTP 4xx / connection errors (campaigns/retry_policy.py)
+    'SEND_RETRY_MAX_ATTEMPTS': 4,  # Attempts per recipient before it goes to the dead-letter table
+    'SEND_RETRY_BASE_DELAY_SECONDS': 1,  # Backoff is random(0, base * 2^attempt), capped below
+    'SEND_RETRY_MAX_DELAY_SECONDS': 60,  # Longer Retry-After hints are dead-lettered for replay instead
+    'MERGE_FIELD_CHUNK_SIZE': 500,  # Recipients per merge-field lookup (campaigns/personalization.py)
+    'TARGET_IMPORT_BATCH_SIZE': 1000,  # Targets validated and inserted per transaction (campaigns/target_import.py)
+    # Suppression list (campaigns/suppression.py): per-process Bloom filter over SuppressedEmail
+    'SUPPRESSION_BLOOM_ERROR_RATE': 0.001,  # False-positive rate; hits are confirmed against the database
+    'SUPPRESSION_REFRESH_SECONDS': 5,  # Pick up addresses suppressed by other processes this often
+    'SUPPRESSION_REFRESH_OVERLAP_SECONDS': 300,  # Each refresh re-reads this much history to catch rows committed late
+    'SUPPRESSION_REBUILD_SECONDS': 3600,  # Full rebuild, which also drops deleted addresses
 }
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('templates', '0003_template_organization'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='templateattachment',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
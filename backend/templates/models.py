@@ -78,6 +78,7 @@ class TemplateAttachment(models.Model):
     filename = models.CharField(max_length=200)
     file_type = models.CharField(max_length=50)
     file_size = models.IntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)  # Filled on first send; keys the encoded payload cache
     is_malicious_simulation = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
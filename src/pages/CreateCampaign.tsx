@@ -14,12 +14,59 @@ import { getActiveTemplates, getUserCreatedTemplates, Template } from "@/data/te
 import { apiClient } from "@/lib/api";
 import EmailSelector from "@/components/EmailSelector";
 
+interface LaunchSummary {
+  campaign_name: string;
+  successful_sends: number;
+  failed_sends: number;
+  total_targets: number;
+  success_rate: number;
+}
+
+// Reads the launch endpoint's NDJSON stream (one JSON event per line) and resolves with the final summary
+const readLaunchStream = async (
+  body: ReadableStream<Uint8Array>,
+  onProgress: (processed: number, total: number) => void
+): Promise<LaunchSummary> => {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = '';
+  let summary: LaunchSummary | null = null;
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+    const lines = buffered.split('\n');
+    buffered = lines.pop() ?? '';
+
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const event = JSON.parse(line);
+      if (event.event === 'start') {
+        onProgress(0, event.total_targets);
+      } else if (event.event === 'result') {
+        onProgress(event.processed, event.total);
+      } else if (event.event === 'summary') {
+        summary = event;
+      } else if (event.event === 'error') {
+        throw new Error(event.error);
+      }
+    }
+  }
+
+  if (!summary) {
+    throw new Error('Launch ended before every email was sent');
+  }
+  return summary;
+};
+
 const CreateCampaign = () => {
   const navigate = useNavigate();
   const location = useLocation();
   const [selectedTemplate, setSelectedTemplate] = useState<number | null>(null);
   const [campaignType, setCampaignType] = useState("");
   const [isSubmitting, setIsSubmitting] = useState(false);
+  const [launchProgress, setLaunchProgress] = useState<{ processed: number; total: number } | null>(null);
   const [userTemplates, setUserTemplates] = useState<Template[]>([]);
   const [showPreviewDialog, setShowPreviewDialog] = useState(false);
   const [previewTemplate, setPreviewTemplate] = useState<Template | null>(null);
@@ -383,18 +430,21 @@ const CreateCampaign = () => {
           }
         }
 
-        // Launch campaign
-        const launchResponse = await fetch('http://localhost:8000/api/campaigns/launch/', {
+        // Launch campaign; progress is streamed back one line per recipient until the final summary
+        const launchResponse = await fetch('http://localhost:8000/api/campaigns/launch/?stream=ndjson', {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
+            'Accept': 'application/x-ndjson',
           },
           body: JSON.stringify(campaignData)
         });
 
-        if (launchResponse.ok) {
-          const launchResult = await launchResponse.json();
-          const results = launchResult.results;
+        if (launchResponse.ok && launchResponse.body) {
+          const results = await readLaunchStream(
+            launchResponse.body,
+            (processed, total) => setLaunchProgress({ processed, total })
+          );
           
           alert(`🚀 Campaign launched successfully!\\n\\n` +
                 `📊 Results:\\n` +
@@ -402,12 +452,12 @@ const CreateCampaign = () => {
                 `• Successful sends: ${results.successful_sends}\\n` +
                 `• Failed sends: ${results.failed_sends}\\n` +
                 `• Success rate: ${results.success_rate}%\\n\\n` +
-                `📧 Sender: ${results.sender_email}\\n` +
-                `${results.domain_info ? `🌐 Domain: ${results.domain_info.name}` : ''}`);
+                `📧 Sender: ${senderEmail}`);
           
           navigate('/dashboard');
         } else {
-          throw new Error(`Campaign launch failed: ${launchResponse.status}`);
+          const failure = await launchResponse.json().catch(() => null);
+          throw new Error(failure?.error || `Campaign launch failed: ${launchResponse.status}`);
         }
       } else {
         // Save as draft (fallback to localStorage)
@@ -427,6 +477,7 @@ const CreateCampaign = () => {
       alert(`❌ Campaign failed: ${error.message || 'Unknown error occurred'}`);
     } finally {
       setIsSubmitting(false);
+      setLaunchProgress(null);
     }
   };
 
@@ -816,7 +867,11 @@ const CreateCampaign = () => {
               onClick={() => handleSubmit(false)}
               disabled={isSubmitting || formData.targetEmails.length === 0}
             >
-              {isSubmitting ? '🚀 Launching...' : `🚀 Launch Campaign (${formData.targetEmails.length} targets)`}
+              {isSubmitting
+                ? launchProgress
+                  ? `🚀 Sending ${launchProgress.processed}/${launchProgress.total}...`
+                  : '🚀 Launching...'
+                : `🚀 Launch Campaign (${formData.targetEmails.length} targets)`}
             </Button>
           </div>
         </form>